@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, File, UploadFile, Depends
+from fastapi import APIRouter, HTTPException, File, UploadFile, Depends, Request
 from fastapi.responses import JSONResponse
 import os
 import json
@@ -9,6 +9,9 @@ import pytesseract
 from PIL import Image
 import io
 
+from job_queue import analysis_queue, JobRejected, COMPLETED, TIMED_OUT
+from ai_routes import job_owner
+
 router = APIRouter()
 
 # Mock Perplexity AI integration (replace with actual API when key is provided)
@@ -163,86 +166,76 @@ def extract_text_from_image(file_content: bytes) -> str:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error processing image: {str(e)}")
 
+def analyze_document_content(file_content: bytes, content_type: str) -> dict:
+    """Extract and analyze a document; runs in an analysis worker process"""
+    try:
+        if content_type == 'application/pdf':
+            text_content = extract_text_from_pdf(file_content)
+        else:
+            text_content = extract_text_from_image(file_content)
+    except HTTPException as e:
+        # HTTPException doesn't survive the trip back from the worker process
+        raise ValueError(e.detail)
+
+    if not text_content.strip():
+        raise ValueError("No text could be extracted from the document. Please ensure the document contains readable text.")
+
+    return {
+        "analysis": analyze_with_perplexity(text_content),
+        "extracted_text_length": len(text_content)
+    }
+
 @router.post("/api/ai/analyze-document")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(request: Request, file: UploadFile = File(...)):
     """
     Analyze uploaded document for oil & gas technical specifications
     """
+    # Validate file type
+    allowed_types = ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']
+    if file.content_type not in allowed_types:
+        raise HTTPException(
+            status_code=400, 
+            detail="Invalid file type. Please upload PDF, JPG, or PNG files only."
+        )
+    
+    # Validate file size (10MB limit)
+    file_content = await file.read()
+    if len(file_content) > 10 * 1024 * 1024:
+        raise HTTPException(
+            status_code=400,
+            detail="File size too large. Maximum size is 10MB."
+        )
+    
+    # Extraction and analysis run in the analysis worker pool
     try:
-        # Validate file type
-        allowed_types = ['application/pdf', 'image/jpeg', 'image/png', 'image/jpg']
-        if file.content_type not in allowed_types:
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid file type. Please upload PDF, JPG, or PNG files only."
-            )
-        
-        # Validate file size (10MB limit)
-        file_content = await file.read()
-        if len(file_content) > 10 * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail="File size too large. Maximum size is 10MB."
-            )
-        
-        # Extract text based on file type
-        if file.content_type == 'application/pdf':
-            text_content = extract_text_from_pdf(file_content)
-        else:
-            text_content = extract_text_from_image(file_content)
-        
-        if not text_content.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="No text could be extracted from the document. Please ensure the document contains readable text."
-            )
-        
-        # Analyze with AI (mock implementation)
-        analysis = analyze_with_perplexity(text_content)
-        
-        # Log analysis for monitoring
-        print(f"Document analyzed: {file.filename}")
-        print(f"Analysis confidence: {analysis['confidence_score']}")
-        
-        return JSONResponse(content={
-            "status": "success",
-            "filename": file.filename,
-            "analysis": analysis,
-            "extracted_text_length": len(text_content),
-            "timestamp": "2024-12-01T00:00:00Z"
-        })
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"Analysis error: {str(e)}")
+        job = analysis_queue.submit(job_owner(request), analyze_document_content, file_content, file.content_type)
+    except JobRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    await job.wait()
+    
+    if job.status == TIMED_OUT:
+        raise HTTPException(status_code=504, detail=job.error)
+    if isinstance(job.exception, ValueError):
+        raise HTTPException(status_code=400, detail=job.error)
+    if job.status != COMPLETED:
+        print(f"Analysis error: {job.error}")
         raise HTTPException(
             status_code=500,
             detail="An error occurred during document analysis. Please try again."
         )
-
-@router.get("/api/ai/analysis-history")
-async def get_analysis_history():
-    """Get user's document analysis history"""
-    # Mock data - in real implementation, fetch from database
+    
+    analysis = job.result["analysis"]
+    
+    # Log analysis for monitoring
+    print(f"Document analyzed: {file.filename}")
+    print(f"Analysis confidence: {analysis['confidence_score']}")
+    
     return JSONResponse(content={
         "status": "success",
-        "analyses": [
-            {
-                "id": "1",
-                "filename": "crude_oil_spec.pdf",
-                "product_type": "Light Sweet Crude",
-                "analyzed_at": "2024-11-30T15:30:00Z",
-                "red_flags_count": 0
-            },
-            {
-                "id": "2", 
-                "filename": "gas_certificate.jpg",
-                "product_type": "Natural Gas",
-                "analyzed_at": "2024-11-29T10:15:00Z",
-                "red_flags_count": 1
-            }
-        ]
+        "filename": file.filename,
+        "analysis": analysis,
+        "extracted_text_length": job.result["extracted_text_length"],
+        "timestamp": "2024-12-01T00:00:00Z"
     })
 
 @router.get("/api/ai/supported-formats")
@@ -1,63 +1,271 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
-import PyPDF2
-import io
-import re
-from PIL import Image
+from fastapi import APIRouter, HTTPException, UploadFile, File, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+import asyncio
+import uuid
+from collections import deque
+from typing import List
 import pytesseract
 from datetime import datetime
 import json
+from starlette.concurrency import run_in_threadpool
+
+from auth_config import request_user_id
+from analysis_cache import analysis_cache, analyzer_version
+from batch_analysis import BatchRejected, BatchReport, document_type, read_batch
+from job_queue import analysis_queue, JobRejected, COMPLETED, TIMED_OUT, FINISHED_STATUSES
+import pdf_extraction
+from pdf_extraction import extract_pdf_text
+import ocr_pipeline
+from ocr_pipeline import ocr_image_pages, OCRError
+import rule_engine as rule_engine_module
+from rule_engine import rule_engine
 
 router = APIRouter()
 
+ALLOWED_CONTENT_TYPES = ('application/pdf', 'image/jpeg', 'image/png', 'image/tiff')
+MAX_DOCUMENT_SIZE = 10 * 1024 * 1024
+
+def job_owner(request: Request) -> str:
+    """Who a job counts against for the per-user limit: the signed-in user, else the client address"""
+    user_id = request_user_id(request)
+    if user_id:
+        return f"user:{user_id}"
+    address = request.headers.get("x-real-ip") or (request.client.host if request.client else "unknown")
+    return f"address:{address}"
+
+OCR_UNAVAILABLE_TEXT = "OCR extraction not available - manual text analysis required"
+
+async def analyze_image(run, content, filename):
+    """Analyze a photo or scan, with its pages (e.g. of a multi-page TIFF) OCR'd across the workers"""
+    try:
+        ocr = await ocr_image_pages(run, content)
+    except OCRError:
+        # Analyze a placeholder if OCR fails
+        return await run(perform_ai_analysis, OCR_UNAVAILABLE_TEXT, filename)
+    analysis = await run(perform_ai_analysis, ocr["text"], filename)
+    analysis["pages"] = {"total": ocr["total"], "analyzed": ocr["analyzed"]}
+    analysis["ocr_timings_ms"] = ocr["timings_ms"]
+    return analysis
+
+async def analyze_pdf(run, content, filename):
+    """
+    Analyze a PDF, with its pages extracted in batches across the workers
+
+    Extraction stops once the pages read contain every stop_when_found
+    parameter, or at the page cap; the result says how much was read.
+    """
+    extraction = await extract_pdf_text(run, content)
+    analysis = await run(perform_ai_analysis, extraction["text"], filename)
+    analysis["pages"] = {
+        "total": extraction["total"],
+        "analyzed": extraction["analyzed"],
+        "stopped_early": extraction["stopped_early"],
+        "ocr": extraction["ocr_pages"]
+    }
+    if extraction["ocr_pages"]:
+        analysis["ocr_timings_ms"] = extraction["ocr_timings_ms"]
+    return analysis
+
+def history_summary(analysis):
+    """The fields of an analysis shown in the history list"""
+    return {
+        "product_type": analysis.get("product_classification", {}).get("type"),
+        "overall_score": analysis.get("overall_score"),
+        "red_flags_count": len(analysis.get("red_flags", []))
+    }
+
+def remember_analysis(user_id, filename, content_hash, version):
+    """Job completion callback: cache the result and add it to the user's history"""
+    def on_complete(job):
+        if job.status != COMPLETED:
+            return
+        analysis_cache.put(content_hash, version, job.result)
+        if user_id:
+            analysis_cache.record(user_id, filename, content_hash, version, history_summary(job.result), cached=False)
+    return on_complete
+
+async def submit_document(request: Request, user_id, content, content_type, filename):
+    """Queue a validated document for analysis, unless it was analyzed before; raises JobRejected"""
+    content_hash = await run_in_threadpool(analysis_cache.content_hash, content)
+    version = current_analyzer_version()
+    cached = analysis_cache.get(content_hash, version)
+    if cached is not None:
+        result = {**cached, "filename": filename}
+        if user_id:
+            analysis_cache.record(user_id, filename, content_hash, version, history_summary(result), cached=True)
+        return analysis_queue.complete(job_owner(request), result)
+
+    analyze = analyze_pdf if content_type == 'application/pdf' else analyze_image
+    return analysis_queue.submit(
+        job_owner(request), analyze, content, filename,
+        on_complete=remember_analysis(user_id, filename, content_hash, version)
+    )
+
+async def submit_analysis(request: Request, file: UploadFile):
+    """Validate an uploaded document and queue it for analysis"""
+    # Clients often send scans as application/octet-stream, so the extension decides then
+    content_type = file.content_type if file.content_type in ALLOWED_CONTENT_TYPES else document_type(file.filename or "")
+    if content_type is None:
+        raise HTTPException(status_code=400, detail="Unsupported file type")
+
+    content = await file.read()
+    if len(content) > MAX_DOCUMENT_SIZE:
+        raise HTTPException(status_code=400, detail="File size too large. Maximum size is 10MB.")
+
+    try:
+        return await submit_document(request, request_user_id(request), content, content_type, file.filename)
+    except JobRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+# How long a batch waits before retrying when the queue has no room for its next document
+BATCH_RETRY_SECONDS = 1
+
+def _ndjson(message):
+    return json.dumps(message, default=str) + "\n"
+
+async def stream_batch(request: Request, documents, report: BatchReport):
+    """
+    Queue a batch's documents and yield each result as it completes
+
+    The batch keeps at most the per-user job limit of its documents in the
+    queue at once, so it shares the pool fairly with other users' uploads.
+    """
+    user_id = request_user_id(request)
+    yield _ndjson({"type": "BATCH_STARTED", **report.to_dict()})
+
+    waiting = deque(index for index, document in enumerate(documents) if document.error is None)
+    running = {}
+    try:
+        while waiting or running:
+            while waiting and len(running) < analysis_queue.per_owner_limit:
+                document = documents[waiting[0]]
+                try:
+                    job = await submit_document(
+                        request, user_id, document.content, document.content_type, document.filename
+                    )
+                except JobRejected as e:
+                    if not analysis_queue.is_running:
+                        index = waiting.popleft()
+                        entry = report.finished(index, "failed", error=e.detail)
+                        yield _ndjson({"type": "DOCUMENT_RESULT", "document": entry, "report": report.summary()})
+                        continue
+                    if running:
+                        break
+                    await asyncio.sleep(BATCH_RETRY_SECONDS)
+                    continue
+                index = waiting.popleft()
+                document.content = None
+                report.started(index, job.job_id)
+                running[asyncio.ensure_future(job.wait())] = index
+
+            if not running:
+                continue
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                job = task.result()
+                entry = report.finished(running.pop(task), job.status, job.result, job.error)
+                yield _ndjson({"type": "DOCUMENT_RESULT", "document": entry, "report": report.summary()})
+
+        yield _ndjson({"type": "BATCH_REPORT", **report.to_dict()})
+    finally:
+        # Queued jobs still finish (and are cached) if the client goes away
+        for task in running:
+            task.cancel()
+
 @router.post("/api/ai/analyze-document")
-async def analyze_document(file: UploadFile = File(...)):
+async def analyze_document(request: Request, file: UploadFile = File(...)):
     """AI-powered document analysis for oil & gas documents"""
-    try:
-        # Validate file type
-        if file.content_type not in ['application/pdf', 'image/jpeg', 'image/png']:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
-        
-        # Read file content
-        content = await file.read()
-        
-        # Extract text based on file type
-        if file.content_type == 'application/pdf':
-            text = extract_text_from_pdf(content)
-        else:
-            text = extract_text_from_image(content)
-        
-        # Perform AI analysis
-        analysis_result = perform_ai_analysis(text, file.filename)
-        
-        return JSONResponse(content=analysis_result)
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    job = await submit_analysis(request, file)
+    await job.wait()
 
-def extract_text_from_pdf(content):
-    """Extract text from PDF files"""
+    if job.status == COMPLETED:
+        return JSONResponse(content=job.result)
+    if job.status == TIMED_OUT:
+        raise HTTPException(status_code=504, detail=job.error)
+    raise HTTPException(status_code=500, detail=f"Analysis failed: {job.error}")
+
+@router.post("/api/ai/analysis-jobs", status_code=202)
+async def create_analysis_job(request: Request, file: UploadFile = File(...)):
+    """Queue a document for analysis; poll the job or watch it over a WebSocket"""
+    job = await submit_analysis(request, file)
+    return {
+        **job.to_dict(),
+        "status_url": f"/api/ai/analysis-jobs/{job.job_id}",
+        "websocket_url": f"/api/ai/analysis-jobs/{job.job_id}/ws"
+    }
+
+@router.post("/api/ai/analyze-batch")
+async def analyze_batch(request: Request, files: List[UploadFile] = File(...)):
+    """
+    Analyze several documents, or ZIP archives of documents, as one batch
+
+    Responds with newline-delimited JSON: BATCH_STARTED listing the
+    documents, DOCUMENT_RESULT with the report so far as each analysis
+    completes, and finally BATCH_REPORT with every result and the combined
+    risk score.
+    """
+    uploads = [(file.filename, file.content_type, file.file) for file in files]
     try:
-        pdf_file = io.BytesIO(content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        
-        return text
-    except Exception as e:
-        raise Exception(f"PDF extraction failed: {str(e)}")
+        documents = await run_in_threadpool(read_batch, uploads, MAX_DOCUMENT_SIZE, ALLOWED_CONTENT_TYPES)
+    except BatchRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    report = BatchReport(uuid.uuid4().hex, documents)
+    # Tells nginx to forward each result as it's written instead of buffering the stream
+    return StreamingResponse(stream_batch(request, documents, report), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
+
+@router.get("/api/ai/analysis-history")
+async def get_analysis_history(request: Request, limit: int = 20, skip: int = 0):
+    """The signed-in user's document analyses, most recent first"""
+    user_id = request_user_id(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Sign in to see your analysis history")
+    analyses = analysis_cache.history(user_id, min(max(limit, 1), 100), max(skip, 0))
+    return {"status": "success", "analyses": analyses}
+
+@router.get("/api/ai/analysis-history/{analysis_id}")
+async def get_analysis_history_entry(analysis_id: str, request: Request):
+    """One analysis from the signed-in user's history, with its full result"""
+    user_id = request_user_id(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Sign in to see your analysis history")
+    entry = analysis_cache.history_entry(user_id, analysis_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return entry
+
+@router.get("/api/ai/analysis-jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Status of an analysis job, with its result once completed"""
+    # Job ids are random and only returned to the submitter, so they grant access to the result
+    status = analysis_queue.status(job_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return status
+
+@router.websocket("/api/ai/analysis-jobs/{job_id}/ws")
+async def watch_analysis_job(websocket: WebSocket, job_id: str):
+    """Push an analysis job's status now and its result when it finishes"""
+    await websocket.accept()
+    status = analysis_queue.status(job_id)
+    if not status:
+        await websocket.send_json({"type": "ERROR", "message": "Analysis job not found"})
+        await websocket.close(code=4404)
+        return
 
-def extract_text_from_image(content):
-    """Extract text from image files using OCR"""
     try:
-        image = Image.open(io.BytesIO(content))
-        text = pytesseract.image_to_string(image)
-        return text
-    except Exception as e:
-        # Return placeholder if OCR fails
-        return "OCR extraction not available - manual text analysis required"
+        await websocket.send_json({"type": "JOB_STATUS", **status})
+        if status["status"] not in FINISHED_STATUSES:
+            status = await analysis_queue.wait_status(job_id)
+            if not status:
+                await websocket.send_json({"type": "ERROR", "message": "Analysis job was lost"})
+                await websocket.close(code=4404)
+                return
+            await websocket.send_json({"type": "JOB_STATUS", **status})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
 
 def perform_ai_analysis(text, filename):
     """Perform comprehensive AI analysis of oil & gas documents"""
@@ -75,17 +283,17 @@ def perform_ai_analysis(text, filename):
         "recommendations": []
     }
     
-    # Text preprocessing
-    text_lower = text.lower()
+    # Text preprocessing: every rule keyword is located in one pass
+    scan = rule_engine.scan(text.lower())
     
     # Product Classification
-    analysis["product_classification"] = classify_product(text_lower)
+    analysis["product_classification"] = classify_product(scan)
     
     # Red Flag Detection
-    analysis["red_flags"] = detect_red_flags(text_lower, filename)
+    analysis["red_flags"] = detect_red_flags(scan, filename)
     
     # Technical Analysis
-    analysis["technical_analysis"] = extract_technical_data(text_lower)
+    analysis["technical_analysis"] = extract_technical_data(scan)
     
     # Market Insights
     analysis["market_insights"] = generate_market_insights(analysis["product_classification"])
@@ -101,178 +309,17 @@ def perform_ai_analysis(text, filename):
     
     return analysis
 
-def classify_product(text):
+def classify_product(scan):
     """Classify oil & gas product type and specifications"""
-    classification = {
-        "type": "Unknown",
-        "api_gravity": None,
-        "sulfur_content": None,
-        "grade": None,
-        "origin": None
-    }
-    
-    # Product type detection
-    if any(term in text for term in ["crude oil", "crude", "petroleum"]):
-        classification["type"] = "Crude Oil"
-        
-        # API Gravity detection
-        api_pattern = r"api\s+gravity[:\s]*(\d+\.?\d*)"
-        api_match = re.search(api_pattern, text)
-        if api_match:
-            api_value = float(api_match.group(1))
-            classification["api_gravity"] = f"{api_value}°"
-            
-            if api_value < 22:
-                classification["grade"] = "Heavy Crude"
-            elif api_value > 31:
-                classification["grade"] = "Light Crude"
-            else:
-                classification["grade"] = "Medium Crude"
-    
-    elif any(term in text for term in ["natural gas", "lng", "lpg"]):
-        classification["type"] = "Natural Gas"
-        if "lng" in text:
-            classification["grade"] = "Liquefied Natural Gas"
-        elif "lpg" in text:
-            classification["grade"] = "Liquefied Petroleum Gas"
-    
-    elif any(term in text for term in ["gasoline", "petrol", "diesel", "jet fuel"]):
-        classification["type"] = "Refined Products"
-        if "gasoline" in text or "petrol" in text:
-            classification["grade"] = "Gasoline"
-        elif "diesel" in text:
-            classification["grade"] = "Diesel"
-        elif "jet fuel" in text:
-            classification["grade"] = "Jet Fuel"
-    
-    # Sulfur content detection
-    sulfur_pattern = r"sulfur[:\s]*(\d+\.?\d*)\s*(?:%|ppm|percent)"
-    sulfur_match = re.search(sulfur_pattern, text)
-    if sulfur_match:
-        sulfur_value = float(sulfur_match.group(1))
-        if "ppm" in text:
-            classification["sulfur_content"] = f"{sulfur_value} ppm"
-        else:
-            classification["sulfur_content"] = f"{sulfur_value}%"
-    
-    # Origin detection
-    origins = ["brent", "wti", "dubai", "urals", "maya", "canadian", "venezuelan", "iranian", "saudi", "kuwait"]
-    for origin in origins:
-        if origin in text:
-            classification["origin"] = origin.title()
-            break
-    
-    return classification
+    return scan.classify_product()
 
-def detect_red_flags(text, filename):
+def detect_red_flags(scan, filename):
     """Detect potential red flags and suspicious elements"""
-    red_flags = []
-    
-    # Price-related red flags
-    if any(term in text for term in ["below market", "special discount", "urgent sale", "distressed"]):
-        red_flags.append({
-            "type": "Pricing Anomaly",
-            "description": "Document mentions below-market pricing or urgent sales terms",
-            "severity": "High"
-        })
-    
-    # Documentation red flags
-    if any(term in text for term in ["draft", "preliminary", "estimated", "approximate"]):
-        red_flags.append({
-            "type": "Incomplete Documentation",
-            "description": "Document appears to be draft or preliminary version",
-            "severity": "Medium"
-        })
-    
-    # Quality concerns
-    if any(term in text for term in ["contaminated", "off-spec", "mixed", "blended"]):
-        red_flags.append({
-            "type": "Quality Concern",
-            "description": "Potential quality issues mentioned in documentation",
-            "severity": "High"
-        })
-    
-    # Geographic red flags (sanctioned regions)
-    sanctioned_regions = ["iran", "venezuela", "north korea", "syria", "myanmar"]
-    for region in sanctioned_regions:
-        if region in text:
-            red_flags.append({
-                "type": "Sanctions Risk",
-                "description": f"Reference to potentially sanctioned region: {region.title()}",
-                "severity": "Critical"
-            })
-    
-    # Financial red flags
-    if any(term in text for term in ["advance payment", "upfront fee", "processing fee", "insurance fee"]):
-        red_flags.append({
-            "type": "Advance Fee Risk",
-            "description": "Document mentions advance payments or upfront fees",
-            "severity": "High"
-        })
-    
-    # Certificate validity
-    if "certificate" in text or "test report" in text:
-        if not any(term in text for term in ["sgs", "intertek", "bureau veritas", "cotecna"]):
-            red_flags.append({
-                "type": "Unverified Certificate",
-                "description": "Certificate not from recognized inspection company",
-                "severity": "Medium"
-            })
-    
-    return red_flags
+    return scan.red_flags()
 
-def extract_technical_data(text):
+def extract_technical_data(scan):
     """Extract technical specifications and parameters"""
-    technical_data = []
-    
-    # Common oil & gas parameters
-    parameters = {
-        "API Gravity": r"api\s+gravity[:\s]*(\d+\.?\d*)",
-        "Sulfur Content": r"sulfur[:\s]*(\d+\.?\d*)\s*(?:%|ppm)",
-        "Viscosity": r"viscosity[:\s]*(\d+\.?\d*)",
-        "Pour Point": r"pour\s+point[:\s]*(-?\d+\.?\d*)",
-        "Flash Point": r"flash\s+point[:\s]*(\d+\.?\d*)",
-        "Water Content": r"water[:\s]*(\d+\.?\d*)\s*(?:%|ppm)",
-        "Sediment": r"sediment[:\s]*(\d+\.?\d*)\s*%"
-    }
-    
-    for param_name, pattern in parameters.items():
-        match = re.search(pattern, text)
-        if match:
-            value = match.group(1)
-            technical_data.append({
-                "parameter": param_name,
-                "value": f"{value} {'°API' if 'API' in param_name else '% or ppm' if 'Content' in param_name else 'units'}",
-                "recommendation": get_parameter_recommendation(param_name, float(value) if value.replace('.', '').replace('-', '').isdigit() else 0)
-            })
-    
-    return technical_data
-
-def get_parameter_recommendation(param_name, value):
-    """Generate recommendations based on technical parameters"""
-    recommendations = {
-        "API Gravity": {
-            "condition": value > 31,
-            "good": "Excellent light crude quality, high market value",
-            "poor": "Heavy crude, may require specialized refining"
-        },
-        "Sulfur Content": {
-            "condition": value < 0.5,
-            "good": "Sweet crude, premium quality",
-            "poor": "Sour crude, requires sulfur removal processing"
-        },
-        "Water Content": {
-            "condition": value < 0.5,
-            "good": "Low water content, good quality",
-            "poor": "High water content, may affect pricing"
-        }
-    }
-    
-    if param_name in recommendations:
-        rec = recommendations[param_name]
-        return rec["good"] if rec["condition"] else rec["poor"]
-    
-    return "Within acceptable industry standards"
+    return scan.technical_data()
 
 def generate_market_insights(classification):
     """Generate market insights based on product classification"""
@@ -385,4 +432,29 @@ def generate_summary(analysis):
     
     summary += "Recommend independent verification and due diligence before proceeding with any transactions."
     
-    return summary
\ No newline at end of file
+    return summary
+
+def _tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return "unavailable"
+
+# Cached results are only reused while the extraction and rules that produced them are unchanged
+ANALYZER_CODE_VERSION = analyzer_version(
+    pdf_extraction,
+    f"pdf pages {pdf_extraction.MAX_PAGES}/{pdf_extraction.BATCH_PAGES}",
+    ocr_pipeline,
+    f"ocr dpi {ocr_pipeline.TARGET_DPI}, pages {ocr_pipeline.MAX_PAGES}, pdf2image {ocr_pipeline.PDF2IMAGE_AVAILABLE}",
+    _tesseract_version(),
+    perform_ai_analysis,
+    rule_engine_module,
+    generate_market_insights,
+    generate_recommendations,
+    calculate_overall_score,
+    generate_summary
+)
+
+def current_analyzer_version():
+    """The analyzer version, including the rules file, which can change at runtime"""
+    return analyzer_version(ANALYZER_CODE_VERSION, rule_engine.digest)
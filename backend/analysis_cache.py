@@ -0,0 +1,139 @@
+"""
+Analysis Cache
+Document analysis results keyed by content hash and analyzer version
+"""
+
+import hashlib
+import inspect
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+# MongoDB connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = MongoClient(MONGO_URL)
+db = client.oil_gas_finder
+
+def analyzer_version(*parts) -> str:
+    """
+    Fingerprint of everything that shapes an analysis result
+
+    Functions, classes and modules contribute their source code and other
+    parts their content, so editing a rule or a rules file yields a new
+    version and results cached under the old one are no longer used.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if callable(part) or inspect.ismodule(part):
+            part = inspect.getsource(part)
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+class AnalysisCache:
+    """
+    Stores each distinct document's analysis once, plus a per-user history
+
+    Results live in results_collection under (analyzer version, content
+    hash), so re-uploads of the same document are answered without running
+    the analysis again, and a new analyzer version starts from an empty
+    cache. Results that haven't been used for a while expire through the
+    TTL index on last_used_at. Every analysis a signed-in user runs,
+    cached or not, is recorded in history_collection.
+    """
+
+    def __init__(self, results_collection, history_collection):
+        self.results_collection = results_collection
+        self.history_collection = history_collection
+
+    @staticmethod
+    def content_hash(content: bytes) -> str:
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def _result_id(content_hash: str, version: str) -> str:
+        return f"{version}:{content_hash}"
+
+    def get(self, content_hash: str, version: str) -> Optional[Dict[str, Any]]:
+        """The cached result for a document, if this analyzer version has produced one"""
+        try:
+            document = self.results_collection.find_one_and_update(
+                {"_id": self._result_id(content_hash, version)},
+                {"$set": {"last_used_at": datetime.utcnow()}},
+                projection={"result": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            logger.error(f"Analysis cache lookup failed: {e}")
+            return None
+        return document["result"] if document else None
+
+    def put(self, content_hash: str, version: str, result: Dict[str, Any]):
+        now = datetime.utcnow()
+        try:
+            self.results_collection.update_one(
+                {"_id": self._result_id(content_hash, version)},
+                {
+                    "$setOnInsert": {
+                        "content_hash": content_hash,
+                        "analyzer_version": version,
+                        "result": result,
+                        "created_at": now
+                    },
+                    "$set": {"last_used_at": now}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Could not cache analysis result: {e}")
+
+    def record(self, user_id: str, filename: str, content_hash: str, version: str,
+               summary: Dict[str, Any], cached: bool):
+        """Add an analysis to the user's history"""
+        try:
+            self.history_collection.insert_one({
+                "analysis_id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "filename": filename,
+                "content_hash": content_hash,
+                "analyzer_version": version,
+                "cached": cached,
+                "analyzed_at": datetime.utcnow(),
+                **summary
+            })
+        except Exception as e:
+            logger.error(f"Could not record analysis history: {e}")
+
+    def history(self, user_id: str, limit: int = 20, skip: int = 0) -> List[Dict[str, Any]]:
+        """The user's analyses, most recent first"""
+        return list(self.history_collection.find(
+            {"user_id": user_id}, {"_id": 0, "user_id": 0}
+        ).sort("analyzed_at", -1).skip(skip).limit(limit))
+
+    def history_entry(self, user_id: str, analysis_id: str) -> Optional[Dict[str, Any]]:
+        """One analysis from the user's history, with its full result while still cached"""
+        entry = self.history_collection.find_one(
+            {"user_id": user_id, "analysis_id": analysis_id}, {"_id": 0, "user_id": 0}
+        )
+        if entry:
+            document = self.results_collection.find_one(
+                {"_id": self._result_id(entry["content_hash"], entry["analyzer_version"])}, {"result": 1}
+            )
+            entry["result"] = document["result"] if document else None
+        return entry
+
+analysis_cache = AnalysisCache(db.document_analyses, db.analysis_history)
+
+__all__ = [
+    'AnalysisCache',
+    'analysis_cache',
+    'analyzer_version'
+]
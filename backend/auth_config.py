@@ -0,0 +1,37 @@
+"""
+Auth Configuration
+The access token signing key and token decoding shared by the API's routers
+"""
+
+import os
+import secrets
+from typing import Any, Dict, Optional
+
+import jwt
+from fastapi import Request
+
+SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_urlsafe(32))
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """The payload of an access token; raises jwt.PyJWTError if it's invalid or expired"""
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def request_user_id(request: Request) -> Optional[str]:
+    """The signed-in user's id, if the request carries a valid token; for routes open to everyone"""
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        try:
+            return decode_access_token(authorization[7:]).get("sub")
+        except jwt.PyJWTError:
+            pass
+    return None
+
+__all__ = [
+    'SECRET_KEY',
+    'ALGORITHM',
+    'ACCESS_TOKEN_EXPIRE_MINUTES',
+    'decode_access_token',
+    'request_user_id'
+]
@@ -0,0 +1,211 @@
+"""
+Batch Analysis
+Reading multi-file and ZIP uploads, and aggregating their analyses into one report
+"""
+
+import os
+import posixpath
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+MAX_BATCH_DOCUMENTS = int(os.environ.get('ANALYSIS_BATCH_MAX_DOCUMENTS', 50))
+MAX_BATCH_BYTES = int(os.environ.get('ANALYSIS_BATCH_MAX_BYTES', 100 * 1024 * 1024))
+
+DOCUMENT_TYPES = {
+    ".pdf": "application/pdf",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    # Multi-page scans; each page is OCR'd separately
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff"
+}
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+# Lower bounds of the combined risk score for each level
+RISK_LEVELS = ((75, "Critical"), (50, "High"), (25, "Medium"), (0, "Low"))
+
+class BatchRejected(Exception):
+    """The upload can't be analyzed as a batch"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+class BatchDocument:
+    """One document of a batch; content is released once it has been queued"""
+
+    def __init__(self, filename: str, content_type: Optional[str] = None,
+                 content: Optional[bytes] = None, error: Optional[str] = None):
+        self.filename = filename
+        self.content_type = content_type
+        self.content = content
+        self.error = error
+
+def document_type(filename: str) -> Optional[str]:
+    return DOCUMENT_TYPES.get(posixpath.splitext(filename.lower())[1])
+
+def is_archive(filename: str, content_type: Optional[str]) -> bool:
+    return content_type in ZIP_CONTENT_TYPES or filename.lower().endswith(".zip")
+
+def _read_limited(stream: BinaryIO, max_size: int) -> Optional[bytes]:
+    """The stream's content, or None if it's larger than max_size"""
+    content = stream.read(max_size + 1)
+    return content if len(content) <= max_size else None
+
+def iter_archive(fileobj: BinaryIO, archive_name: str, max_document_size: int) -> Iterator[BatchDocument]:
+    """
+    Yield the documents in a ZIP archive
+
+    Members are decompressed one at a time straight from the uploaded
+    archive into memory; nothing is extracted to disk. Sizes are checked
+    while decompressing, since the sizes in the archive's directory can't
+    be trusted.
+    """
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except (zipfile.BadZipFile, OSError):
+        raise BatchRejected(f"{archive_name} is not a valid ZIP archive")
+
+    with archive:
+        for info in archive.infolist():
+            name = info.filename
+            if info.is_dir() or name.startswith("__MACOSX/") or posixpath.basename(name).startswith("."):
+                continue
+            filename = f"{archive_name}/{name}"
+            content_type = document_type(name)
+            if content_type is None:
+                yield BatchDocument(filename, error="Unsupported file type")
+            elif info.flag_bits & 0x1:
+                yield BatchDocument(filename, content_type, error="Encrypted archive members are not supported")
+            elif info.file_size > max_document_size:
+                yield BatchDocument(filename, content_type, error="File size too large. Maximum size is 10MB.")
+            else:
+                try:
+                    with archive.open(info) as member:
+                        content = _read_limited(member, max_document_size)
+                except (zipfile.BadZipFile, OSError, NotImplementedError) as e:
+                    yield BatchDocument(filename, content_type, error=f"Could not read from archive: {str(e)}")
+                    continue
+                if content is None:
+                    yield BatchDocument(filename, content_type, error="File size too large. Maximum size is 10MB.")
+                else:
+                    yield BatchDocument(filename, content_type, content)
+
+def read_batch(uploads: List[Tuple[str, Optional[str], BinaryIO]], max_document_size: int,
+               allowed_content_types: Tuple[str, ...]) -> List[BatchDocument]:
+    """
+    The documents in a set of uploaded files, expanding ZIP archives
+
+    uploads are (filename, content_type, file) triples. Documents that
+    can't be analyzed are kept with an error so the report lists them.
+    Raises BatchRejected when the batch exceeds MAX_BATCH_DOCUMENTS or
+    MAX_BATCH_BYTES.
+    """
+    documents: List[BatchDocument] = []
+    total_bytes = 0
+    for filename, content_type, fileobj in uploads:
+        filename = filename or "document"
+        if is_archive(filename, content_type):
+            members = iter_archive(fileobj, filename, max_document_size)
+        else:
+            if content_type not in allowed_content_types:
+                content_type = document_type(filename)
+            if content_type is None:
+                members = iter([BatchDocument(filename, error="Unsupported file type")])
+            else:
+                content = _read_limited(fileobj, max_document_size)
+                error = None if content is not None else "File size too large. Maximum size is 10MB."
+                members = iter([BatchDocument(filename, content_type, content, error)])
+
+        for document in members:
+            documents.append(document)
+            total_bytes += len(document.content or b"")
+            if len(documents) > MAX_BATCH_DOCUMENTS:
+                raise BatchRejected(f"A batch can contain at most {MAX_BATCH_DOCUMENTS} documents", status_code=413)
+            if total_bytes > MAX_BATCH_BYTES:
+                raise BatchRejected(
+                    f"A batch can contain at most {MAX_BATCH_BYTES // (1024 * 1024)}MB of documents", status_code=413
+                )
+    if not any(document.error is None for document in documents):
+        raise BatchRejected("No supported documents to analyze (PDF, JPEG, PNG or TIFF)")
+    return documents
+
+def risk_level(score: int) -> str:
+    for lower_bound, level in RISK_LEVELS:
+        if score >= lower_bound:
+            return level
+    return "Low"
+
+class BatchReport:
+    """
+    Per-document results of a batch and the combined risk, updated as each completes
+
+    A document's risk is 100 minus its overall score. The combined risk
+    score weighs the riskiest document at 60% and the batch average at
+    40%, so one problematic certificate can't be averaged away by a stack
+    of clean ones.
+    """
+
+    def __init__(self, batch_id: str, documents: List[BatchDocument]):
+        self.batch_id = batch_id
+        self.documents: List[Dict[str, Any]] = [
+            {
+                "index": index,
+                "filename": document.filename,
+                "status": "failed" if document.error else "queued",
+                "error": document.error,
+                "result": None
+            }
+            for index, document in enumerate(documents)
+        ]
+
+    def started(self, index: int, job_id: str):
+        self.documents[index].update({"status": "running", "job_id": job_id})
+
+    def finished(self, index: int, status: str, result: Optional[Dict[str, Any]] = None,
+                 error: Optional[str] = None) -> Dict[str, Any]:
+        entry = self.documents[index]
+        entry.update({"status": status, "result": result, "error": error})
+        if result is not None:
+            entry["risk_score"] = 100 - result.get("overall_score", 0)
+        return entry
+
+    def summary(self) -> Dict[str, Any]:
+        risks = [entry["risk_score"] for entry in self.documents if "risk_score" in entry]
+        combined = round(0.6 * max(risks) + 0.4 * sum(risks) / len(risks)) if risks else None
+        severities: Dict[str, int] = {}
+        for entry in self.documents:
+            for flag in (entry["result"] or {}).get("red_flags", []):
+                severities[flag["severity"]] = severities.get(flag["severity"], 0) + 1
+        statuses: Dict[str, int] = {}
+        for entry in self.documents:
+            statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+        return {
+            "batch_id": self.batch_id,
+            "documents": len(self.documents),
+            "statuses": statuses,
+            "combined_risk_score": combined,
+            "risk_level": risk_level(combined) if combined is not None else None,
+            "red_flags_by_severity": severities,
+            "riskiest_document": max(
+                (entry for entry in self.documents if "risk_score" in entry),
+                key=lambda entry: entry["risk_score"], default={}
+            ).get("filename")
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self.summary(), "results": self.documents}
+
+__all__ = [
+    'BatchDocument',
+    'BatchRejected',
+    'BatchReport',
+    'read_batch',
+    'document_type',
+    'iter_archive',
+    'risk_level',
+    'MAX_BATCH_DOCUMENTS',
+    'MAX_BATCH_BYTES'
+]
@@ -0,0 +1,276 @@
+"""
+Cache Value Codecs
+Pluggable serialization and compression for cached values
+"""
+
+import json
+import logging
+import os
+import uuid
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    LZ4_AVAILABLE = False
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+# Payload header: one byte codec id, one byte compression id
+JSON_CODEC_ID = 1
+ORJSON_CODEC_ID = 2
+MSGPACK_CODEC_ID = 3
+
+NO_COMPRESSION = 0
+ZSTD_COMPRESSION = 1
+LZ4_COMPRESSION = 2
+ZLIB_COMPRESSION = 3
+
+def _tag_value(value: Any) -> Dict[str, str]:
+    """Convert a non-JSON type into a tagged object"""
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return {"$oid": str(value)}
+    if isinstance(value, uuid.UUID):
+        return {"$uuid": str(value)}
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not cacheable: {type(value).__name__}")
+
+def _untag_object(obj: Dict[str, Any]) -> Any:
+    """Restore a tagged object, leaving plain dicts untouched"""
+    if len(obj) == 1:
+        tag, raw = next(iter(obj.items()))
+        if tag == "$datetime":
+            return datetime.fromisoformat(raw)
+        if tag == "$date":
+            return date.fromisoformat(raw)
+        if tag == "$oid" and ObjectId is not None:
+            return ObjectId(raw)
+        if tag == "$uuid":
+            return uuid.UUID(raw)
+        if tag == "$decimal":
+            return Decimal(raw)
+    return obj
+
+class JsonCodec:
+    """Standard library JSON with tagged types"""
+
+    codec_id = JSON_CODEC_ID
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=_tag_value, separators=(",", ":")).encode()
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data, object_hook=_untag_object)
+
+class OrjsonCodec:
+    """
+    orjson with tagged types
+
+    Datetimes are passed through to the tagger. orjson always writes UUIDs as
+    plain strings, so they come back as strings; use msgpack for full fidelity.
+    """
+
+    codec_id = ORJSON_CODEC_ID
+    name = "orjson"
+
+    def encode(self, value: Any) -> bytes:
+        return orjson.dumps(
+            value,
+            default=_tag_value,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        )
+
+    def decode(self, data: bytes) -> Any:
+        # orjson has no object hook; tagged payloads go through the stdlib C
+        # scanner with one, which beats walking the orjson result in Python
+        if b'{"$' in data:
+            return json.loads(data, object_hook=_untag_object)
+        return orjson.loads(data)
+
+# msgpack extension type codes
+EXT_DATETIME = 1
+EXT_DATE = 2
+EXT_OBJECT_ID = 3
+EXT_UUID = 4
+EXT_DECIMAL = 5
+
+def _msgpack_default(value: Any):
+    if isinstance(value, datetime):
+        return msgpack.ExtType(EXT_DATETIME, value.isoformat().encode())
+    if isinstance(value, date):
+        return msgpack.ExtType(EXT_DATE, value.isoformat().encode())
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return msgpack.ExtType(EXT_OBJECT_ID, value.binary)
+    if isinstance(value, uuid.UUID):
+        return msgpack.ExtType(EXT_UUID, value.bytes)
+    if isinstance(value, Decimal):
+        return msgpack.ExtType(EXT_DECIMAL, str(value).encode())
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Type is not cacheable: {type(value).__name__}")
+
+def _msgpack_ext_hook(code: int, data: bytes):
+    if code == EXT_DATETIME:
+        return datetime.fromisoformat(data.decode())
+    if code == EXT_DATE:
+        return date.fromisoformat(data.decode())
+    if code == EXT_OBJECT_ID and ObjectId is not None:
+        return ObjectId(data)
+    if code == EXT_UUID:
+        return uuid.UUID(bytes=data)
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+class MsgpackCodec:
+    """msgpack with extension types for datetime, ObjectId, UUID and Decimal"""
+
+    codec_id = MSGPACK_CODEC_ID
+    name = "msgpack"
+
+    def encode(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=_msgpack_default, use_bin_type=True)
+
+    def decode(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=_msgpack_ext_hook, raw=False, strict_map_key=False)
+
+def _available_codecs() -> Dict[str, Any]:
+    codecs = {"json": JsonCodec()}
+    if ORJSON_AVAILABLE:
+        codecs["orjson"] = OrjsonCodec()
+    if MSGPACK_AVAILABLE:
+        codecs["msgpack"] = MsgpackCodec()
+    return codecs
+
+CODECS = _available_codecs()
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+def _compressors() -> Dict[int, Any]:
+    """Compression id -> (compress, decompress)"""
+    compressors = {ZLIB_COMPRESSION: (lambda data: zlib.compress(data, 1), zlib.decompress)}
+    if ZSTD_AVAILABLE:
+        zstd_compressor = zstandard.ZstdCompressor(level=3)
+        zstd_decompressor = zstandard.ZstdDecompressor()
+        compressors[ZSTD_COMPRESSION] = (zstd_compressor.compress, zstd_decompressor.decompress)
+    if LZ4_AVAILABLE:
+        compressors[LZ4_COMPRESSION] = (lz4.frame.compress, lz4.frame.decompress)
+    return compressors
+
+COMPRESSORS = _compressors()
+COMPRESSION_NAMES = {
+    "none": NO_COMPRESSION,
+    "zstd": ZSTD_COMPRESSION,
+    "lz4": LZ4_COMPRESSION,
+    "zlib": ZLIB_COMPRESSION
+}
+
+class CacheSerializer:
+    """
+    Encodes cache values into framed payloads
+
+    Each payload starts with a codec id byte and a compression id byte, so
+    values written with one configuration can still be read after it changes.
+    Payloads without a header are treated as legacy JSON text.
+    """
+
+    def __init__(self, codec: str = "auto", compression: str = "auto", compression_threshold: int = 1024):
+        if codec == "auto":
+            codec = "msgpack" if MSGPACK_AVAILABLE else "orjson" if ORJSON_AVAILABLE else "json"
+        if codec not in CODECS:
+            logger.warning(f"Cache codec {codec} unavailable, using json")
+            codec = "json"
+        self.codec = CODECS[codec]
+
+        if compression == "auto":
+            compression = "zstd" if ZSTD_AVAILABLE else "lz4" if LZ4_AVAILABLE else "none"
+        compression_id = COMPRESSION_NAMES.get(compression, NO_COMPRESSION)
+        if compression_id != NO_COMPRESSION and compression_id not in COMPRESSORS:
+            logger.warning(f"Cache compression {compression} unavailable, storing uncompressed")
+            compression_id = NO_COMPRESSION
+        self.compression_id = compression_id
+        self.compression_threshold = compression_threshold
+
+    def dumps(self, value: Any) -> bytes:
+        data = self.codec.encode(value)
+        compression_id = NO_COMPRESSION
+        if self.compression_id != NO_COMPRESSION and len(data) >= self.compression_threshold:
+            compressed = COMPRESSORS[self.compression_id][0](data)
+            # Keep the compressed form only when it actually saves space
+            if len(compressed) < len(data):
+                data = compressed
+                compression_id = self.compression_id
+        return bytes((self.codec.codec_id, compression_id)) + data
+
+    def loads(self, payload: bytes) -> Any:
+        if isinstance(payload, str):
+            return json.loads(payload)
+
+        codec = CODECS_BY_ID.get(payload[0]) if payload else None
+        if codec is None:
+            # Legacy JSON text written before payloads were framed
+            return json.loads(payload)
+
+        data = payload[2:]
+        if payload[1] != NO_COMPRESSION:
+            data = COMPRESSORS[payload[1]][1](data)
+        return codec.decode(data)
+
+    def describe(self) -> Dict[str, Any]:
+        compression = {v: k for k, v in COMPRESSION_NAMES.items()}[self.compression_id]
+        return {
+            "codec": self.codec.name,
+            "compression": compression,
+            "compression_threshold": self.compression_threshold
+        }
+
+def create_serializer() -> CacheSerializer:
+    """Build the serializer configured through the environment"""
+    return CacheSerializer(
+        codec=os.environ.get('CACHE_CODEC', 'auto'),
+        compression=os.environ.get('CACHE_COMPRESSION', 'auto'),
+        compression_threshold=int(os.environ.get('CACHE_COMPRESSION_THRESHOLD', 1024))
+    )
+
+__all__ = [
+    'CacheSerializer',
+    'JsonCodec',
+    'OrjsonCodec',
+    'MsgpackCodec',
+    'create_serializer',
+    'CODECS'
+]
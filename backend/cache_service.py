@@ -4,31 +4,314 @@ Implements smart caching for frequently accessed data
 """
 
 import redis
+import asyncio
 import json
 import hashlib
 import logging
+import math
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Optional, Dict, List
+from fnmatch import fnmatchcase
+from typing import Any, Callable, Optional, Dict, List
 from functools import wraps
 import os
 
+from cache_codecs import create_serializer
+
 logger = logging.getLogger(__name__)
 
+class MemoryCache:
+    """
+    Bounded in-process cache used when Redis is unavailable
+
+    Entries are evicted least-recently-used once the entry or byte budget is
+    exceeded. Expiry is tracked on a hashed timer wheel that is swept as the
+    clock advances, so expired entries are dropped even if never read again.
+    """
+    
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024,
+                 wheel_slots: int = 512, tick_seconds: float = 1.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.tick_seconds = tick_seconds
+        # key -> [payload, expires_at (monotonic), size, wheel slot]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._wheel: List[set] = [set() for _ in range(wheel_slots)]
+        self._last_tick = self._tick(time.monotonic())
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _tick(self, timestamp: float) -> int:
+        return int(timestamp / self.tick_seconds)
+    
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.size_bytes -= entry[2]
+        self._wheel[entry[3]].discard(key)
+        return True
+    
+    def _sweep(self, now: float):
+        """Expire entries in every wheel slot the clock has passed since the last sweep"""
+        tick = self._tick(now)
+        if tick <= self._last_tick:
+            return
+        
+        slots = len(self._wheel)
+        first_tick = max(self._last_tick + 1, tick - slots + 1)
+        for current in range(first_tick, tick + 1):
+            slot = self._wheel[current % slots]
+            for key in [k for k in slot if self._entries[k][1] <= now]:
+                self._remove(key)
+                self.expirations += 1
+        self._last_tick = tick
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[1] <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def set(self, key: str, payload: str, expiry_seconds: int):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+            self._remove(key)
+            
+            expires_at = now + expiry_seconds
+            # Round up so an entry is never swept before it expires
+            slot = (self._tick(expires_at) + 1) % len(self._wheel)
+            self._entries[key] = [payload, expires_at, size, slot]
+            self._wheel[slot].add(key)
+            self.size_bytes += size
+            
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+    
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._remove(key)
+    
+    def delete_pattern(self, pattern: str) -> int:
+        with self._lock:
+            keys = [k for k in self._entries if fnmatchcase(k, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            for slot in self._wheel:
+                slot.clear()
+            self.size_bytes = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / max(1, lookups)
+        }
+
+class Histogram:
+    """Fixed-bucket histogram; each bucket counts values up to its bound"""
+    
+    def __init__(self, bounds: List[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += value
+        self.count += 1
+    
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound:g}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "buckets": buckets
+        }
+
+class CacheTelemetry:
+    """
+    Per-prefix cache statistics
+    
+    Tracks hits, misses, lookup latency and stored value sizes for every key
+    prefix (market_data, listings, analytics, ...), plus the keys that cost the
+    most time to recompute, to guide TTL and warming decisions.
+    """
+    
+    LATENCY_BUCKETS_MS = [0.1, 0.5, 1, 5, 10, 50, 100, 500]
+    SIZE_BUCKETS_BYTES = [256, 1024, 4096, 16384, 65536, 262144, 1048576]
+    RECOMPUTE_BUCKETS_MS = [1, 10, 50, 100, 500, 1000, 5000]
+    
+    def __init__(self, max_tracked_keys: int = 1000):
+        self.max_tracked_keys = max_tracked_keys
+        self._prefixes: Dict[str, Dict[str, Any]] = {}
+        self._keys: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def _prefix_stats(self, prefix: str) -> Dict[str, Any]:
+        stats = self._prefixes.get(prefix)
+        if stats is None:
+            stats = {
+                "hits": 0,
+                "misses": 0,
+                "latency_ms": Histogram(self.LATENCY_BUCKETS_MS),
+                "value_bytes": Histogram(self.SIZE_BUCKETS_BYTES),
+                "recompute_ms": Histogram(self.RECOMPUTE_BUCKETS_MS)
+            }
+            self._prefixes[prefix] = stats
+        return stats
+    
+    def record_lookup(self, prefix: str, hit: bool, latency_seconds: float):
+        with self._lock:
+            stats = self._prefix_stats(prefix)
+            stats["hits" if hit else "misses"] += 1
+            stats["latency_ms"].observe(latency_seconds * 1000)
+    
+    def record_store(self, prefix: str, size: int):
+        with self._lock:
+            self._prefix_stats(prefix)["value_bytes"].observe(size)
+    
+    def record_recompute(self, prefix: str, key: str, seconds: float):
+        with self._lock:
+            self._prefix_stats(prefix)["recompute_ms"].observe(seconds * 1000)
+            
+            entry = self._keys.get(key)
+            if entry is None:
+                if len(self._keys) >= self.max_tracked_keys:
+                    # Make room by forgetting the cheapest key
+                    cheapest = min(self._keys, key=lambda k: self._keys[k]["total_seconds"])
+                    del self._keys[cheapest]
+                entry = {"prefix": prefix, "recomputes": 0, "total_seconds": 0.0, "last_seconds": 0.0}
+                self._keys[key] = entry
+            entry["recomputes"] += 1
+            entry["total_seconds"] += seconds
+            entry["last_seconds"] = seconds
+    
+    def get_prefix_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                prefix: {
+                    "hits": stats["hits"],
+                    "misses": stats["misses"],
+                    "hit_rate": stats["hits"] / max(1, stats["hits"] + stats["misses"]),
+                    "latency_ms": stats["latency_ms"].to_dict(),
+                    "value_bytes": stats["value_bytes"].to_dict(),
+                    "recompute_ms": stats["recompute_ms"].to_dict()
+                }
+                for prefix, stats in self._prefixes.items()
+            }
+    
+    def get_top_keys(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Keys ordered by total time spent recomputing them"""
+        with self._lock:
+            ranked = sorted(self._keys.items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+            return [
+                {
+                    "key": key,
+                    "prefix": entry["prefix"],
+                    "recomputes": entry["recomputes"],
+                    "total_seconds": round(entry["total_seconds"], 6),
+                    "avg_seconds": round(entry["total_seconds"] / entry["recomputes"], 6),
+                    "last_seconds": round(entry["last_seconds"], 6)
+                }
+                for key, entry in ranked[:limit]
+            ]
+
+cache_telemetry = CacheTelemetry()
+
+# Redis pub/sub channel used to evict L1 entries in every worker
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Max keys per UNLINK call when invalidating a tag
+UNLINK_BATCH_SIZE = 500
+
+# Deletes a lock only if it still holds our token
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
 class CacheService:
     """
     High-performance caching service with Redis backend
+    
+    Each process keeps a small L1 cache in front of Redis (L2). L1 entries live
+    for at most their L1 TTL cap, and every write or delete is broadcast over
+    Redis pub/sub so the other workers drop their L1 copies.
+    
+    Keys are namespaced and versioned ("<namespace>:v<version>:<prefix>:<digest>").
+    Entries can be registered under tags (user:<id>, listings, market:<commodity>)
+    whose index sets make invalidation O(live tagged entries); bumping the version flushes
+    everything at once.
     """
     
+    # Seconds between re-reads of the shared cache version
+    VERSION_REFRESH_SECONDS = 10
+    # Minimum lifetime of an idle tag index (expired members are pruned on every write)
+    TAG_TTL = 86400
+    
     def __init__(self):
+        self.serializer = create_serializer()
         try:
-            self.redis_client = redis.Redis(
+            redis_settings = dict(
                 host=os.environ.get('REDIS_HOST', 'localhost'),
                 port=int(os.environ.get('REDIS_PORT', 6379)),
-                decode_responses=True,
                 socket_connect_timeout=5,
                 socket_timeout=5,
                 retry_on_timeout=True
             )
+            # Text client for keys, tags, locks and pub/sub
+            self.redis_client = redis.Redis(decode_responses=True, **redis_settings)
+            # Binary client for encoded cache values
+            self.binary_client = redis.Redis(decode_responses=False, **redis_settings)
             # Test connection
             self.redis_client.ping()
             self.available = True
@@ -37,48 +320,200 @@ class CacheService:
             self.available = False
             logger.warning(f"❌ Redis cache service unavailable: {e}")
             # Fallback to in-memory cache
-            self._memory_cache = {}
+            self._memory_cache = MemoryCache(
+                max_entries=int(os.environ.get('CACHE_MEMORY_MAX_ENTRIES', 10000)),
+                max_bytes=int(os.environ.get('CACHE_MEMORY_MAX_BYTES', 64 * 1024 * 1024))
+            )
+        
+        # Per-process L1 tier in front of Redis
+        self.l1_cache = MemoryCache(
+            max_entries=int(os.environ.get('CACHE_L1_MAX_ENTRIES', 2000)),
+            max_bytes=int(os.environ.get('CACHE_L1_MAX_BYTES', 16 * 1024 * 1024))
+        )
+        self.l1_default_ttl = int(os.environ.get('CACHE_L1_TTL', 30))
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.instance_id = uuid.uuid4().hex
+        self._pubsub_thread = None
+        
+        # Key namespacing and versioning
+        self.namespace = os.environ.get('CACHE_NAMESPACE', 'ogf')
+        self._version_key = f"{self.namespace}:version"
+        self._version = 1
+        self._version_checked = 0.0
+        # Tag index used in fallback mode: tag -> keys
+        self._memory_tags: Dict[str, set] = {}
+        
+        if self.available:
+            self._start_invalidation_listener()
+    
+    def _start_invalidation_listener(self):
+        """Subscribe to L1 invalidations published by other workers"""
+        try:
+            pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._handle_invalidation})
+            self._pubsub_thread = pubsub.run_in_thread(
+                sleep_time=1.0,
+                daemon=True,
+                exception_handler=self._handle_listener_error
+            )
+        except Exception as e:
+            # L1 entries still expire by their TTL cap
+            logger.warning(f"Cache invalidation listener unavailable: {e}")
+    
+    def _handle_listener_error(self, error, pubsub, thread):
+        logger.error(f"Cache invalidation listener error: {error}")
+        time.sleep(1.0)
+    
+    def _handle_invalidation(self, message: Dict[str, Any]):
+        """Evict L1 entries named in an invalidation message"""
+        try:
+            payload = json.loads(message['data'])
+            if payload.get('origin') == self.instance_id:
+                return
+            for key in payload.get('keys', []):
+                self.l1_cache.delete(key)
+            for pattern in payload.get('patterns', []):
+                self.l1_cache.delete_pattern(pattern)
+            if payload.get('version'):
+                self._version = int(payload['version'])
+                self._version_checked = time.monotonic()
+                self.l1_cache.clear()
+        except Exception as e:
+            logger.error(f"Invalid cache invalidation message: {e}")
+    
+    def _publish_invalidation(self, keys: List[str] = None, patterns: List[str] = None, version: int = None):
+        """Tell other workers to drop their L1 copies"""
+        try:
+            self.redis_client.publish(INVALIDATION_CHANNEL, json.dumps({
+                'origin': self.instance_id,
+                'keys': keys or [],
+                'patterns': patterns or [],
+                'version': version
+            }))
+        except Exception as e:
+            logger.error(f"Cache invalidation publish error: {e}")
+    
+    def _get_version(self) -> int:
+        """Get the current cache version, re-reading it from Redis periodically"""
+        if self.available and time.monotonic() - self._version_checked > self.VERSION_REFRESH_SECONDS:
+            try:
+                self._version = int(self.redis_client.get(self._version_key) or 1)
+                self._version_checked = time.monotonic()
+            except Exception as e:
+                logger.error(f"Cache version read error: {e}")
+        return self._version
+    
+    def _namespaced(self, name: str) -> str:
+        return f"{self.namespace}:v{self._get_version()}:{name}"
+    
+    def _tag_key(self, tag: str) -> str:
+        # A sorted set of keys scored by expiry time; named apart from the plain
+        # sets older code wrote under "tag:" so those are never read as the wrong type
+        return self._namespaced(f"tagidx:{tag}")
+    
+    def key_prefix(self, key: str) -> str:
+        """Get the prefix (e.g. "listings") of a namespaced key"""
+        parts = key.split(":", 3)
+        if len(parts) == 4 and parts[0] == self.namespace:
+            return parts[2]
+        return "other"
     
     def _generate_cache_key(self, prefix: str, *args, **kwargs) -> str:
-        """Generate a unique cache key from function arguments"""
-        key_data = f"{prefix}:{str(args)}:{str(sorted(kwargs.items()))}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        """Generate a unique, readable cache key from function arguments"""
+        key_data = f"{str(args)}:{str(sorted(kwargs.items()))}"
+        return self._namespaced(f"{prefix}:{hashlib.md5(key_data.encode()).hexdigest()}")
+    
+    def get(self, key: str, l1_ttl: Optional[int] = None) -> Optional[Any]:
+        """
+        Get value from cache
+        
+        Args:
+            key: Cache key
+            l1_ttl: Max seconds to keep the value in this process's L1 cache (0 disables L1)
+        """
+        started = time.perf_counter()
+        value = self._get(key, l1_ttl)
+        cache_telemetry.record_lookup(self.key_prefix(key), value is not None, time.perf_counter() - started)
+        return value
     
-    def get(self, key: str) -> Optional[Any]:
-        """Get value from cache"""
+    def _get(self, key: str, l1_ttl: Optional[int]) -> Optional[Any]:
         try:
             if self.available:
-                cached_data = self.redis_client.get(key)
+                l1_ttl = self.l1_default_ttl if l1_ttl is None else l1_ttl
+                if l1_ttl <= 0:
+                    cached_data = self.binary_client.get(key)
+                    ttl_ms = -1
+                else:
+                    cached_data = self.l1_cache.get(key)
+                    if cached_data is not None:
+                        self.l1_hits += 1
+                        return self.serializer.loads(cached_data)
+                    
+                    # Fetch value and remaining TTL in one round trip
+                    pipe = self.binary_client.pipeline(transaction=False)
+                    pipe.get(key)
+                    pipe.pttl(key)
+                    cached_data, ttl_ms = pipe.execute()
+                
                 if cached_data:
-                    return json.loads(cached_data)
+                    self.l2_hits += 1
+                    if ttl_ms > 0:
+                        self.l1_cache.set(key, cached_data, min(l1_ttl, ttl_ms / 1000))
+                    return self.serializer.loads(cached_data)
+                self.l2_misses += 1
             else:
                 # Use memory cache fallback
-                cache_entry = self._memory_cache.get(key)
-                if cache_entry and cache_entry['expires'] > datetime.utcnow():
-                    return cache_entry['data']
-                elif cache_entry:
-                    # Remove expired entry
-                    del self._memory_cache[key]
+                cached_data = self._memory_cache.get(key)
+                if cached_data:
+                    return self.serializer.loads(cached_data)
             return None
         except Exception as e:
             logger.error(f"Cache get error: {e}")
             return None
     
-    def set(self, key: str, value: Any, expiry_seconds: int = 300) -> bool:
-        """Set value in cache with expiry"""
+    def set(self, key: str, value: Any, expiry_seconds: int = 300, l1_ttl: Optional[int] = None,
+            tags: Optional[List[str]] = None) -> bool:
+        """
+        Set value in cache with expiry
+        
+        Args:
+            key: Cache key
+            value: Value to cache (JSON types plus datetime, date, ObjectId, UUID and Decimal)
+            expiry_seconds: Cache expiry time in seconds
+            l1_ttl: Max seconds to keep the value in this process's L1 cache (0 disables L1)
+            tags: Tags the entry is invalidated with, e.g. ["user:123", "listings"]
+        """
         try:
+            payload = self.serializer.dumps(value)
+            cache_telemetry.record_store(self.key_prefix(key), len(payload))
             if self.available:
-                return self.redis_client.setex(
-                    key, 
-                    expiry_seconds, 
-                    json.dumps(value, default=str)
-                )
+                l1_ttl = self.l1_default_ttl if l1_ttl is None else l1_ttl
+                pipe = self.binary_client.pipeline(transaction=False)
+                pipe.setex(key, expiry_seconds, payload)
+                now = time.time()
+                for tag in tags or []:
+                    tag_key = self._tag_key(tag)
+                    # Drop members whose entries have expired, so hot tags stay as
+                    # large as their live entries
+                    pipe.zremrangebyscore(tag_key, "-inf", now)
+                    pipe.zadd(tag_key, {key: now + expiry_seconds})
+                    pipe.expire(tag_key, max(expiry_seconds, self.TAG_TTL))
+                result = pipe.execute()[0]
+                self._publish_invalidation(keys=[key])
+                if l1_ttl > 0:
+                    self.l1_cache.set(key, payload, min(l1_ttl, expiry_seconds))
+                return result
             else:
-                # Use memory cache fallback
-                self._memory_cache[key] = {
-                    'data': value,
-                    'expires': datetime.utcnow() + timedelta(seconds=expiry_seconds)
-                }
+                # Use memory cache fallback (stored serialized, like Redis)
+                self._memory_cache.set(key, payload, expiry_seconds)
+                for tag in tags or []:
+                    tagged_keys = self._memory_tags.setdefault(self._tag_key(tag), set())
+                    tagged_keys.add(key)
+                    if len(tagged_keys) > self._memory_cache.max_entries:
+                        # Drop keys that were evicted or expired
+                        tagged_keys.intersection_update(self._memory_cache._entries.keys())
                 return True
         except Exception as e:
             logger.error(f"Cache set error: {e}")
@@ -88,27 +523,125 @@ class CacheService:
         """Delete value from cache"""
         try:
             if self.available:
-                return bool(self.redis_client.delete(key))
+                self.l1_cache.delete(key)
+                deleted = bool(self.redis_client.delete(key))
+                self._publish_invalidation(keys=[key])
+                return deleted
             else:
-                return bool(self._memory_cache.pop(key, None))
+                return self._memory_cache.delete(key)
         except Exception as e:
             logger.error(f"Cache delete error: {e}")
             return False
     
-    def clear_pattern(self, pattern: str) -> int:
-        """Clear all keys matching pattern"""
+    def invalidate_tag(self, tag: str) -> int:
+        """Delete every entry registered under a tag"""
+        tag_key = self._tag_key(tag)
         try:
             if self.available:
-                keys = self.redis_client.keys(pattern)
+                # Take and drop the index atomically so concurrent sets land in a fresh one
+                pipe = self.redis_client.pipeline(transaction=True)
+                pipe.zrangebyscore(tag_key, time.time(), "+inf")
+                pipe.unlink(tag_key)
+                pipe.incr(self._tag_version_key(tag))
+                keys = list(pipe.execute()[0])
+                
+                deleted = 0
+                for i in range(0, len(keys), UNLINK_BATCH_SIZE):
+                    deleted += self.redis_client.unlink(*keys[i:i + UNLINK_BATCH_SIZE])
+                for key in keys:
+                    self.l1_cache.delete(key)
                 if keys:
-                    return self.redis_client.delete(*keys)
-                return 0
+                    self._publish_invalidation(keys=keys)
+                return deleted
+            else:
+                keys = self._memory_tags.pop(tag_key, set())
+                return sum(1 for key in keys if self._memory_cache.delete(key))
+        except Exception as e:
+            logger.error(f"Cache invalidate tag error: {e}")
+            return 0
+    
+    def _tag_version_key(self, tag: str) -> str:
+        # Not versioned, so data versions keep increasing across flushes
+        return f"{self.namespace}:tagver:{tag}"
+    
+    def data_version(self, tag: str) -> Optional[str]:
+        """
+        Get a version string that changes whenever a tag is invalidated or the cache is flushed
+        
+        Used as an HTTP validator for data whose writes all invalidate the tag.
+        Returns None without Redis: an in-memory version is local to one
+        worker and restarts with it, so it can't validate data written
+        through another; callers then validate the content itself.
+        """
+        if not self.available:
+            return None
+        try:
+            return f"{self._get_version()}.{int(self.redis_client.get(self._tag_version_key(tag)) or 0)}"
+        except Exception as e:
+            logger.error(f"Cache data version error: {e}")
+            return None
+    
+    def flush_all(self) -> int:
+        """Invalidate every cache entry by bumping the key version"""
+        try:
+            if self.available:
+                self._version = int(self.redis_client.incr(self._version_key))
+                self._version_checked = time.monotonic()
+                self._publish_invalidation(version=self._version)
+            else:
+                self._version += 1
+                self._memory_cache.clear()
+                self._memory_tags.clear()
+            # Old-version entries expire from Redis on their own TTL
+            self.l1_cache.clear()
+            return self._version
+        except Exception as e:
+            logger.error(f"Cache flush error: {e}")
+            return self._version
+    
+    def acquire_lock(self, name: str, ttl_ms: int = 10000) -> Optional[str]:
+        """Acquire a short-lived lock shared by all workers, returning its token or None if held"""
+        token = uuid.uuid4().hex
+        if not self.available:
+            # Single process: in-process coalescing is enough
+            return token
+        try:
+            if self.redis_client.set(f"{name}:lock", token, nx=True, px=ttl_ms):
+                return token
+            return None
+        except Exception as e:
+            logger.error(f"Cache lock error: {e}")
+            return token
+    
+    def release_lock(self, name: str, token: str):
+        """Release a lock acquired with acquire_lock"""
+        if not self.available:
+            return
+        try:
+            self.redis_client.eval(RELEASE_LOCK_SCRIPT, 1, f"{name}:lock", token)
+        except Exception as e:
+            logger.error(f"Cache unlock error: {e}")
+    
+    def clear_pattern(self, pattern: str) -> int:
+        """Clear all keys matching pattern (prefer invalidate_tag for routine invalidation)"""
+        try:
+            if self.available:
+                self.l1_cache.delete_pattern(pattern)
+                self._publish_invalidation(patterns=[pattern])
+                # SCAN instead of KEYS so Redis isn't blocked on large keyspaces
+                deleted = 0
+                batch = []
+                for key in self.redis_client.scan_iter(match=pattern, count=UNLINK_BATCH_SIZE):
+                    batch.append(key)
+                    if len(batch) >= UNLINK_BATCH_SIZE:
+                        deleted += self.redis_client.unlink(*batch)
+                        batch = []
+                if batch:
+                    deleted += self.redis_client.unlink(*batch)
+                return deleted
             else:
                 # Clear memory cache with pattern
-                keys_to_delete = [k for k in self._memory_cache.keys() if pattern in k]
-                for key in keys_to_delete:
-                    del self._memory_cache[key]
-                return len(keys_to_delete)
+                return self._memory_cache.delete_pattern(pattern)
         except Exception as e:
             logger.error(f"Cache clear pattern error: {e}")
             return 0
@@ -116,55 +649,404 @@ class CacheService:
 # Global cache service instance
 cache_service = CacheService()
 
-def cached(expiry_seconds: int = 300, key_prefix: str = "default"):
+class StampedeGuard:
+    """
+    Coalesces concurrent recomputations of the same cache key
+    
+    Callers in one process share a single in-flight computation. Across
+    workers a short Redis lock elects the worker that recomputes while the
+    others poll for its result.
+    """
+    
+    def __init__(self, lock_ttl_ms: int = 10000, lock_wait_seconds: float = 5.0, poll_interval: float = 0.05):
+        self.lock_ttl_ms = lock_ttl_ms
+        self.lock_wait_seconds = lock_wait_seconds
+        self.poll_interval = poll_interval
+        self.async_calls: Dict[str, asyncio.Future] = {}
+        self.sync_calls: Dict[str, "SyncCall"] = {}
+        self.lock = threading.Lock()
+        self.computations = 0
+        self.coalesced = 0
+        self.lock_waits = 0
+        self.early_refreshes = 0
+        self.stale_served = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "computations": self.computations,
+            "coalesced": self.coalesced,
+            "lock_waits": self.lock_waits,
+            "early_refreshes": self.early_refreshes,
+            "stale_served": self.stale_served,
+            "in_flight": len(self.async_calls) + len(self.sync_calls)
+        }
+
+class SyncCall:
+    """An in-flight synchronous computation other threads can wait on"""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+stampede_guard = StampedeGuard()
+
+class CacheAccessLog:
+    """
+    Counts which argument combinations of warmable functions are requested
+
+    Counts are buffered in-process and flushed into hourly Redis sorted sets,
+    so the most requested combinations are shared by all workers and survive
+    restarts. Without Redis they are kept in memory.
+    """
+
+    def __init__(self, window_hours: int = 6, max_combinations: int = 1000):
+        self.window_hours = window_hours
+        self.max_combinations = max_combinations
+        # Registered name -> warm coroutine function
+        self.targets: Dict[str, Callable] = {}
+        self.pending: Dict[str, Dict[str, int]] = {}
+        self.totals: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, warm: Callable):
+        self.targets[name] = warm
+
+    def record(self, name: str, args, kwargs):
+        """Count one call; arguments that aren't JSON can't be replayed and are ignored"""
+        try:
+            combination = json.dumps([list(args), kwargs], sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError):
+            return
+        with self.lock:
+            counts = self.pending.setdefault(name, {})
+            if combination in counts or len(counts) < self.max_combinations:
+                counts[combination] = counts.get(combination, 0) + 1
+
+    def _hour_key(self, name: str, hour: int) -> str:
+        return f"{cache_service.namespace}:warm:{name}:{hour}"
+
+    def flush(self):
+        """Move buffered counts into the shared log"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+
+        if not cache_service.available:
+            for name, counts in pending.items():
+                totals = self.totals.setdefault(name, {})
+                for combination, count in counts.items():
+                    totals[combination] = totals.get(combination, 0) + count
+                if len(totals) > self.max_combinations * 2:
+                    top = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+                    self.totals[name] = dict(top[:self.max_combinations])
+            return
+
+        try:
+            hour = int(time.time() // 3600)
+            pipe = cache_service.redis_client.pipeline(transaction=False)
+            for name, counts in pending.items():
+                key = self._hour_key(name, hour)
+                for combination, count in counts.items():
+                    pipe.zincrby(key, count, combination)
+                pipe.expire(key, (self.window_hours + 1) * 3600)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Cache access log flush error: {e}")
+
+    def top(self, name: str, limit: int) -> List[tuple]:
+        """Get the most requested (args, kwargs) combinations over the window"""
+        if not cache_service.available:
+            totals = self.totals.get(name, {})
+            combinations = sorted(totals, key=totals.get, reverse=True)[:limit]
+        else:
+            try:
+                hour = int(time.time() // 3600)
+                keys = [self._hour_key(name, hour - offset) for offset in range(self.window_hours)]
+                union_key = f"{cache_service.namespace}:warm:{name}:top:{cache_service.instance_id}"
+                pipe = cache_service.redis_client.pipeline(transaction=False)
+                pipe.zunionstore(union_key, keys)
+                pipe.zrevrange(union_key, 0, limit - 1)
+                pipe.unlink(union_key)
+                combinations = pipe.execute()[1]
+            except Exception as e:
+                logger.error(f"Cache access log read error: {e}")
+                return []
+
+        result = []
+        for combination in combinations:
+            args, kwargs = json.loads(combination)
+            result.append((tuple(args), kwargs))
+        return result
+
+cache_access_log = CacheAccessLog()
+
+def _wrap_entry(value: Any, fresh_seconds: int, delta: float) -> Dict[str, Any]:
+    """Store a result with the metadata needed for early and stale refreshes"""
+    return {
+        "__cached__": True,
+        "value": value,
+        "fresh_until": time.time() + fresh_seconds,
+        "delta": delta
+    }
+
+def _unwrap_entry(entry: Any):
+    """Split a cached entry into (value, fresh_until, recompute seconds)"""
+    if isinstance(entry, dict) and entry.get("__cached__"):
+        return entry["value"], entry["fresh_until"], entry["delta"]
+    return entry, float("inf"), 0.0
+
+def _on_event_loop() -> bool:
+    """Whether this thread is running an asyncio event loop"""
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def _log_refresh_error(task: asyncio.Future):
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background cache refresh failed: {task.exception()}")
+
+def cached(expiry_seconds: int = 300, key_prefix: str = "default", l1_ttl: Optional[int] = None,
+           tags: Optional[Callable[..., List[str]]] = None, stale_ttl: int = 0,
+           early_refresh_beta: float = 1.0, warm: bool = False):
     """
     Decorator for caching function results
     
+    Concurrent misses for the same key share one computation, in-process and
+    across workers. Sync functions wait for each other with blocking calls,
+    so async code must call them through run_in_threadpool; called on the
+    event loop anyway, they compute the value rather than wait. Hot entries are refreshed probabilistically shortly before
+    they expire (weighted by how long they take to compute), and with stale_ttl
+    an expired value keeps being served while one background refresh runs.
+    
     Args:
         expiry_seconds: Cache expiry time in seconds
-        key_prefix: Prefix for cache key
+        key_prefix: Prefix for cache key (results are always tagged with it)
+        l1_ttl: Max seconds results stay in the per-process L1 cache (0 disables L1)
+        tags: Called with the function arguments, returns extra tags for the result
+        stale_ttl: Seconds an expired result may still be served while it is refreshed
+        early_refresh_beta: Eagerness of early refresh (0 disables it)
+        warm: Log requested arguments so CacheWarmer can recompute popular
+            results before they expire (arguments must be JSON serializable)
     """
+    def get_tags(*args, **kwargs) -> List[str]:
+        return [key_prefix] + (tags(*args, **kwargs) if tags else [])
+    
     def decorator(func):
+        name = f"{key_prefix}:{func.__name__}"
+        
+        def lookup(cache_key: str):
+            """Return (found, value, needs_refresh) for a cache key"""
+            entry = cache_service.get(cache_key, l1_ttl=l1_ttl)
+            if entry is None:
+                return False, None, False
+            
+            value, fresh_until, delta = _unwrap_entry(entry)
+            now = time.time()
+            if now >= fresh_until:
+                stampede_guard.stale_served += 1
+                return True, value, True
+            
+            # Probabilistic early expiration (XFetch)
+            if early_refresh_beta > 0 and delta > 0:
+                if now - delta * early_refresh_beta * math.log(1.0 - random.random()) >= fresh_until:
+                    stampede_guard.early_refreshes += 1
+                    return True, value, True
+            return True, value, False
+        
+        def get_fresh(cache_key: str):
+            """Read an entry another worker just computed"""
+            entry = cache_service.get(cache_key, l1_ttl=0)
+            if entry is not None:
+                value, fresh_until, _ = _unwrap_entry(entry)
+                if fresh_until > time.time():
+                    return True, value
+            return False, None
+        
+        def store(cache_key: str, result: Any, delta: float, args, kwargs):
+            cache_service.set(
+                cache_key,
+                _wrap_entry(result, expiry_seconds, delta),
+                expiry_seconds + stale_ttl,
+                l1_ttl=l1_ttl,
+                tags=get_tags(*args, **kwargs)
+            )
+        
+        async def load_async(cache_key: str, args, kwargs):
+            token = cache_service.acquire_lock(cache_key, stampede_guard.lock_ttl_ms)
+            if token is None:
+                # Another worker is computing this key; wait for its result
+                stampede_guard.lock_waits += 1
+                deadline = time.monotonic() + stampede_guard.lock_wait_seconds
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(stampede_guard.poll_interval)
+                    found, value = get_fresh(cache_key)
+                    if found:
+                        stampede_guard.coalesced += 1
+                        return value
+                logger.warning(f"Timed out waiting for {func.__name__} to be cached, computing locally")
+            
+            try:
+                started = time.monotonic()
+                result = await func(*args, **kwargs)
+                elapsed = time.monotonic() - started
+                stampede_guard.computations += 1
+                cache_telemetry.record_recompute(key_prefix, cache_key, elapsed)
+                store(cache_key, result, elapsed, args, kwargs)
+                logger.debug(f"Cache miss for {func.__name__}, result cached")
+                return result
+            finally:
+                if token:
+                    cache_service.release_lock(cache_key, token)
+        
+        def start_async(cache_key: str, args, kwargs):
+            """Return the in-flight computation for a key, starting one if needed"""
+            task = stampede_guard.async_calls.get(cache_key)
+            if task is not None:
+                return task, True
+            
+            task = asyncio.ensure_future(load_async(cache_key, args, kwargs))
+            stampede_guard.async_calls[cache_key] = task
+            
+            def finished(done):
+                if stampede_guard.async_calls.get(cache_key) is done:
+                    del stampede_guard.async_calls[cache_key]
+            
+            task.add_done_callback(finished)
+            return task, False
+        
         @wraps(func)
         async def async_wrapper(*args, **kwargs):
             # Generate cache key
-            cache_key = cache_service._generate_cache_key(
-                f"{key_prefix}:{func.__name__}", *args, **kwargs
-            )
+            cache_key = cache_service._generate_cache_key(name, *args, **kwargs)
+            if warm:
+                cache_access_log.record(name, args, kwargs)
             
             # Try to get from cache
-            cached_result = cache_service.get(cache_key)
-            if cached_result is not None:
+            found, value, needs_refresh = lookup(cache_key)
+            if found:
                 logger.debug(f"Cache hit for {func.__name__}")
-                return cached_result
+                if needs_refresh:
+                    task, _ = start_async(cache_key, args, kwargs)
+                    task.add_done_callback(_log_refresh_error)
+                return value
+            
+            # Execute function once for all concurrent callers
+            task, joined = start_async(cache_key, args, kwargs)
+            if joined:
+                stampede_guard.coalesced += 1
+            return await asyncio.shield(task)
+        
+        def load_sync(cache_key: str, args, kwargs):
+            token = cache_service.acquire_lock(cache_key, stampede_guard.lock_ttl_ms)
+            if token is None and _on_event_loop():
+                # Sleeping here would stall every request on the loop
+                logger.warning(f"{func.__name__} called on the event loop; computing instead of waiting")
+            elif token is None:
+                # Another worker is computing this key; wait for its result
+                stampede_guard.lock_waits += 1
+                deadline = time.monotonic() + stampede_guard.lock_wait_seconds
+                while time.monotonic() < deadline:
+                    time.sleep(stampede_guard.poll_interval)
+                    found, value = get_fresh(cache_key)
+                    if found:
+                        stampede_guard.coalesced += 1
+                        return value
+                logger.warning(f"Timed out waiting for {func.__name__} to be cached, computing locally")
             
-            # Execute function and cache result
-            result = await func(*args, **kwargs)
-            cache_service.set(cache_key, result, expiry_seconds)
-            logger.debug(f"Cache miss for {func.__name__}, result cached")
-            return result
+            try:
+                started = time.monotonic()
+                result = func(*args, **kwargs)
+                elapsed = time.monotonic() - started
+                stampede_guard.computations += 1
+                cache_telemetry.record_recompute(key_prefix, cache_key, elapsed)
+                store(cache_key, result, elapsed, args, kwargs)
+                logger.debug(f"Cache miss for {func.__name__}, result cached")
+                return result
+            finally:
+                if token:
+                    cache_service.release_lock(cache_key, token)
+        
+        def run_sync(cache_key: str, args, kwargs):
+            """Compute a key once for all threads asking for it"""
+            with stampede_guard.lock:
+                call = stampede_guard.sync_calls.get(cache_key)
+                leader = call is None
+                if leader:
+                    call = SyncCall()
+                    stampede_guard.sync_calls[cache_key] = call
+            
+            if not leader and _on_event_loop():
+                # Waiting on the event would stall every request on the loop
+                # while the other thread (e.g. the warmer's) computes the key
+                logger.warning(f"{func.__name__} called on the event loop; computing instead of waiting")
+                return func(*args, **kwargs)
+            if not leader:
+                stampede_guard.coalesced += 1
+                call.event.wait()
+                if call.error:
+                    raise call.error
+                return call.result
+            
+            try:
+                call.result = load_sync(cache_key, args, kwargs)
+                return call.result
+            except Exception as e:
+                call.error = e
+                raise
+            finally:
+                with stampede_guard.lock:
+                    stampede_guard.sync_calls.pop(cache_key, None)
+                call.event.set()
+        
+        def refresh_sync(cache_key: str, args, kwargs):
+            try:
+                run_sync(cache_key, args, kwargs)
+            except Exception as e:
+                logger.error(f"Background cache refresh failed for {func.__name__}: {e}")
         
         @wraps(func)
         def sync_wrapper(*args, **kwargs):
             # Generate cache key
-            cache_key = cache_service._generate_cache_key(
-                f"{key_prefix}:{func.__name__}", *args, **kwargs
-            )
+            cache_key = cache_service._generate_cache_key(name, *args, **kwargs)
+            if warm:
+                cache_access_log.record(name, args, kwargs)
             
             # Try to get from cache
-            cached_result = cache_service.get(cache_key)
-            if cached_result is not None:
+            found, value, needs_refresh = lookup(cache_key)
+            if found:
                 logger.debug(f"Cache hit for {func.__name__}")
-                return cached_result
+                if needs_refresh and cache_key not in stampede_guard.sync_calls:
+                    threading.Thread(target=refresh_sync, args=(cache_key, args, kwargs), daemon=True).start()
+                return value
+            
+            # Execute function once for all concurrent callers
+            return run_sync(cache_key, args, kwargs)
+        
+        async def warm_entry(args, kwargs, lead_seconds: float) -> bool:
+            """Recompute an entry unless it stays fresh for lead_seconds, returning whether it ran"""
+            cache_key = cache_service._generate_cache_key(name, *args, **kwargs)
+            entry = cache_service._get(cache_key, l1_ttl=0)
+            if entry is not None:
+                _, fresh_until, _ = _unwrap_entry(entry)
+                if fresh_until - time.time() > lead_seconds:
+                    return False
             
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache_service.set(cache_key, result, expiry_seconds)
-            logger.debug(f"Cache miss for {func.__name__}, result cached")
-            return result
+            if asyncio.iscoroutinefunction(func):
+                task, _ = start_async(cache_key, args, kwargs)
+                await asyncio.shield(task)
+            else:
+                # Blocking query functions run off the event loop
+                await asyncio.get_running_loop().run_in_executor(None, run_sync, cache_key, args, kwargs)
+            return True
+        
+        if warm:
+            cache_access_log.register(name, warm_entry)
         
         # Return appropriate wrapper based on function type
-        import asyncio
         if asyncio.iscoroutinefunction(func):
             return async_wrapper
         else:
@@ -174,7 +1056,8 @@ def cached(expiry_seconds: int = 300, key_prefix: str = "default"):
 
 # Specific caching functions for Oil & Gas Finder
 
-@cached(expiry_seconds=300, key_prefix="market_data")
+@cached(expiry_seconds=300, key_prefix="market_data", l1_ttl=5,
+        tags=lambda commodity: [f"market:{commodity}"])
 async def get_cached_market_data(commodity: str) -> Dict[str, Any]:
     """Cache market data for 5 minutes"""
     # This would typically fetch from external API
@@ -186,13 +1069,14 @@ async def get_cached_market_data(commodity: str) -> Dict[str, Any]:
         "timestamp": datetime.utcnow().isoformat()
     }
 
-@cached(expiry_seconds=600, key_prefix="listings")
+@cached(expiry_seconds=600, key_prefix="listings", l1_ttl=30, stale_ttl=120)
 def get_cached_listings(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Cache listing search results for 10 minutes"""
     # This would typically query the database
     return []
 
-@cached(expiry_seconds=1800, key_prefix="analytics")
+@cached(expiry_seconds=1800, key_prefix="analytics", stale_ttl=600,
+        tags=lambda user_id, date_range: [f"user:{user_id}"])
 def get_cached_analytics(user_id: str, date_range: str) -> Dict[str, Any]:
     """Cache analytics data for 30 minutes"""
     return {
@@ -202,7 +1086,8 @@ def get_cached_analytics(user_id: str, date_range: str) -> Dict[str, Any]:
         "date_range": date_range
     }
 
-@cached(expiry_seconds=3600, key_prefix="company_profile")
+@cached(expiry_seconds=3600, key_prefix="company_profile", l1_ttl=300,
+        tags=lambda company_id: [f"company:{company_id}"])
 def get_cached_company_profile(company_id: str) -> Dict[str, Any]:
     """Cache company profiles for 1 hour"""
     return {
@@ -212,40 +1097,94 @@ def get_cached_company_profile(company_id: str) -> Dict[str, Any]:
         "trading_hubs": ["Houston", "Singapore"]
     }
 
-# Cache warming functions
+# Cache warming
 class CacheWarmer:
     """
     Proactive cache warming for frequently accessed data
+    
+    Replays the argument combinations most requested from functions cached
+    with warm=True, recomputing each through the real query function shortly
+    before it goes stale. One worker warms per cycle, one entry at a time and
+    at a capped rate, so warming never competes with live traffic.
     """
     
-    @staticmethod
-    async def warm_market_data():
-        """Pre-warm market data cache"""
-        commodities = ['crude_oil', 'natural_gas', 'lng', 'gasoline', 'diesel']
-        for commodity in commodities:
-            try:
-                await get_cached_market_data(commodity)
-                logger.info(f"Warmed market data cache for {commodity}")
-            except Exception as e:
-                logger.error(f"Failed to warm cache for {commodity}: {e}")
+    def __init__(self, top_n: int = 20, interval_seconds: float = 30.0, max_per_second: float = 5.0):
+        self.top_n = top_n
+        self.interval_seconds = interval_seconds
+        self.max_per_second = max_per_second
+        self.is_running = False
+        self.warmed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.last_cycle_seconds = 0.0
     
-    @staticmethod
-    def warm_popular_listings():
-        """Pre-warm popular listing combinations"""
-        popular_filters = [
-            {"commodity": "crude_oil"},
-            {"commodity": "natural_gas"},
-            {"location": "houston"},
-            {"location": "singapore"},
-            {}  # All listings
-        ]
+    async def warm_once(self) -> int:
+        """Run one warming cycle, returning the number of entries recomputed"""
+        cache_access_log.flush()
+        
+        # Let the lock expire instead of releasing it so only one worker warms per interval
+        lock_name = f"{cache_service.namespace}:warm"
+        if cache_service.acquire_lock(lock_name, int(self.interval_seconds * 900)) is None:
+            return 0
         
-        for filters in popular_filters:
+        started = time.monotonic()
+        # Refresh anything that would go stale before the next cycle
+        lead_seconds = self.interval_seconds * 1.5
+        warmed = 0
+        for name, warm_entry in list(cache_access_log.targets.items()):
+            for args, kwargs in cache_access_log.top(name, self.top_n):
+                try:
+                    if not await warm_entry(args, kwargs, lead_seconds):
+                        self.skipped += 1
+                        continue
+                    warmed += 1
+                    self.warmed += 1
+                except Exception as e:
+                    self.failed += 1
+                    logger.error(f"Failed to warm {name} for {args} {kwargs}: {e}")
+                await asyncio.sleep(1.0 / self.max_per_second)
+        
+        self.last_cycle_seconds = time.monotonic() - started
+        if warmed:
+            logger.info(f"Warmed {warmed} cache entries in {self.last_cycle_seconds:.2f}s")
+        return warmed
+    
+    async def start_warming(self, startup_delay: float = 2.0):
+        """Warm on startup, then keep popular entries fresh"""
+        if self.is_running:
+            return
+        
+        self.is_running = True
+        logger.info("Starting cache warming loop")
+        
+        await asyncio.sleep(startup_delay)
+        while self.is_running:
             try:
-                get_cached_listings(filters)
-                logger.info(f"Warmed listings cache for filters: {filters}")
+                await self.warm_once()
             except Exception as e:
-                logger.error(f"Failed to warm listings cache: {e}")
+                logger.error(f"Error warming cache: {e}")
+            await asyncio.sleep(self.interval_seconds)
+    
+    def stop_warming(self):
+        """Stop the warming loop, keeping the access counts gathered so far"""
+        self.is_running = False
+        cache_access_log.flush()
+        logger.info("Stopped cache warming loop")
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "targets": sorted(cache_access_log.targets),
+            "warmed": self.warmed,
+            "skipped_fresh": self.skipped,
+            "failed": self.failed,
+            "last_cycle_seconds": round(self.last_cycle_seconds, 3)
+        }
+
+cache_warmer = CacheWarmer(
+    top_n=int(os.environ.get('CACHE_WARM_TOP_N', 20)),
+    interval_seconds=float(os.environ.get('CACHE_WARM_INTERVAL', 30)),
+    max_per_second=float(os.environ.get('CACHE_WARM_RATE', 5))
+)
 
 # Cache invalidation helpers
 class CacheInvalidator:
@@ -256,33 +1195,35 @@ class CacheInvalidator:
     @staticmethod
     def invalidate_user_cache(user_id: str):
         """Invalidate all cache entries for a specific user"""
-        patterns = [
-            f"*user:{user_id}*",
-            f"*analytics:{user_id}*",
-            f"*profile:{user_id}*"
-        ]
-        
-        for pattern in patterns:
-            cache_service.clear_pattern(pattern)
-        
+        cache_service.invalidate_tag(f"user:{user_id}")
         logger.info(f"Invalidated cache for user: {user_id}")
     
     @staticmethod
     def invalidate_listings_cache():
         """Invalidate listings cache when new listings are added"""
-        cache_service.clear_pattern("listings:*")
+        cache_service.invalidate_tag("listings")
         logger.info("Invalidated all listings cache")
     
     @staticmethod
     def invalidate_market_data_cache(commodity: str = None):
         """Invalidate market data cache"""
         if commodity:
-            pattern = f"market_data:*{commodity}*"
+            cache_service.invalidate_tag(f"market:{commodity}")
         else:
-            pattern = "market_data:*"
-        
-        cache_service.clear_pattern(pattern)
+            cache_service.invalidate_tag("market_data")
         logger.info(f"Invalidated market data cache for: {commodity or 'all commodities'}")
+    
+    @staticmethod
+    def invalidate_company_cache(company_id: str):
+        """Invalidate a cached company profile"""
+        cache_service.invalidate_tag(f"company:{company_id}")
+        logger.info(f"Invalidated cache for company: {company_id}")
+    
+    @staticmethod
+    def invalidate_all():
+        """Invalidate every cache entry"""
+        version = cache_service.flush_all()
+        logger.info(f"Invalidated all cache entries (version {version})")
 
 # Performance monitoring
 class CacheMonitor:
@@ -290,6 +1231,16 @@ class CacheMonitor:
     Monitor cache performance and hit rates
     """
     
+    @staticmethod
+    def get_prefix_stats() -> Dict[str, Any]:
+        """Get hit/miss, latency and value-size statistics per key prefix"""
+        return cache_telemetry.get_prefix_stats()
+    
+    @staticmethod
+    def get_top_keys(limit: int = 20) -> List[Dict[str, Any]]:
+        """Get the cached keys that cost the most time to recompute"""
+        return cache_telemetry.get_top_keys(limit)
+    
     @staticmethod
     def get_cache_stats() -> Dict[str, Any]:
         """Get cache performance statistics"""
@@ -302,13 +1253,27 @@ class CacheMonitor:
                     "used_memory": info.get('used_memory_human', '0B'),
                     "hits": info.get('keyspace_hits', 0),
                     "misses": info.get('keyspace_misses', 0),
-                    "hit_rate": info.get('keyspace_hits', 0) / max(1, info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0))
+                    "hit_rate": info.get('keyspace_hits', 0) / max(1, info.get('keyspace_hits', 0) + info.get('keyspace_misses', 0)),
+                    "serialization": cache_service.serializer.describe(),
+                    "l1": cache_service.l1_cache.get_stats(),
+                    "tiers": {
+                        "l1_hits": cache_service.l1_hits,
+                        "l2_hits": cache_service.l2_hits,
+                        "misses": cache_service.l2_misses,
+                        "l1_hit_rate": cache_service.l1_hits / max(1, cache_service.l1_hits + cache_service.l2_hits + cache_service.l2_misses)
+                    },
+                    "stampede": stampede_guard.get_stats(),
+                    "warming": cache_warmer.get_stats(),
+                    "prefixes": cache_telemetry.get_prefix_stats()
                 }
             else:
                 return {
                     "cache_type": "Memory",
-                    "entries": len(cache_service._memory_cache),
-                    "status": "Fallback mode"
+                    "status": "Fallback mode",
+                    **cache_service._memory_cache.get_stats(),
+                    "stampede": stampede_guard.get_stats(),
+                    "warming": cache_warmer.get_stats(),
+                    "prefixes": cache_telemetry.get_prefix_stats()
                 }
         except Exception as e:
             logger.error(f"Failed to get cache stats: {e}")
@@ -319,8 +1284,10 @@ __all__ = [
     'cache_service',
     'cached',
     'CacheWarmer',
+    'cache_warmer',
     'CacheInvalidator',
     'CacheMonitor',
+    'cache_telemetry',
     'get_cached_market_data',
     'get_cached_listings',
     'get_cached_analytics',
@@ -0,0 +1,217 @@
+"""
+Response Compression Middleware
+Negotiated brotli/gzip compression for API responses
+"""
+
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+from http_caching import choose_encoding
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/xml",
+    "application/javascript",
+    "application/rss+xml",
+    "application/atom+xml",
+    "image/svg+xml",
+    "text/"
+)
+
+class _Compressor:
+    """Incremental compressor for one response body"""
+
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        self.coding = coding
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            # wbits 31 writes a gzip header and trailer
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, flush: bool) -> bytes:
+        """Compress a chunk; flush makes everything so far decodable by the client"""
+        if self.coding == "br":
+            chunk = self._brotli.process(data)
+            return chunk + self._brotli.flush() if flush else chunk
+        chunk = self._zlib.compress(data)
+        return chunk + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else chunk
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.coding == "br":
+            return self._brotli.process(data) + self._brotli.finish()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_FINISH)
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip
+
+    The coding is negotiated from Accept-Encoding. Body chunks are held
+    until min_size bytes have arrived or the body ends, since middleware
+    such as BaseHTTPMiddleware re-sends even small bodies as several
+    messages; smaller bodies are sent as they are. Larger streamed
+    responses (more_body) are compressed chunk by chunk and flushed so
+    clients see data as it's produced. Responses that already carry a Content-Encoding (such as
+    prebuilt payload variants) and non-text media types are passed through.
+    """
+
+    def __init__(self, app, min_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.codings = ("br", "gzip") if BROTLI_AVAILABLE else ("gzip",)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        coding = choose_encoding(accept_encoding, self.codings)
+
+        responder = _CompressionResponder(self, send, coding)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    """Wraps send() for one request, deciding once min_size bytes or the whole body have arrived"""
+
+    def __init__(self, middleware: CompressionMiddleware, send, coding: str):
+        self.middleware = middleware
+        self.upstream_send = send
+        self.coding = coding
+        self.start_message = None
+        self.compressor: Optional[_Compressor] = None
+        self.passthrough = False
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+
+    def _should_compress(self, headers: List[Tuple[bytes, bytes]]) -> Tuple[bool, bool]:
+        """Return (vary on Accept-Encoding, compression allowed) for the response headers"""
+        status = self.start_message["status"]
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False, False
+            if name == b"content-type":
+                content_type = value.lower()
+        if status == 304:
+            # Keep Vary consistent with the 200 response being revalidated
+            return True, False
+        # Partial content must keep the byte ranges of the identity body
+        if status < 200 or status in (204, 206):
+            return False, False
+        compressible = content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+        return compressible, compressible and self.coding != "identity"
+
+    def _start_headers(self, compressed: bool, vary: bool, length: Optional[int]) -> List[Tuple[bytes, bytes]]:
+        headers = []
+        has_vary = False
+        # A 304 carries the validator of the response this client would get,
+        # which is compressed whenever a coding was negotiated
+        weaken_etag = compressed or (self.start_message["status"] == 304 and self.coding != "identity")
+        for name, value in self.start_message["headers"]:
+            if compressed and name == b"content-length":
+                continue
+            if weaken_etag and name == b"etag" and not value.startswith(b"W/"):
+                # The compressed bytes differ, so the strong validator becomes weak;
+                # If-None-Match uses weak comparison, so revalidation still works
+                value = b"W/" + value
+            if vary and name == b"vary":
+                has_vary = True
+                if b"accept-encoding" not in value.lower():
+                    value += b", Accept-Encoding"
+            headers.append((name, value))
+        if vary and not has_vary:
+            headers.append((b"vary", b"Accept-Encoding"))
+        if compressed:
+            headers.append((b"content-encoding", self.coding.encode("latin-1")))
+            if length is not None:
+                headers.append((b"content-length", str(length).encode("latin-1")))
+        return headers
+
+    async def _pass_through(self, vary: bool, body: Optional[bytes], more_body: bool):
+        """Send the held headers unchanged, then any held body"""
+        self.passthrough = True
+        self.pending = []
+        await self.upstream_send({**self.start_message, "headers": self._start_headers(False, vary, None)})
+        if body is not None:
+            await self.upstream_send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Hold the headers until the body shows how large the response is
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            if not self.passthrough and self.compressor is None and self.start_message is not None:
+                # Other messages (e.g. a file send) can't be compressed; the held
+                # headers and body must still go out first
+                vary, _ = self._should_compress(self.start_message["headers"])
+                await self._pass_through(vary, b"".join(self.pending) if self.pending else None, True)
+            await self.upstream_send(message)
+            return
+
+        if self.compressor is not None:
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                chunk = self.compressor.compress(body, flush=True)
+                if chunk:
+                    await self.upstream_send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await self.upstream_send({"type": "http.response.body", "body": self.compressor.finish(body)})
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        vary, allowed = self._should_compress(self.start_message["headers"])
+        if not allowed:
+            await self._pass_through(vary, b"".join(self.pending) + body, more_body)
+            return
+
+        self.pending.append(body)
+        self.pending_size += len(body)
+        if more_body and self.pending_size < self.middleware.min_size:
+            return
+        body = b"".join(self.pending)
+        self.pending = []
+        if not more_body and len(body) < self.middleware.min_size:
+            await self._pass_through(vary, body, False)
+            return
+
+        self.compressor = _Compressor(self.coding, self.middleware.gzip_level, self.middleware.brotli_quality)
+        if more_body:
+            # Streaming: length is unknown, so the response is sent chunked
+            await self.upstream_send({**self.start_message, "headers": self._start_headers(True, vary, None)})
+            chunk = self.compressor.compress(body, flush=True)
+            await self.upstream_send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            compressed = self.compressor.finish(body)
+            await self.upstream_send({**self.start_message, "headers": self._start_headers(True, vary, len(compressed))})
+            await self.upstream_send({"type": "http.response.body", "body": compressed})
+
+def compression_settings() -> dict:
+    """Middleware options configured through the environment"""
+    return {
+        "min_size": int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+        "gzip_level": int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+        "brotli_quality": int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))
+    }
+
+__all__ = [
+    'CompressionMiddleware',
+    'compression_settings',
+    'BROTLI_AVAILABLE'
+]
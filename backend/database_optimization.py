@@ -105,6 +105,33 @@ def create_database_indexes():
         
         print("✅ Subscriptions collection indexes created")
         
+        # Usage metering collection indexes
+        usage_collection = db.usage
+        
+        # One usage document per billing period (makes metering upserts safe across workers)
+        usage_collection.create_index(
+            [("user_id", ASCENDING), ("period_start", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"period_start": {"$exists": True}},
+            background=True
+        )
+        
+        # Index for the current-period lookup used by conditional increments
+        usage_collection.create_index([("user_id", ASCENDING), ("period_end", ASCENDING)], background=True)
+        
+        # One daily counter document per metric
+        usage_collection.create_index(
+            [("user_id", ASCENDING), ("metric", ASCENDING), ("day", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"day": {"$exists": True}},
+            background=True
+        )
+        
+        # Expire old daily counters automatically
+        usage_collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, background=True)
+        
+        print("✅ Usage collection indexes created")
+        
         # Connections collection indexes
         connections_collection = db.connections
         
@@ -150,6 +177,24 @@ def create_database_indexes():
         
         print("✅ Companies collection indexes created")
         
+        # Document analysis cache and history indexes
+        document_analyses = db.document_analyses
+        analysis_history = db.analysis_history
+        
+        # Expire cached analysis results that haven't been reused for 90 days
+        document_analyses.create_index([("last_used_at", ASCENDING)], expireAfterSeconds=90 * 86400, background=True)
+        
+        # Index for the user's analysis history, most recent first
+        analysis_history.create_index([("user_id", ASCENDING), ("analyzed_at", DESCENDING)], background=True)
+        analysis_history.create_index([("analysis_id", ASCENDING)], unique=True, background=True)
+        
+        # Expire analysis job statuses shared between server processes
+        db.analysis_jobs.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0, background=True)
+        # Index for counting a user's jobs in progress across server processes
+        db.analysis_jobs.create_index([("owner", ASCENDING), ("status", ASCENDING)], background=True)
+        
+        print("✅ Document analysis collection indexes created")
+        
         # Security audit log collection (if exists)
         try:
             security_logs = db.security_logs
@@ -0,0 +1,380 @@
+"""
+Document Store
+Streaming, content-addressed storage for uploaded documents
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+from upload_scanner import UploadRejected, UploadScan, UploadScanner
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ImportError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+logger = logging.getLogger(__name__)
+
+# Buffered before each threadpool write, so large uploads take few thread hops
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class UploadError(Exception):
+    """The request doesn't carry an acceptable document"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+class UploadTooLarge(UploadError):
+    """The document exceeds the store's size limit"""
+
+class _IncomingFile:
+    """Temp file receiving one upload, scanned, hashed and counted as it's written"""
+
+    def __init__(self, path: Path, scan: Optional[UploadScan] = None):
+        self.path = path
+        self.size = 0
+        self._scan = scan
+        self._hasher = hashlib.sha256()
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._file = open(path, "wb")
+
+    def _write(self, data: bytes):
+        # The scanner and hashlib work on whole buffers in C, so this runs alongside the loop
+        if self._scan is not None:
+            self._scan.feed(data)
+        self._hasher.update(data)
+        self._file.write(data)
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= WRITE_BUFFER_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self._buffer:
+            data = b"".join(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            await run_in_threadpool(self._write, data)
+
+    async def finish(self) -> str:
+        """Flush and close the file, returning the SHA-256 of its content"""
+        await self.flush()
+        await run_in_threadpool(self._file.close)
+        if self._scan is not None:
+            self._scan.finish()
+        return self._hasher.hexdigest()
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+class _UploadPart:
+    """State for one multipart part while its headers and data stream in"""
+
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.field_name: Optional[str] = None
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+
+class DocumentStore:
+    """
+    Stores uploaded documents once per distinct content
+
+    Uploads are parsed from the request stream as they arrive, written to a
+    temp file off the event loop, size-checked, scanned (when a scanner is
+    given) and SHA-256 hashed on the way, then moved to <hash><suffix>. Identical documents share one file and one
+    record in documents_collection, whose ref_count tracks the listings that
+    reference it and whose uploaders lists the users who uploaded it; only
+    they can attach it to a listing. Unreferenced documents are removed by
+    collect_unreferenced once they have been idle for grace_seconds, which
+    covers uploads that haven't been attached to a listing yet.
+    """
+
+    def __init__(self, documents_collection, root: Path, max_size: int = 10 * 1024 * 1024,
+                 grace_seconds: float = 86400, interval_seconds: float = 3600,
+                 scanner: Optional[UploadScanner] = None):
+        self.documents_collection = documents_collection
+        self.scanner = scanner
+        self.root = Path(root)
+        self.incoming_dir = self.root / ".incoming"
+        self.max_size = max_size
+        self.grace_seconds = grace_seconds
+        self.interval_seconds = interval_seconds
+        self.is_running = False
+        self.incoming_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def content_hash(file_path: str) -> str:
+        """The content hash a stored file is named after"""
+        return Path(file_path).stem
+
+    async def receive_upload(self, request: Request, user_id: str, field: str = "file",
+                             allowed_extensions: Tuple[str, ...] = (".pdf",)) -> Dict[str, Any]:
+        """
+        Stream the named file field of a multipart request into the store, on behalf of user_id
+
+        Raises UploadError for malformed requests, disallowed file types or
+        content rejected by the scanner, and UploadTooLarge as soon as the
+        file passes max_size.
+        """
+        content_length = request.headers.get("content-length")
+        # Multipart framing adds well under 64KB around the file itself
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size + 65536:
+            raise UploadTooLarge(f"File size must be less than {self.max_size // (1024 * 1024)}MB")
+
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise UploadError("Expected a multipart/form-data upload")
+
+        # Parser callbacks only record events; the async work happens between chunks
+        events: List[Tuple[str, Any]] = []
+        part = _UploadPart()
+
+        def on_header_field(data: bytes, start: int, end: int):
+            part.header_field += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int):
+            part.header_value += data[start:end]
+
+        def on_header_end():
+            part.headers[part.header_field.lower()] = part.header_value
+            part.header_field, part.header_value = b"", b""
+
+        def on_headers_finished():
+            _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+            name, filename = options.get(b"name"), options.get(b"filename")
+            part.field_name = name.decode("utf-8", "replace") if name else None
+            part.filename = filename.decode("utf-8", "replace") if filename is not None else None
+            part.content_type = part.headers.get(b"content-type", b"").decode("latin-1") or None
+            events.append(("headers", part))
+
+        def on_part_begin():
+            nonlocal part
+            part = _UploadPart()
+
+        def on_part_data(data: bytes, start: int, end: int):
+            events.append(("data", data[start:end]))
+
+        def on_part_end():
+            events.append(("end", None))
+
+        parser = multipart.MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end
+        })
+
+        incoming: Optional[_IncomingFile] = None
+        receiving = False
+        received: Optional[Dict[str, Any]] = None
+        try:
+            async for chunk in request.stream():
+                try:
+                    parser.write(chunk)
+                except Exception:
+                    raise UploadError("Invalid multipart data")
+                for event, data in events:
+                    if event == "headers":
+                        current = data
+                        receiving = received is None and current.field_name == field and current.filename is not None
+                        if receiving:
+                            if not current.filename.lower().endswith(allowed_extensions):
+                                raise UploadError(f"Only {', '.join(ext.lstrip('.').upper() for ext in allowed_extensions)} files are allowed")
+                            scan = self.scanner.start(Path(current.filename).suffix) if self.scanner else None
+                            incoming = _IncomingFile(self.incoming_dir / uuid.uuid4().hex, scan)
+                    elif event == "data" and receiving:
+                        await incoming.write(data)
+                        if incoming.size > self.max_size:
+                            raise UploadTooLarge(f"File size must be less than {self.max_size // (1024 * 1024)}MB")
+                    elif event == "end" and receiving:
+                        receiving = False
+                        received = {
+                            "filename": current.filename,
+                            "content_type": current.content_type,
+                            "content_hash": await incoming.finish()
+                        }
+                events.clear()
+            parser.finalize()
+
+            if received is None:
+                raise UploadError("No file uploaded")
+            if incoming.size == 0:
+                raise UploadError("Uploaded file is empty")
+
+            suffix = Path(received["filename"]).suffix.lower()
+            document = self._store(incoming, received["content_hash"], suffix, received["content_type"], user_id)
+            incoming = None
+        except UploadRejected as e:
+            raise UploadError(e.detail) from e
+        finally:
+            if incoming is not None:
+                incoming.discard()
+
+        return {**document, "filename": received["filename"]}
+
+    def _store(self, incoming: _IncomingFile, content_hash: str, suffix: str,
+               content_type: Optional[str], user_id: str) -> Dict[str, Any]:
+        """Move a hashed temp file into place, or drop it if the content is already stored"""
+        file_path = f"{content_hash}{suffix}"
+        now = datetime.utcnow()
+        # Touch the record first, so a concurrent collection run leaves it alone
+        result = self.documents_collection.update_one(
+            {"_id": content_hash},
+            {
+                "$setOnInsert": {
+                    "file_path": file_path,
+                    "size": incoming.size,
+                    "content_type": content_type,
+                    "ref_count": 0,
+                    "created_at": now
+                },
+                "$set": {"updated_at": now},
+                "$addToSet": {"uploaders": user_id}
+            },
+            upsert=True
+        )
+
+        target = self.root / file_path
+        deduplicated = result.upserted_id is None and target.exists()
+        if deduplicated:
+            incoming.discard()
+        else:
+            os.replace(incoming.path, target)
+
+        return {
+            "content_hash": content_hash,
+            "file_path": file_path,
+            "file_size": incoming.size,
+            "deduplicated": deduplicated
+        }
+
+    def acquire(self, file_path: Optional[str], user_id: str) -> bool:
+        """
+        Record one more listing referencing a stored document
+
+        Returns False, changing nothing, unless user_id uploaded the
+        document, so clients can't attach documents by guessing hashes.
+        """
+        if not file_path:
+            return True
+        result = self.documents_collection.update_one(
+            {"_id": self.content_hash(file_path), "file_path": file_path, "uploaders": user_id},
+            {"$inc": {"ref_count": 1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        return result.matched_count == 1
+
+    def release(self, file_path: Optional[str]):
+        """Drop one listing reference; unreferenced documents are collected later"""
+        if file_path:
+            self.documents_collection.update_one(
+                {"_id": self.content_hash(file_path)},
+                {"$inc": {"ref_count": -1}, "$set": {"updated_at": datetime.utcnow()}}
+            )
+
+    def _collect(self, document: Dict[str, Any]) -> bool:
+        """
+        Delete one unreferenced document unless it's uploaded or referenced meanwhile
+
+        The file is first moved aside, then the record is deleted only if
+        it's still unreferenced and untouched since it was read. An upload
+        of the same content touches the record before checking for the
+        file, so either the delete fails and the file is put back (unless
+        the upload has already written a new one), or the upload finds no
+        record and writes its own file, which this never touches.
+        """
+        target = self.root / document["file_path"]
+        collected = self.incoming_dir / f"{document['_id']}.{uuid.uuid4().hex}.collected"
+        try:
+            os.rename(target, collected)
+        except FileNotFoundError:
+            # Collected by another worker, or the record outlived its file
+            collected = None
+
+        deleted = self.documents_collection.delete_one(
+            {"_id": document["_id"], "ref_count": {"$lte": 0}, "updated_at": document["updated_at"]}
+        ).deleted_count
+        if collected is not None:
+            # Put back only for a record still there; another worker may have deleted it
+            if not deleted and self.documents_collection.count_documents({"_id": document["_id"]}, limit=1):
+                try:
+                    # Fails rather than replacing a file a new upload has written
+                    os.link(collected, target)
+                except FileExistsError:
+                    pass
+            os.remove(collected)
+        return bool(deleted)
+
+    def collect_unreferenced(self) -> int:
+        """Delete documents no listing has referenced for grace_seconds"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace_seconds)
+        removed = 0
+        for document in self.documents_collection.find(
+            {"ref_count": {"$lte": 0}, "updated_at": {"$lt": cutoff}},
+            {"file_path": 1, "updated_at": 1}
+        ):
+            if self._collect(document):
+                removed += 1
+
+        # Temp files left behind by a worker that died mid-upload or mid-collection
+        for path in self.incoming_dir.iterdir():
+            try:
+                if datetime.utcnow().timestamp() - path.stat().st_mtime > self.grace_seconds:
+                    path.unlink()
+            except OSError:
+                pass
+
+        if removed:
+            logger.info(f"Removed {removed} unreferenced documents")
+        return removed
+
+    async def start_collecting(self):
+        """Periodically remove unreferenced documents"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        logger.info("Starting document collection loop")
+
+        while self.is_running:
+            try:
+                await asyncio.sleep(self.interval_seconds)
+                await run_in_threadpool(self.collect_unreferenced)
+            except Exception as e:
+                logger.error(f"Error collecting unreferenced documents: {e}")
+
+    def stop_collecting(self):
+        self.is_running = False
+        logger.info("Stopped document collection loop")
+
+__all__ = [
+    'DocumentStore',
+    'UploadError',
+    'UploadTooLarge'
+]
@@ -0,0 +1,87 @@
+"""
+Fast JSON Responses
+orjson-based response class and encoder for database documents
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    from bson import ObjectId
+except ImportError:
+    ObjectId = None
+
+def _default(value: Any) -> Any:
+    """Encode the types orjson doesn't handle natively the way jsonable_encoder would"""
+    if ObjectId is not None and isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if hasattr(value, "dict"):
+        return jsonable_encoder(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content: Any) -> bytes:
+    """
+    Serialize content to JSON bytes
+
+    datetime, date, UUID, enums and dataclasses are encoded natively by orjson,
+    matching jsonable_encoder's output. Without orjson this falls back to
+    jsonable_encoder and the standard library.
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+def loads(body: bytes) -> Any:
+    """Parse JSON bytes, raising ValueError on malformed input"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(body)
+    return json.loads(body)
+
+class FastJSONResponse(JSONResponse):
+    """Default response class rendering with orjson"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def trusted_response(content: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> FastJSONResponse:
+    """
+    Return documents read from MongoDB without re-validating them
+
+    Route handlers that return plain dicts have FastAPI walk the whole result
+    with jsonable_encoder (and any response_model) before it's rendered. Data
+    that came straight from the database is already JSON-shaped, so returning
+    this response skips that pass and encodes the documents once with orjson.
+    """
+    return FastJSONResponse(content=content, status_code=status_code, headers=headers)
+
+__all__ = [
+    'FastJSONResponse',
+    'trusted_response',
+    'dumps',
+    'loads',
+    'ORJSON_AVAILABLE'
+]
@@ -0,0 +1,206 @@
+"""
+File Delivery
+Downloads offloaded to nginx, or served with Range and validators
+"""
+
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from http_caching import CachePolicy, etag_matches
+
+# Stored files named after their SHA-256 never change, so the name is the validator
+CONTENT_HASH_NAME = re.compile(r"^[0-9a-f]{64}$")
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into (start, end inclusive)
+
+    Returns None when the whole file should be sent: no header, a header in
+    another unit, or several ranges (which servers may answer in full).
+    Raises RangeNotSatisfiable for ranges outside the file.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[6:].strip()
+    if "," in spec:
+        return None
+
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            # Suffix range: the last N bytes
+            suffix = int(end_text)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+class FileRangeResponse(Response):
+    """
+    Streams a byte range of a file
+
+    A whole file is handed to the server with the ASGI path send extension
+    when the server offers it, as Starlette's FileResponse does; otherwise,
+    and for ranges, the file is read in chunks in the threadpool, so the
+    event loop never blocks on disk. CompressionMiddleware sends the headers
+    ahead of a path send and leaves the file uncompressed.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: Path, offset: int, length: int, headers: Dict[str, str],
+                 media_type: str, status_code: int = 200):
+        self.path = path
+        self.offset = offset
+        self.length = length
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.init_headers({**headers, "content-length": str(length)})
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if self.status_code == 200 and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        file = await run_in_threadpool(open, self.path, "rb")
+        try:
+            await run_in_threadpool(file.seek, self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await run_in_threadpool(file.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank while being sent
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await run_in_threadpool(file.close)
+
+class FileDelivery:
+    """
+    Serves files from one directory without tying up a worker for the transfer
+
+    With accel_prefix set, responses carry an X-Accel-Redirect to an internal
+    nginx location mapped onto root, and nginx streams the file with sendfile
+    and handles Range and validators itself. Without it, files are served by
+    FileRangeResponse with ETag/Last-Modified, If-None-Match/If-Modified-Since,
+    single Range requests and If-Range.
+    """
+
+    def __init__(self, root: Path, policy: CachePolicy, accel_prefix: Optional[str] = None):
+        self.root = Path(root).resolve()
+        self.policy = policy
+        self.accel_prefix = accel_prefix.rstrip("/") + "/" if accel_prefix else None
+
+    def resolve(self, name: str) -> Path:
+        """Map a requested file name to a file inside root, or 404"""
+        path = (self.root / name).resolve()
+        if path.parent != self.root or not path.is_file():
+            raise HTTPException(status_code=404, detail="File not found")
+        return path
+
+    @staticmethod
+    def _etag(path: Path, stat: os.stat_result) -> str:
+        if CONTENT_HASH_NAME.match(path.stem):
+            return f'"{path.stem}"'
+        return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+    def respond(self, request: Request, name: str, media_type: str,
+                download_name: Optional[str] = None) -> Response:
+        path = self.resolve(name)
+        disposition = f"attachment; filename=\"{download_name or path.name}\""
+
+        if self.accel_prefix:
+            return Response(
+                media_type=media_type,
+                headers={
+                    "X-Accel-Redirect": self.accel_prefix + quote(path.name),
+                    "Content-Disposition": disposition,
+                    "Cache-Control": self.policy.header
+                }
+            )
+
+        stat = path.stat()
+        etag = self._etag(path, stat)
+        last_modified = formatdate(stat.st_mtime, usegmt=True)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": last_modified,
+            "Cache-Control": self.policy.header,
+            "Accept-Ranges": "bytes",
+            "Content-Disposition": disposition
+        }
+
+        if self._not_modified(request, etag, stat.st_mtime):
+            return Response(status_code=304, headers={
+                key: headers[key] for key in ("ETag", "Last-Modified", "Cache-Control")
+            })
+
+        size = stat.st_size
+        range_header = request.headers.get("range")
+        if range_header and not self._if_range_matches(request.headers.get("if-range"), etag, last_modified):
+            range_header = None
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}", "Accept-Ranges": "bytes"})
+
+        if byte_range is None:
+            return FileRangeResponse(path, 0, size, headers, media_type)
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return FileRangeResponse(path, start, end - start + 1, headers, media_type, status_code=206)
+
+    @staticmethod
+    def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def _if_range_matches(if_range: Optional[str], etag: str, last_modified: str) -> bool:
+        """If-Range needs a strong ETag match or the exact Last-Modified date"""
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            return if_range == etag
+        return if_range == last_modified
+
+__all__ = [
+    'FileDelivery',
+    'FileRangeResponse',
+    'parse_range'
+]
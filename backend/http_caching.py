@@ -0,0 +1,252 @@
+"""
+HTTP Caching
+ETag validators and Cache-Control policies for public read endpoints
+"""
+
+import gzip
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from fast_json import dumps
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+class CachePolicy:
+    """Cache-Control settings for one kind of response"""
+
+    def __init__(self, max_age: int, stale_while_revalidate: int = 0, public: bool = True,
+                 immutable: bool = False):
+        self.max_age = max_age
+        self.stale_while_revalidate = stale_while_revalidate
+        directives = ["public" if public else "private", f"max-age={max_age}"]
+        if stale_while_revalidate:
+            directives.append(f"stale-while-revalidate={stale_while_revalidate}")
+        if immutable:
+            directives.append("immutable")
+        self.header = ", ".join(directives)
+
+# Browsers and nginx may reuse a response for max-age seconds, then serve it
+# while revalidating in the background for stale-while-revalidate seconds
+CACHE_POLICIES = {
+    "listings": CachePolicy(max_age=30, stale_while_revalidate=120),
+    "stats": CachePolicy(max_age=60, stale_while_revalidate=300),
+    "market_data": CachePolicy(max_age=15, stale_while_revalidate=60),
+    "plans": CachePolicy(max_age=3600, stale_while_revalidate=86400),
+    "blog": CachePolicy(max_age=300, stale_while_revalidate=3600),
+    "products": CachePolicy(max_age=300, stale_while_revalidate=3600),
+    "market_intelligence": CachePolicy(max_age=300, stale_while_revalidate=3600),
+    "seo": CachePolicy(max_age=3600, stale_while_revalidate=86400),
+    "robots": CachePolicy(max_age=86400),
+    # Stored documents never change under the same name
+    "documents": CachePolicy(max_age=31536000, immutable=True)
+}
+
+def render_json(content: Any) -> bytes:
+    """Serialize content like the app's default response class"""
+    return dumps(content)
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+def version_etag(*parts: Any) -> str:
+    """Strong ETag derived from a data version and the parameters selecting the data"""
+    return f'"v-{hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header using weak comparison (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque_tag = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque_tag:
+            return True
+    return False
+
+def _cache_headers(etag: str, policy: CachePolicy) -> Dict[str, str]:
+    return {"ETag": etag, "Cache-Control": policy.header}
+
+def not_modified(etag: str, policy: CachePolicy) -> Response:
+    return Response(status_code=304, headers=_cache_headers(etag, policy))
+
+def conditional_response(request: Request, content: Any, policy: CachePolicy,
+                         etag: Optional[str] = None) -> Response:
+    """
+    Serve JSON content with validators, or 304 if the client's copy is current
+
+    The ETag is computed from the rendered body unless one is given.
+    """
+    body = render_json(content)
+    etag = etag or content_etag(body)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, policy)
+    return Response(content=body, media_type="application/json", headers=_cache_headers(etag, policy))
+
+async def versioned_response(request: Request, policy: CachePolicy, etag: str,
+                             build: Callable[[], Any]) -> Response:
+    """
+    Serve content validated by a data-version ETag
+
+    A matching If-None-Match is answered with 304 before the content is built,
+    so unchanged pages skip the query and serialization entirely. Only use this
+    for data whose every write bumps the version.
+    """
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, policy)
+
+    content = build()
+    if inspect.isawaitable(content):
+        content = await content
+    return Response(content=render_json(content), media_type="application/json",
+                    headers=_cache_headers(etag, policy))
+
+def parse_accept_encoding(accept_encoding: Optional[str]) -> Dict[str, float]:
+    """Map each content coding in an Accept-Encoding header to its q-value"""
+    weights = {}
+    for item in (accept_encoding or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[coding] = quality
+    return weights
+
+def choose_encoding(accept_encoding: Optional[str], available: Tuple[str, ...] = ("br", "gzip")) -> str:
+    """Pick the best available content coding the client accepts, falling back to identity"""
+    weights = parse_accept_encoding(accept_encoding)
+    best, best_quality = "identity", 0.0
+    for coding in available:
+        quality = weights.get(coding, weights.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+class PrebuiltResponse(Response):
+    """Response whose body and raw headers were built ahead of time"""
+
+    def __init__(self, body: bytes, raw_headers: List[Tuple[bytes, bytes]], status_code: int = 200):
+        self.status_code = status_code
+        self.background = None
+        self.body = body
+        # Copied because middleware may still add headers
+        self.raw_headers = list(raw_headers)
+
+class PrebuiltPayload:
+    """
+    An immutable response encoded and compressed once
+
+    Keeps identity, gzip and (when available) brotli bodies with their raw
+    headers, so serving it only picks a variant and writes the buffer.
+    """
+
+    def __init__(self, body: bytes, media_type: str, policy: CachePolicy):
+        self.etag = content_etag(body)
+        cache_control = policy.header.encode("latin-1")
+
+        bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if BROTLI_AVAILABLE:
+            bodies["br"] = brotli.compress(body, quality=11)
+        # coding -> (body, response headers, 304 headers, ETag)
+        self.variants = {}
+        for coding, encoded in bodies.items():
+            # Compressed variants are only worth sending when they are smaller
+            if coding != "identity" and len(encoded) >= len(body):
+                continue
+            # Each encoding is a different representation, so it gets its own strong ETag
+            etag = self.etag if coding == "identity" else f'{self.etag[:-1]}-{coding}"'
+            validators = [
+                (b"etag", etag.encode("latin-1")),
+                (b"cache-control", cache_control),
+                (b"vary", b"Accept-Encoding")
+            ]
+            headers = validators + [
+                (b"content-type", media_type.encode("latin-1")),
+                (b"content-length", str(len(encoded)).encode("latin-1"))
+            ]
+            if coding != "identity":
+                headers.append((b"content-encoding", coding.encode("latin-1")))
+            self.variants[coding] = (encoded, headers, validators, etag)
+        self.codings = tuple(coding for coding in ("br", "gzip") if coding in self.variants)
+
+    @classmethod
+    def json(cls, content: Any, policy: CachePolicy) -> "PrebuiltPayload":
+        return cls(render_json(content), "application/json", policy)
+
+    @classmethod
+    def text(cls, content: str, policy: CachePolicy, media_type: str = "text/plain; charset=utf-8") -> "PrebuiltPayload":
+        return cls(content.encode("utf-8"), media_type, policy)
+
+    def respond(self, request: Request) -> Response:
+        coding = choose_encoding(request.headers.get("accept-encoding"), self.codings)
+        body, headers, validators, etag = self.variants[coding]
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return PrebuiltResponse(b"", validators, status_code=304)
+        return PrebuiltResponse(body, headers)
+
+class PrebuiltPayloadCache:
+    """
+    Bounded map of prebuilt payloads for content selected by request parameters
+
+    Each distinct parameter combination is built once; the least recently
+    used combinations are dropped past max_entries.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._payloads: "OrderedDict[Any, PrebuiltPayload]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Any, build: Callable[[], PrebuiltPayload]) -> PrebuiltPayload:
+        with self._lock:
+            payload = self._payloads.get(key)
+            if payload is not None:
+                self._payloads.move_to_end(key)
+                return payload
+
+        payload = build()
+        with self._lock:
+            self._payloads[key] = payload
+            while len(self._payloads) > self.max_entries:
+                self._payloads.popitem(last=False)
+        return payload
+
+    def clear(self):
+        """Drop every payload, e.g. after the underlying content changed"""
+        with self._lock:
+            self._payloads.clear()
+
+__all__ = [
+    'CachePolicy',
+    'CACHE_POLICIES',
+    'conditional_response',
+    'versioned_response',
+    'version_etag',
+    'content_etag',
+    'etag_matches',
+    'choose_encoding',
+    'PrebuiltPayload',
+    'PrebuiltPayloadCache',
+    'PrebuiltResponse'
+]
@@ -4,13 +4,23 @@ Addresses OWASP A03: Injection Vulnerabilities
 """
 
 from fastapi import HTTPException, Request
-from typing import Any, Dict, List, Union
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from typing import Any, Callable, Dict, List, Optional, Union, get_args, get_origin
+import email.message
+import os
 import re
 import html
 import json
-from datetime import datetime
+import types
+from datetime import date, datetime, time
+from decimal import Decimal
+from enum import Enum
 import logging
 
+from fast_json import FastJSONResponse, dumps, loads
+from upload_scanner import UploadRejected, iter_chunks, upload_scanner
+
 logger = logging.getLogger(__name__)
 
 class MongoSanitizer:
@@ -34,6 +44,9 @@ class MongoSanitizer:
         """
         Sanitize MongoDB query to prevent injection attacks
         
+        Walks any dictionary generically; for documents of a known shape use
+        compile() instead.
+        
         Args:
             query: The query dictionary to sanitize
             allow_operators: List of operators to allow (default: none)
@@ -54,41 +67,82 @@ class MongoSanitizer:
                     logger.warning(f"Blocked dangerous MongoDB operator: {key}")
                     continue
             
-            # Recursively sanitize nested dictionaries
-            if isinstance(value, dict):
-                sanitized_value = cls.sanitize_query(value, allow_operators)
-                if sanitized_value:  # Only add if not empty
-                    sanitized[key] = sanitized_value
-            elif isinstance(value, list):
-                # Sanitize list items
-                sanitized_list = []
-                for item in value:
-                    if isinstance(item, dict):
-                        sanitized_item = cls.sanitize_query(item, allow_operators)
-                        if sanitized_item:
-                            sanitized_list.append(sanitized_item)
-                    elif isinstance(item, str):
-                        sanitized_list.append(cls._sanitize_string_value(item))
-                    else:
-                        sanitized_list.append(item)
-                sanitized[key] = sanitized_list
-            elif isinstance(value, str):
-                sanitized[key] = cls._sanitize_string_value(value)
-            else:
+            value = cls._sanitize_value(value, allow_operators)
+            if value is not _DROP:
                 sanitized[key] = value
         
         return sanitized
     
+    @classmethod
+    def _sanitize_value(cls, value: Any, allow_operators: List[str] = None) -> Any:
+        """Sanitize one value of any type, returning _DROP for dictionaries left empty"""
+        # Recursively sanitize nested dictionaries
+        if isinstance(value, dict):
+            sanitized_value = cls.sanitize_query(value, allow_operators)
+            return sanitized_value if sanitized_value else _DROP  # Only add if not empty
+        if isinstance(value, list):
+            # Sanitize list items
+            sanitized_list = []
+            for item in value:
+                if isinstance(item, dict):
+                    sanitized_item = cls.sanitize_query(item, allow_operators)
+                    if sanitized_item:
+                        sanitized_list.append(sanitized_item)
+                elif isinstance(item, str):
+                    sanitized_list.append(cls._sanitize_string_value(item))
+                else:
+                    sanitized_list.append(item)
+            return sanitized_list
+        if isinstance(value, str):
+            return cls._sanitize_string_value(value)
+        return value
+    
+    @classmethod
+    def compile(cls, schema: Any, allow_operators: List[str] = None,
+                extra: Optional[Dict[str, Any]] = None, exempt: Any = ()) -> "CompiledSanitizer":
+        """
+        Build a sanitizer specialized for one document shape
+        
+        Args:
+            schema: A Pydantic model class, or a query template mapping field
+                names to types (e.g. {"user_id": str})
+            allow_operators: List of operators to allow in fields outside the schema
+            extra: Additional field types, e.g. for server-generated fields
+            exempt: String fields passed through unchanged
+        
+        Returns:
+            A CompiledSanitizer to reuse for every document of that shape
+        """
+        return CompiledSanitizer(schema, allow_operators, extra, exempt)
+    
+    # Hashed before storage and never used in a query, so stripping
+    # characters would only change the user's password
+    BODY_EXEMPT_FIELDS = {'password', 'new_password', 'current_password'}
+    
+    @classmethod
+    def sanitize_body(cls, data: Any) -> Any:
+        """Sanitize a parsed JSON request body of any shape"""
+        if isinstance(data, list):
+            return [cls.sanitize_body(item) for item in data]
+        if isinstance(data, dict):
+            exempt = {key: data[key] for key in cls.BODY_EXEMPT_FIELDS if isinstance(data.get(key), str)}
+            sanitized = cls.sanitize_query(data)
+            sanitized.update(exempt)
+            return sanitized
+        if isinstance(data, str):
+            return cls._sanitize_string_value(data)
+        return data
+    
     @staticmethod
     def _sanitize_string_value(value: str) -> str:
         """Sanitize string values to prevent injection"""
         if not isinstance(value, str):
             return value
         
-        # Remove potentially dangerous characters
-        dangerous_chars = ['$', '{', '}', '\\', '\x00']
-        for char in dangerous_chars:
-            value = value.replace(char, '')
+        # Remove potentially dangerous characters in a single pass; most values
+        # have none, and the substring checks are much cheaper than translate
+        if '$' in value or '{' in value or '}' in value or '\\' in value or '\x00' in value:
+            value = value.translate(_DANGEROUS_CHARS_TABLE)
         
         # Limit length to prevent DoS
         if len(value) > 1000:
@@ -96,6 +150,129 @@ class MongoSanitizer:
         
         return value.strip()
 
+# Characters removed from string values: '$', '{', '}', '\\' and NUL
+_DANGEROUS_CHARS_TABLE = str.maketrans('', '', '${}\\\x00')
+
+# Returned by value sanitizers for nested documents that end up empty
+_DROP = object()
+
+# Values of these types can't carry operators or dangerous characters
+_SCALAR_TYPES = (int, float, bool, datetime, date, time, Decimal, Enum)
+
+_UNION_TYPES = tuple(t for t in (Union, getattr(types, "UnionType", None)) if t is not None)
+
+class CompiledSanitizer:
+    """
+    MongoSanitizer specialized for one document shape
+    
+    The schema is analysed once into a handler per field: strings are cleaned
+    with a single str.translate, scalars pass through, lists and nested
+    models use their item handlers. Values that don't match their declared
+    type, and fields outside the schema, fall back to the generic recursive
+    sanitizer, so the output is always at least as strict.
+    """
+    
+    def __init__(self, schema: Any, allow_operators: List[str] = None,
+                 extra: Optional[Dict[str, Any]] = None, exempt: Any = ()):
+        self.allow_operators = allow_operators
+        self._allowed_ops = set(allow_operators or [])
+        fields = dict(_schema_fields(schema))
+        fields.update(extra or {})
+        self._handlers: Dict[str, Callable[[Any], Any]] = {
+            name: self._passthrough_string if name in exempt else self._compile_type(annotation)
+            for name, annotation in fields.items()
+        }
+    
+    def sanitize(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        """Sanitize one document in a single pass"""
+        if not isinstance(document, dict):
+            return {}
+        
+        handlers = self._handlers
+        sanitized = {}
+        for key, value in document.items():
+            handler = handlers.get(key)
+            if handler is None:
+                # Block dangerous operators unless explicitly allowed
+                if isinstance(key, str) and key.startswith('$') and key not in self._allowed_ops:
+                    logger.warning(f"Blocked dangerous MongoDB operator: {key}")
+                    continue
+                handler = self._generic
+            value = handler(value)
+            if value is not _DROP:
+                sanitized[key] = value
+        return sanitized
+    
+    def sanitize_body(self, data: Any) -> Any:
+        """Sanitize a parsed JSON request body, generically unless it's a document"""
+        if isinstance(data, dict):
+            return self.sanitize(data)
+        return MongoSanitizer.sanitize_body(data)
+    
+    def _generic(self, value: Any) -> Any:
+        return MongoSanitizer._sanitize_value(value, self.allow_operators)
+    
+    def _passthrough_string(self, value: Any) -> Any:
+        return value if isinstance(value, str) else self._generic(value)
+    
+    def _compile_type(self, annotation: Any) -> Callable[[Any], Any]:
+        """Build the value handler for one type annotation"""
+        origin = get_origin(annotation)
+        args = get_args(annotation)
+        generic = self._generic
+        
+        if origin in _UNION_TYPES:
+            # Optional[X] is handled as X; None falls through to the generic path
+            members = [arg for arg in args if arg is not type(None)]
+            return self._compile_type(members[0]) if len(members) == 1 else generic
+        
+        if origin in (list, set, tuple, frozenset) and len(args) == 1:
+            item_handler = self._compile_type(args[0])
+            
+            def sanitize_list(value):
+                if not isinstance(value, list):
+                    return generic(value)
+                sanitized_list = []
+                for item in value:
+                    item = item_handler(item)
+                    if item is not _DROP:
+                        sanitized_list.append(item)
+                return sanitized_list
+            
+            return sanitize_list
+        
+        if not isinstance(annotation, type):
+            return generic
+        
+        if issubclass(annotation, str):
+            # Includes str-based enums
+            clean = MongoSanitizer._sanitize_string_value
+            return lambda value: clean(value) if isinstance(value, str) else generic(value)
+        
+        if issubclass(annotation, _SCALAR_TYPES):
+            return lambda value: value if isinstance(value, _SCALAR_TYPES) or value is None else generic(value)
+        
+        if issubclass(annotation, BaseModel):
+            nested = CompiledSanitizer(annotation, self.allow_operators)
+            
+            def sanitize_model(value):
+                if not isinstance(value, dict):
+                    return generic(value)
+                # Only add if not empty, like the generic sanitizer
+                return nested.sanitize(value) or _DROP
+            
+            return sanitize_model
+        
+        return generic
+
+def _schema_fields(schema: Any) -> List[tuple]:
+    """(JSON field name, annotation) pairs of a Pydantic model or query template"""
+    if isinstance(schema, dict):
+        return list(schema.items())
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        return [(field.alias or name, field.annotation) for name, field in schema.model_fields.items()]
+    raise TypeError(f"Cannot compile a sanitizer for {schema!r}")
+
 class InputValidator:
     """
     Enhanced input validation for trading platform
@@ -274,15 +451,7 @@ class FileUploadValidator:
     ALLOWED_EXTENSIONS = {'.pdf', '.jpg', '.jpeg', '.png', '.doc', '.docx'}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
     
-    # File signature validation
-    FILE_SIGNATURES = {
-        '.pdf': [b'%PDF'],
-        '.jpg': [b'\xff\xd8\xff'],
-        '.jpeg': [b'\xff\xd8\xff'],
-        '.png': [b'\x89PNG\r\n\x1a\n'],
-        '.doc': [b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'],
-        '.docx': [b'PK\x03\x04']
-    }
+    # Magic numbers and content signatures live in the upload scanner's rules file
     
     @classmethod
     def validate_upload(cls, file_content: bytes, filename: str, content_type: str) -> bool:
@@ -338,21 +507,7 @@ class FileUploadValidator:
                     detail="File content type doesn't match extension"
                 )
         
-        # Validate file signature (magic bytes)
-        if file_ext in cls.FILE_SIGNATURES:
-            valid_signature = False
-            for signature in cls.FILE_SIGNATURES[file_ext]:
-                if file_content.startswith(signature):
-                    valid_signature = True
-                    break
-            
-            if not valid_signature:
-                raise HTTPException(
-                    status_code=400,
-                    detail="File appears to be corrupted or malicious"
-                )
-        
-        # Additional security checks
+        # Validate file signature (magic bytes) and scan for malicious content
         cls._scan_for_malicious_content(file_content, file_ext)
         
         return True
@@ -377,51 +532,188 @@ class FileUploadValidator:
     
     @staticmethod
     def _scan_for_malicious_content(file_content: bytes, file_ext: str):
-        """Basic malicious content detection"""
-        
-        # Check for embedded scripts or executables
-        malicious_patterns = [
-            b'<script',
-            b'javascript:',
-            b'vbscript:',
-            b'onload=',
-            b'onerror=',
-            b'\x4d\x5a',  # PE executable header
-            b'\x50\x4b\x05\x06',  # ZIP end signature (could be malicious archive)
-        ]
-        
-        content_lower = file_content.lower()
-        for pattern in malicious_patterns:
-            if pattern in content_lower:
-                logger.warning(f"Malicious pattern detected in file: {pattern}")
-                raise HTTPException(
-                    status_code=400,
-                    detail="File contains potentially malicious content"
-                )
+        """Check magic bytes and signatures in one chunked pass over the content"""
+        try:
+            upload_scanner.scan(iter_chunks(file_content), file_ext)
+        except UploadRejected as e:
+            raise HTTPException(status_code=400, detail=e.detail)
 
 # Middleware for automatic request sanitization
-async def sanitize_request_middleware(request: Request, call_next):
+
+# Request state key holding the parsed JSON body
+SANITIZED_BODY_KEY = "sanitized_json"
+
+MAX_JSON_BODY_SIZE = int(os.environ.get('MAX_JSON_BODY_SIZE', 1024 * 1024))
+
+def _is_json_content_type(content_type: Optional[str]) -> bool:
+    """application/json or any application/*+json type, like FastAPI's body parsing"""
+    if not content_type:
+        return False
+    message = email.message.Message()
+    message["content-type"] = content_type
+    subtype = message.get_content_subtype()
+    return message.get_content_maintype() == "application" and (subtype == "json" or subtype.endswith("+json"))
+
+class ParsedBody:
+    """A parsed JSON request body, sanitized exactly once on first use"""
+    
+    def __init__(self, document: Any, raw: bytes):
+        self.raw = raw
+        self._document = document
+        self._sanitized = False
+        self._encoded: Optional[bytes] = None
+    
+    def document(self, sanitizer: Optional[CompiledSanitizer] = None) -> Any:
+        """The sanitized body, using the route's compiled sanitizer when given"""
+        if not self._sanitized:
+            if sanitizer is not None:
+                self._document = sanitizer.sanitize_body(self._document)
+            else:
+                self._document = MongoSanitizer.sanitize_body(self._document)
+            self._sanitized = True
+        return self._document
+    
+    def encoded(self, sanitizer: Optional[CompiledSanitizer] = None) -> bytes:
+        """The sanitized body as JSON bytes"""
+        if self._encoded is None:
+            self._encoded = dumps(self.document(sanitizer))
+        return self._encoded
+
+class SanitizeRequestMiddleware:
     """
-    Middleware to automatically sanitize incoming requests
+    ASGI middleware parsing and sanitizing JSON request bodies once
+    
+    The body is read up to max_body_size (413 beyond it), parsed and stored
+    in the request state as a ParsedBody. Downstream receives the sanitized
+    document instead of the raw bytes: routes using SanitizedRoute sanitize
+    the parsed object with a sanitizer compiled for their body model and
+    read it directly, anything else reads it generically sanitized and
+    re-encoded. Malformed JSON is passed through untouched so
+    FastAPI still answers with its usual validation error.
+    """
+    
+    def __init__(self, app, max_body_size: int = MAX_JSON_BODY_SIZE):
+        self.app = app
+        self.max_body_size = max_body_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        content_type = None
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"content-type":
+                content_type = value.decode("latin-1")
+            elif name == b"content-length":
+                content_length = value
+        if not _is_json_content_type(content_type):
+            await self.app(scope, receive, send)
+            return
+        
+        # Reject oversized bodies before reading them when the size is declared
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._body_too_large(scope, receive, send)
+            return
+        
+        chunks = []
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_size:
+                await self._body_too_large(scope, receive, send)
+                return
+            chunks.append(chunk)
+            more_body = message.get("more_body", False)
+        body = b"".join(chunks)
+        
+        if body:
+            try:
+                parsed = ParsedBody(loads(body), body)
+            except ValueError:
+                pass
+            else:
+                scope.setdefault("state", {})[SANITIZED_BODY_KEY] = parsed
+                # Routes using SanitizedRoute never receive the body; only
+                # encoded if something else reads it from the ASGI stream
+                body = None
+        
+        body_sent = False
+        
+        async def sanitized_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            payload = body if body is not None else scope["state"][SANITIZED_BODY_KEY].encoded()
+            return {"type": "http.request", "body": payload, "more_body": False}
+        
+        await self.app(scope, sanitized_receive, send)
+    
+    @staticmethod
+    async def _body_too_large(scope, receive, send):
+        response = FastJSONResponse(
+            {"detail": "Request body too large"},
+            status_code=413,
+            headers={"Connection": "close"}
+        )
+        await response(scope, receive, send)
+
+class SanitizedRequest(Request):
+    """
+    Request reading the body already parsed by SanitizeRequestMiddleware
+    
+    json() is the sanitized document. body() is the raw bytes as received
+    (already size-checked by the middleware): FastAPI reads body() before
+    json() on every request, and re-encoding the sanitized document there
+    would cost as much as the parse it saves. Code validating the body must
+    use json().
     """
-    try:
-        # Only process JSON requests
-        if request.headers.get('content-type') == 'application/json':
-            body = await request.body()
-            if body:
-                try:
-                    data = json.loads(body)
-                    # Sanitize the request data
-                    if isinstance(data, dict):
-                        sanitized_data = MongoSanitizer.sanitize_query(data)
-                        # Note: In a real implementation, you'd need to modify the request body
-                        # This is a simplified example
-                except json.JSONDecodeError:
-                    pass
-        
-        response = await call_next(request)
-        return response
-    
-    except Exception as e:
-        logger.error(f"Error in sanitization middleware: {e}")
-        raise HTTPException(status_code=500, detail="Request processing error")
\ No newline at end of file
+    
+    def __init__(self, scope, receive, sanitizer: Optional[CompiledSanitizer] = None):
+        super().__init__(scope, receive)
+        self.sanitizer = sanitizer
+    
+    def _parsed_body(self) -> Optional[ParsedBody]:
+        return (self.scope.get("state") or {}).get(SANITIZED_BODY_KEY)
+    
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            parsed = self._parsed_body()
+            self._body = parsed.raw if parsed else await super().body()
+        return self._body
+    
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            parsed = self._parsed_body()
+            self._json = parsed.document(self.sanitizer) if parsed else await super().json()
+        return self._json
+
+class SanitizedRoute(APIRoute):
+    """
+    Route class handing FastAPI the sanitized body instead of parsing it again
+    
+    A sanitizer is compiled once per route from its body model.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        body_type = getattr(self.body_field, "type_", None)
+        if isinstance(body_type, type) and issubclass(body_type, BaseModel):
+            self.body_sanitizer = MongoSanitizer.compile(body_type, exempt=MongoSanitizer.BODY_EXEMPT_FIELDS)
+        else:
+            self.body_sanitizer = None
+    
+    def get_route_handler(self) -> Callable:
+        original_handler = super().get_route_handler()
+        
+        async def sanitized_route_handler(request: Request):
+            return await original_handler(SanitizedRequest(request.scope, request.receive, self.body_sanitizer))
+        
+        return sanitized_route_handler
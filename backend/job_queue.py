@@ -0,0 +1,436 @@
+"""
+Job Queue
+Bounded, per-user limited job execution in a process pool
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import pickle
+import signal
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from pymongo import MongoClient
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+TIMED_OUT = "timed_out"
+
+FINISHED_STATUSES = (COMPLETED, FAILED, TIMED_OUT)
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# Server processes sharing the machine (uvicorn --workers reads the same variable)
+SERVER_PROCESSES = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+
+# MongoDB connection
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = MongoClient(MONGO_URL)
+db = client.oil_gas_finder
+
+class JobTimeout(Exception):
+    """A job ran past its time limit"""
+
+class JobRejected(Exception):
+    """The queue can't take the job right now"""
+
+    def __init__(self, detail: str, status_code: int = 503):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+def _call_with_deadline(fn: Callable, timeout: float, args: tuple) -> Any:
+    """
+    Runs in a worker process: call fn, interrupting it after timeout seconds
+
+    Pool tasks run on the worker's main thread, so SIGALRM can interrupt
+    Python-level work such as page extraction or waiting on tesseract.
+    """
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    except Exception as e:
+        # An exception the server can't unpickle would break the whole pool
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            raise RuntimeError(str(e)) from None
+        raise
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class Job:
+    """One submitted job and, once it finishes, its result or error"""
+
+    def __init__(self, owner: str, fn: Optional[Callable], args: tuple,
+                 on_complete: Optional[Callable[["Job"], None]] = None):
+        self.job_id = uuid.uuid4().hex
+        self.owner = owner
+        self.fn = fn
+        self.args = args
+        self.on_complete = on_complete
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.submitted_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self._done = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    async def wait(self) -> "Job":
+        """Wait until the job has finished"""
+        await self._done.wait()
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "submitted_at": self.submitted_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "result": self.result,
+            "error": self.error
+        }
+
+class JobStore:
+    """
+    Job statuses and results shared by every server process
+
+    The queue lives in the process a job was submitted to, but requests
+    polling or watching the job may reach any worker, so each status change
+    is written to jobs_collection under the job id, along with its owner so
+    the per-owner limit covers every process. Records expire through the
+    TTL index on expires_at; jobs of a process that died count against
+    their owner until then.
+    """
+
+    def __init__(self, jobs_collection, ttl_seconds: float = 3600):
+        self.jobs_collection = jobs_collection
+        self.ttl_seconds = ttl_seconds
+
+    def save(self, job: "Job"):
+        try:
+            self.jobs_collection.replace_one(
+                {"_id": job.job_id},
+                {
+                    **job.to_dict(),
+                    "owner": job.owner,
+                    "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Could not save status of job {job.job_id}: {e}")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's last saved status, as Job.to_dict() returns it"""
+        return self.jobs_collection.find_one({"_id": job_id}, {"_id": 0, "owner": 0, "expires_at": 0})
+
+    def active_count(self, owner: str) -> Optional[int]:
+        """Jobs of the owner queued or running in any process; None if the store can't be read"""
+        try:
+            return self.jobs_collection.count_documents({"owner": owner, "status": {"$in": list(ACTIVE_STATUSES)}})
+        except Exception as e:
+            logger.error(f"Could not count active jobs of {owner}: {e}")
+            return None
+
+    def discard(self, job_id: str):
+        try:
+            self.jobs_collection.delete_one({"_id": job_id})
+        except Exception as e:
+            logger.error(f"Could not discard job {job_id}: {e}")
+
+class JobQueue:
+    """
+    Runs CPU-bound jobs in a process pool, off the event loop
+
+    Jobs wait in a queue of at most max_queue_size; submissions beyond that
+    are rejected rather than piling up. Each owner may have per_owner_limit
+    jobs queued or running at once, so one user can't fill the queue; with a
+    store, that counts the owner's jobs in every server process. The queue
+    and the worker pool belong to this process, so their sizes are per
+    server process. A job
+    is interrupted in its worker after timeout seconds; if the worker doesn't
+    respond, the job is still reported as timed out a few seconds later.
+    Finished jobs are kept for result_ttl seconds for polling; with a
+    store, their status can be polled from any server process.
+
+    A job function may also be a coroutine function. It then runs in this
+    process and is passed run_in_pool as its first argument, so it can
+    spread its work over several workers and stop early; the timeout
+    applies to the job as a whole.
+    """
+
+    # Extra time the worker gets to honour its own deadline
+    TIMEOUT_GRACE_SECONDS = 5
+
+    def __init__(self, max_workers: int = 2, max_queue_size: int = 100, per_owner_limit: int = 3,
+                 timeout: float = 60, result_ttl: float = 3600, store: Optional[JobStore] = None,
+                 poll_interval: float = 0.5):
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.per_owner_limit = per_owner_limit
+        self.timeout = timeout
+        self.result_ttl = result_ttl
+        self.store = store
+        self.poll_interval = poll_interval
+        self.jobs: Dict[str, Job] = {}
+        self.is_running = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._active_by_owner: Dict[str, int] = {}
+        self._running = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "timed_out": 0,
+            "completed_without_running": 0,
+            "rejected_queue_full": 0,
+            "rejected_owner_limit": 0,
+            "max_queue_depth": 0,
+            "wait_seconds": 0.0,
+            "run_seconds": 0.0
+        }
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned workers don't inherit the server's threads, locks or sockets
+        return ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def submit(self, owner: str, fn: Callable, *args,
+               on_complete: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        Queue fn(*args) to run in a worker process
+
+        fn and args must be picklable, unless fn is a coroutine function
+        (see the class docstring); on_complete is called in this process
+        with the job once it has finished. Raises JobRejected when the queue
+        is full or the owner already has per_owner_limit jobs in flight.
+        """
+        if not self.is_running:
+            raise JobRejected("Analysis service is not running")
+        self._expire_finished()
+
+        if self._active_by_owner.get(owner, 0) >= self.per_owner_limit:
+            self._stats["rejected_owner_limit"] += 1
+            raise JobRejected(
+                f"You already have {self.per_owner_limit} analyses in progress. Please wait for one to finish.",
+                status_code=429
+            )
+        if self._queue.full():
+            self._stats["rejected_queue_full"] += 1
+            raise JobRejected("Analysis queue is full. Please try again shortly.")
+
+        job = Job(owner, fn, args, on_complete)
+        if self.store is not None:
+            # Recorded before counting, so concurrent submissions in other processes see each other
+            self.store.save(job)
+            active = self.store.active_count(owner)
+            if active is not None and active > self.per_owner_limit:
+                self.store.discard(job.job_id)
+                self._stats["rejected_owner_limit"] += 1
+                raise JobRejected(
+                    f"You already have {self.per_owner_limit} analyses in progress. Please wait for one to finish.",
+                    status_code=429
+                )
+        self._queue.put_nowait(job)
+        self.jobs[job.job_id] = job
+        self._active_by_owner[owner] = self._active_by_owner.get(owner, 0) + 1
+        self._stats["submitted"] += 1
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+        return job
+
+    def complete(self, owner: str, result: Any) -> Job:
+        """Register a job whose result is already known (e.g. cached), so it can be polled like any other"""
+        self._expire_finished()
+        job = Job(owner, None, ())
+        job.status, job.result = COMPLETED, result
+        job.started_at = job.finished_at = job.submitted_at
+        job._done.set()
+        self.jobs[job.job_id] = job
+        self._stats["completed_without_running"] += 1
+        self._save(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job submitted to this process"""
+        return self.jobs.get(job_id)
+
+    def _save(self, job: Job):
+        if self.store is not None:
+            self.store.save(job)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's status, whichever server process it was submitted to"""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self.store.get(job_id) if self.store is not None else None
+
+    async def wait_status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Wait until a job has finished and return its status
+
+        Jobs of other processes are polled in the store every
+        poll_interval seconds. Returns None if the job is unknown or its
+        record expires first, e.g. because its process died.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return (await job.wait()).to_dict()
+        while True:
+            status = self.status(job_id)
+            if status is None or status["status"] in FINISHED_STATUSES:
+                return status
+            await asyncio.sleep(self.poll_interval)
+
+    async def run_in_pool(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in a worker process, within the job time limit"""
+        pool = self._pool
+        try:
+            return await asyncio.wrap_future(pool.submit(_call_with_deadline, fn, self.timeout, args))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); later work gets a fresh pool
+            if self._pool is pool:
+                logger.error("Job worker pool broke; restarting it")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+            raise
+
+    async def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        self._save(job)
+        self._running += 1
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(job.fn):
+                work = job.fn(self.run_in_pool, *job.args)
+            else:
+                work = self.run_in_pool(job.fn, *job.args)
+            job.result = await asyncio.wait_for(work, self.timeout + self.TIMEOUT_GRACE_SECONDS)
+            job.status = COMPLETED
+        except (JobTimeout, asyncio.TimeoutError) as e:
+            job.status, job.exception = TIMED_OUT, e
+            job.error = f"Analysis did not finish within {self.timeout:g} seconds"
+        except BrokenProcessPool as e:
+            job.status, job.exception, job.error = FAILED, e, "Analysis worker crashed"
+        except Exception as e:
+            job.status, job.exception, job.error = FAILED, e, str(e)
+        finally:
+            self._running -= 1
+            job.finished_at = datetime.utcnow()
+            self._stats[job.status] += 1
+            self._stats["wait_seconds"] += (job.started_at - job.submitted_at).total_seconds()
+            self._stats["run_seconds"] += time.perf_counter() - started
+            job.fn = job.args = None
+            if job.on_complete is not None:
+                try:
+                    job.on_complete(job)
+                except Exception as e:
+                    logger.error(f"Error in completion callback of job {job.job_id}: {e}")
+                job.on_complete = None
+            remaining = self._active_by_owner.get(job.owner, 1) - 1
+            if remaining > 0:
+                self._active_by_owner[job.owner] = remaining
+            else:
+                self._active_by_owner.pop(job.owner, None)
+            self._save(job)
+            job._done.set()
+
+    async def _dispatch(self):
+        while self.is_running:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Error running job {job.job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _expire_finished(self):
+        now = datetime.utcnow()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished and (now - job.finished_at).total_seconds() > self.result_ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, throughput and timing counters"""
+        finished = self._stats["completed"] + self._stats["failed"] + self._stats["timed_out"]
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "running": self._running,
+            "workers": self.max_workers,
+            "max_queue_size": self.max_queue_size,
+            "per_owner_limit": self.per_owner_limit,
+            "owners_with_active_jobs": len(self._active_by_owner),
+            "avg_wait_seconds": round(self._stats["wait_seconds"] / finished, 3) if finished else 0.0,
+            "avg_run_seconds": round(self._stats["run_seconds"] / finished, 3) if finished else 0.0,
+            **{key: value for key, value in self._stats.items() if key not in ("wait_seconds", "run_seconds")}
+        }
+
+    async def start_processing(self):
+        """Start the worker pool and feed it jobs until stopped"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._pool = self._new_pool()
+        logger.info(f"Starting job queue with {self.max_workers} workers")
+
+        dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(self.max_workers)]
+        try:
+            await asyncio.gather(*dispatchers)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+
+    def stop_processing(self):
+        self.is_running = False
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("Stopped job queue")
+
+# Workers and queue size are per server process; the defaults split the machine between them
+analysis_queue = JobQueue(
+    max_workers=int(os.environ.get('ANALYSIS_WORKERS', max(1, min(4, (os.cpu_count() or 2) - 1) // SERVER_PROCESSES))),
+    max_queue_size=int(os.environ.get('ANALYSIS_QUEUE_SIZE', max(1, 100 // SERVER_PROCESSES))),
+    per_owner_limit=int(os.environ.get('ANALYSIS_PER_USER_LIMIT', 3)),
+    timeout=float(os.environ.get('ANALYSIS_TIMEOUT', 60)),
+    store=JobStore(db.analysis_jobs)
+)
+
+__all__ = [
+    'JobQueue',
+    'Job',
+    'JobStore',
+    'JobRejected',
+    'JobTimeout',
+    'analysis_queue'
+]
@@ -0,0 +1,246 @@
+"""
+OCR Pipeline
+Preprocessing and per-page OCR for scanned documents and photos
+"""
+
+import asyncio
+import functools
+import io
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+try:
+    import pytesseract
+    PYTESSERACT_AVAILABLE = True
+except ImportError:
+    PYTESSERACT_AVAILABLE = False
+
+try:
+    from pdf2image import convert_from_bytes
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Tesseract is most accurate around 300 DPI; larger scans only cost time
+TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', 300))
+MAX_PAGES = int(os.environ.get('ANALYSIS_MAX_OCR_PAGES', 50))
+MAX_SKEW_DEGREES = float(os.environ.get('OCR_MAX_SKEW_DEGREES', 5))
+SKEW_STEP_DEGREES = 0.5
+SKEW_SAMPLE_SIZE = 1000
+# Without DPI metadata, the long side of a photo is taken to span a letter/A4 page
+ASSUMED_PAGE_INCHES = 11.0
+# How much darker than its surroundings a pixel must be to count as ink
+INK_CONTRAST = 10
+
+class OCRError(Exception):
+    """A page couldn't be OCR'd"""
+
+@contextmanager
+def _timed(timings: Dict[str, float], stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+
+@functools.lru_cache(maxsize=1)
+def tesseract_available() -> bool:
+    if not PYTESSERACT_AVAILABLE:
+        return False
+    try:
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def estimate_dpi(image: Image.Image) -> float:
+    """The image's DPI from its metadata, else assuming it shows a whole page"""
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] and float(dpi[0]) >= 72:
+        return float(dpi[0])
+    return max(image.size) / ASSUMED_PAGE_INCHES
+
+def to_grayscale(image: Image.Image) -> Image.Image:
+    """Upright grayscale, with any transparency flattened onto white"""
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, "white")
+        image = Image.alpha_composite(background, image)
+    return image.convert("L")
+
+def downscale(gray: Image.Image, dpi: float, target_dpi: int = TARGET_DPI) -> Tuple[Image.Image, float]:
+    """Shrink an image scanned or photographed above target_dpi; smaller images are left alone"""
+    if dpi <= target_dpi * 1.1:
+        return gray, dpi
+    scale = target_dpi / dpi
+    size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+    return gray.resize(size, Image.LANCZOS), float(target_dpi)
+
+def binarize(gray: Image.Image, dpi: float) -> Image.Image:
+    """
+    Black text on white, thresholding each pixel against its neighbourhood
+
+    A local threshold copes with the uneven lighting of phone photos, where
+    a single global threshold blackens shadows or loses faint text.
+    """
+    background = gray.filter(ImageFilter.BoxBlur(max(2, round(dpi / 15))))
+    darkness = ImageChops.subtract(background, gray)
+    return darkness.point(lambda value: 0 if value > INK_CONTRAST else 255)
+
+def _line_score(ink: Image.Image) -> float:
+    # Text lines aligned with the rows make the row profile sharply alternate
+    profile = list(ink.resize((1, ink.height), Image.BOX).getdata())
+    return sum((after - before) ** 2 for before, after in zip(profile, profile[1:]))
+
+def detect_skew(gray: Image.Image, dpi: float) -> float:
+    """The rotation in degrees (counterclockwise) that makes the text lines horizontal"""
+    sample = gray.copy()
+    sample.thumbnail((SKEW_SAMPLE_SIZE, SKEW_SAMPLE_SIZE))
+    ink = ImageOps.invert(binarize(sample, dpi * sample.width / gray.width))
+
+    scores = {0.0: _line_score(ink)}
+
+    def score(angle: float) -> float:
+        if angle not in scores:
+            scores[angle] = _line_score(ink.rotate(angle, resample=Image.NEAREST, fillcolor=0))
+        return scores[angle]
+
+    # Whole degrees first, then half a step either side of the best
+    coarse = [float(degrees) for degrees in range(-int(MAX_SKEW_DEGREES), int(MAX_SKEW_DEGREES) + 1)]
+    best = max(coarse, key=score)
+    fine = [best - SKEW_STEP_DEGREES, best, best + SKEW_STEP_DEGREES]
+    return max(fine, key=lambda angle: (score(angle), -abs(angle)))
+
+def deskew(gray: Image.Image, dpi: float) -> Image.Image:
+    angle = detect_skew(gray, dpi)
+    if not angle:
+        return gray
+    return gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+def preprocess(image: Image.Image, timings: Dict[str, float], dpi: Optional[float] = None) -> Tuple[Image.Image, float]:
+    """Grayscale, downscale to TARGET_DPI, deskew and binarize a page image"""
+    with _timed(timings, "grayscale"):
+        dpi = dpi or estimate_dpi(image)
+        gray = to_grayscale(image)
+    with _timed(timings, "downscale"):
+        gray, dpi = downscale(gray, dpi)
+    with _timed(timings, "deskew"):
+        gray = deskew(gray, dpi)
+    with _timed(timings, "binarize"):
+        gray = binarize(gray, dpi)
+    return gray, dpi
+
+def ocr_page_image(image: Image.Image, timings: Dict[str, float], dpi: Optional[float] = None) -> str:
+    if not tesseract_available():
+        raise OCRError("Tesseract is not installed")
+    page, dpi = preprocess(image, timings, dpi)
+    with _timed(timings, "ocr"):
+        try:
+            return pytesseract.image_to_string(page, config=f"--dpi {round(dpi)}")
+        except Exception as e:
+            raise OCRError(f"OCR failed: {str(e)}")
+
+def image_page_count(content: bytes) -> int:
+    """Frames in an image file (pages of a multi-page TIFF); only the header is read"""
+    try:
+        return getattr(Image.open(io.BytesIO(content)), "n_frames", 1)
+    except Exception as e:
+        raise OCRError(f"Unreadable image: {str(e)}")
+
+def ocr_image_page(content: bytes, index: int) -> Dict[str, Any]:
+    """Runs in a worker process: OCR one frame of an image file"""
+    timings: Dict[str, float] = {}
+    if not tesseract_available():
+        raise OCRError("Tesseract is not installed")
+    with _timed(timings, "decode"):
+        try:
+            image = Image.open(io.BytesIO(content))
+            image.seek(index)
+            image.load()
+        except Exception as e:
+            raise OCRError(f"Unreadable image: {str(e)}")
+    return {"text": ocr_page_image(image, timings), "timings_ms": timings}
+
+def _largest_page_image(page) -> Tuple[Image.Image, float]:
+    # A scanned page is normally one image covering the page
+    images = [embedded.image for embedded in page.images]
+    if not images:
+        raise OCRError("Page has no text or images")
+    image = max(images, key=lambda candidate: candidate.width * candidate.height)
+    page_inches = max(float(page.mediabox.width), float(page.mediabox.height)) / 72
+    return image, max(image.size) / page_inches if page_inches else estimate_dpi(image)
+
+def ocr_pdf_page(content: bytes, page, index: int) -> Dict[str, Any]:
+    """
+    OCR a PDF page that has no text layer
+
+    The page is rasterized at TARGET_DPI with pdf2image (poppler) when it's
+    installed; otherwise the page's largest embedded image is used.
+    """
+    timings: Dict[str, float] = {}
+    if not tesseract_available():
+        raise OCRError("Tesseract is not installed")
+    with _timed(timings, "rasterize"):
+        try:
+            if PDF2IMAGE_AVAILABLE:
+                image = convert_from_bytes(content, dpi=TARGET_DPI, first_page=index + 1, last_page=index + 1)[0]
+                dpi = float(TARGET_DPI)
+            else:
+                image, dpi = _largest_page_image(page)
+        except OCRError:
+            raise
+        except Exception as e:
+            raise OCRError(f"Could not rasterize page {index + 1}: {str(e)}")
+    return {"text": ocr_page_image(image, timings, dpi), "timings_ms": timings}
+
+def merge_timings(pages: List[Dict[str, float]]) -> Dict[str, float]:
+    """Total milliseconds per stage over all pages"""
+    totals: Dict[str, float] = {}
+    for timings in pages:
+        for stage, ms in timings.items():
+            totals[stage] = totals.get(stage, 0.0) + ms
+    return {stage: round(ms, 1) for stage, ms in totals.items()}
+
+async def ocr_image_pages(run: Callable[..., Awaitable[Any]], content: bytes, max_pages: int = MAX_PAGES) -> Dict[str, Any]:
+    """
+    OCR every page of an image file, one page per worker process
+
+    run executes a function in a worker (JobQueue.run_in_pool). Raises
+    OCRError if any page fails.
+    """
+    page_count = image_page_count(content)
+    tasks = [asyncio.ensure_future(run(ocr_image_page, content, index)) for index in range(min(page_count, max_pages))]
+    try:
+        pages = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    timings = merge_timings([page["timings_ms"] for page in pages])
+    logger.info(f"OCR of {len(pages)} page(s), ms per stage: {timings}")
+    return {
+        "text": "".join(page["text"] + "\n" for page in pages),
+        "total": page_count,
+        "analyzed": len(pages),
+        "timings_ms": timings
+    }
+
+__all__ = [
+    'ocr_image_pages',
+    'ocr_image_page',
+    'ocr_pdf_page',
+    'preprocess',
+    'merge_timings',
+    'tesseract_available',
+    'OCRError',
+    'TARGET_DPI',
+    'PDF2IMAGE_AVAILABLE'
+]
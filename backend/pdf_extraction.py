@@ -0,0 +1,135 @@
+"""
+PDF Extraction
+Lazy, page-batched PDF text extraction that stops once the specs are found
+"""
+
+import asyncio
+import io
+import os
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set
+
+import PyPDF2
+
+from ocr_pipeline import OCRError, merge_timings, ocr_pdf_page
+from rule_engine import rule_engine
+
+# Pages beyond the cap are never read
+MAX_PAGES = int(os.environ.get('ANALYSIS_MAX_PDF_PAGES', 100))
+BATCH_PAGES = int(os.environ.get('ANALYSIS_PDF_BATCH_PAGES', 8))
+PARALLEL_BATCHES = int(os.environ.get('ANALYSIS_PDF_PARALLEL_BATCHES', 2))
+
+class PDFExtractionError(Exception):
+    """The PDF couldn't be read"""
+
+def _open_pdf(content: bytes) -> PyPDF2.PdfReader:
+    try:
+        return PyPDF2.PdfReader(io.BytesIO(content))
+    except Exception as e:
+        raise PDFExtractionError(f"PDF extraction failed: {str(e)}")
+
+def _iter_pages(reader: PyPDF2.PdfReader, start: int, stop: Optional[int]) -> Iterator[str]:
+    page_count = len(reader.pages)
+    for index in range(start, page_count if stop is None else min(stop, page_count)):
+        try:
+            yield reader.pages[index].extract_text() or ""
+        except Exception as e:
+            raise PDFExtractionError(f"PDF extraction failed on page {index + 1}: {str(e)}")
+
+def iter_pdf_pages(content: bytes, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    """Yield the text of pages [start, stop), parsing each page only when it's reached"""
+    return _iter_pages(_open_pdf(content), start, stop)
+
+def extract_page_batch(content: bytes, start: int, stop: int) -> Dict[str, Any]:
+    """
+    Runs in a worker process: the text of pages [start, stop)
+
+    Pages without a text layer (scans) are OCR'd when Tesseract is
+    available. Also returns the document's page count and which of the
+    rules' stop_when_found parameters occur in these pages.
+    """
+    reader = _open_pdf(content)
+    pages: List[str] = []
+    ocr_timings: List[Dict[str, float]] = []
+    for index, text in enumerate(_iter_pages(reader, start, stop), start):
+        if not text.strip():
+            try:
+                page = ocr_pdf_page(content, reader.pages[index], index)
+                text = page["text"]
+                ocr_timings.append(page["timings_ms"])
+            except OCRError:
+                pass
+        pages.append(text)
+    scan = rule_engine.scan("\n".join(pages).lower())
+    return {
+        "page_count": len(reader.pages),
+        "pages": pages,
+        "found": scan.found_stop_fields(),
+        "ocr_timings": ocr_timings
+    }
+
+async def extract_pdf_text(run: Callable[..., Awaitable[Any]], content: bytes, max_pages: int = MAX_PAGES,
+                           batch_pages: int = BATCH_PAGES, parallel_batches: int = PARALLEL_BATCHES) -> Dict[str, Any]:
+    """
+    Extract a PDF's text in page batches spread over worker processes
+
+    run executes a function in a worker (JobQueue.run_in_pool). Up to
+    parallel_batches batches are in flight at once and their pages are
+    collected in page order. Once the pages read so far contain every
+    stop_when_found parameter, later batches are cancelled; the text is
+    always a whole prefix of the document, so the result doesn't depend on
+    which worker finished first.
+    """
+    required: Set[str] = {pattern.name for pattern in rule_engine.rules.stop_when_found}
+    found: Set[str] = set()
+    pages: List[str] = []
+    ocr_timings: List[Dict[str, float]] = []
+    pending: Dict[int, asyncio.Future] = {}
+    limit = max_pages
+    page_count: Optional[int] = None
+    next_start = 0
+
+    def submit_batches():
+        nonlocal next_start
+        while len(pending) < parallel_batches and next_start < limit:
+            stop = min(next_start + batch_pages, limit)
+            pending[next_start] = asyncio.ensure_future(run(extract_page_batch, content, next_start, stop))
+            next_start = stop
+
+    stopped_early = False
+    start = 0
+    submit_batches()
+    try:
+        while start < limit and start in pending:
+            batch = await pending.pop(start)
+            if page_count is None:
+                page_count = batch["page_count"]
+                limit = min(max_pages, page_count)
+            pages.extend(batch["pages"])
+            found.update(batch["found"])
+            ocr_timings.extend(batch["ocr_timings"])
+            start += batch_pages
+            if required and required <= found and start < limit:
+                stopped_early = True
+                break
+            submit_batches()
+    finally:
+        for future in pending.values():
+            future.cancel()
+
+    return {
+        "text": "".join(page + "\n" for page in pages),
+        "total": page_count or 0,
+        "analyzed": len(pages),
+        "stopped_early": stopped_early,
+        "ocr_pages": len(ocr_timings),
+        "ocr_timings_ms": merge_timings(ocr_timings)
+    }
+
+__all__ = [
+    'extract_pdf_text',
+    'extract_page_batch',
+    'iter_pdf_pages',
+    'PDFExtractionError',
+    'MAX_PAGES',
+    'BATCH_PAGES'
+]
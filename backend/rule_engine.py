@@ -0,0 +1,356 @@
+"""
+Rule Engine
+Single-pass evaluation of the document analysis rules
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis_rules.json")
+
+_REGEX_SPECIAL = set("\\.^$*+?{}[]|()")
+
+def literal_prefix(pattern: str) -> str:
+    """The literal text every match of pattern starts with ("" if there is none)"""
+    prefix = []
+    for char in pattern:
+        if char in _REGEX_SPECIAL:
+            # A quantifier makes the character before it optional
+            if char in "*?{" and prefix:
+                prefix.pop()
+            break
+        prefix.append(char)
+    return "".join(prefix)
+
+class _Pattern:
+    """A value-extracting regex, tried only where its literal prefix occurs"""
+
+    def __init__(self, name: str, pattern: str):
+        self.name = name
+        self.regex = re.compile(pattern)
+        if self.regex.groups < 1:
+            raise ValueError(f"Pattern {name} must capture its value in a group")
+        self.anchor = literal_prefix(pattern).lower()
+
+class RuleScan:
+    """
+    The outcome of one keyword pass over a document's lowercased text
+
+    Keyword positions come from a single pass with one automaton holding
+    every keyword and every pattern's literal prefix; patterns are then
+    only tried at their prefix's positions. Evaluating rules afterwards is
+    just set lookups, with the time spent per rule added to the engine's
+    statistics.
+    """
+
+    def __init__(self, rules: "CompiledRules", text: str, stats: "RuleStats"):
+        self.rules = rules
+        self.text = text
+        self.stats = stats
+        started = time.perf_counter()
+        self.positions = rules.find_keywords(text)
+        stats.record("scan:keywords", time.perf_counter() - started)
+        self._values: Dict[str, Optional[str]] = {}
+
+    def has(self, keyword: str) -> bool:
+        return keyword in self.positions
+
+    def has_any(self, keywords: List[str]) -> bool:
+        return any(keyword in self.positions for keyword in keywords)
+
+    def value(self, pattern: _Pattern) -> Optional[str]:
+        """The first value captured by a pattern, as re.search would find it"""
+        if pattern.name not in self._values:
+            started = time.perf_counter()
+            match = None
+            if pattern.anchor:
+                for position in self.positions.get(pattern.anchor, ()):
+                    match = pattern.regex.match(self.text, position)
+                    if match:
+                        break
+            else:
+                match = pattern.regex.search(self.text)
+            self._values[pattern.name] = match.group(1) if match else None
+            self.stats.record(f"pattern:{pattern.name}", time.perf_counter() - started)
+        return self._values[pattern.name]
+
+    def found_stop_fields(self) -> List[str]:
+        """The stop_when_found parameters present in the text"""
+        return [pattern.name for pattern in self.rules.stop_when_found if self.value(pattern) is not None]
+
+    def classify_product(self) -> Dict[str, Any]:
+        """Product type, grade, API gravity, sulfur content and origin"""
+        started = time.perf_counter()
+        classification = {
+            "type": "Unknown",
+            "api_gravity": None,
+            "sulfur_content": None,
+            "grade": None,
+            "origin": None
+        }
+
+        for product in self.rules.products:
+            if not self.has_any(product["keywords"]):
+                continue
+            classification["type"] = product["type"]
+            gravity_grades = product.get("api_gravity_grades")
+            api_gravity = self.rules.classification_patterns.get("api_gravity")
+            if gravity_grades and api_gravity:
+                api_text = self.value(api_gravity)
+                if api_text:
+                    api_value = float(api_text)
+                    classification["api_gravity"] = f"{api_value}°"
+                    classification["grade"] = _grade_for(api_value, gravity_grades)
+            for grade in product["grades"]:
+                if self.has_any(grade["keywords"]):
+                    classification["grade"] = grade["grade"]
+                    break
+            break
+
+        sulfur = self.rules.classification_patterns.get("sulfur")
+        sulfur_text = self.value(sulfur) if sulfur else None
+        if sulfur_text:
+            sulfur_value = float(sulfur_text)
+            classification["sulfur_content"] = f"{sulfur_value} ppm" if self.has("ppm") else f"{sulfur_value}%"
+
+        for origin in self.rules.origins:
+            if self.has(origin):
+                classification["origin"] = origin.title()
+                break
+
+        self.stats.record("classify:product", time.perf_counter() - started)
+        return classification
+
+    def red_flags(self) -> List[Dict[str, str]]:
+        flags = []
+        for rule in self.rules.red_flags:
+            started = time.perf_counter()
+            present = [keyword for keyword in rule["keywords"] if keyword in self.positions]
+            if present and not self.has_any(rule.get("unless", [])):
+                for keyword in (present if rule.get("per_keyword") else present[:1]):
+                    flags.append({
+                        "type": rule["type"],
+                        "description": rule["description"].format(keyword=keyword.title()),
+                        "severity": rule["severity"]
+                    })
+            self.stats.record(f"red_flag:{rule['name']}", time.perf_counter() - started)
+        return flags
+
+    def technical_data(self) -> List[Dict[str, str]]:
+        technical_data = []
+        for parameter, pattern in self.rules.parameters:
+            value = self.value(pattern)
+            if value is not None:
+                numeric = float(value) if value.replace('.', '').replace('-', '').isdigit() else 0
+                technical_data.append({
+                    "parameter": parameter["name"],
+                    "value": f"{value} {parameter['unit']}",
+                    "recommendation": self.rules.recommendation(parameter, numeric)
+                })
+        return technical_data
+
+def _lowered(keywords: List[str]) -> List[str]:
+    return [keyword.lower() for keyword in keywords]
+
+def _grade_for(value: float, grades: List[Dict[str, Any]]) -> Optional[str]:
+    for grade in grades:
+        if "below" in grade and not value < grade["below"]:
+            continue
+        if "above" in grade and not value > grade["above"]:
+            continue
+        return grade["grade"]
+    return None
+
+class CompiledRules:
+    """The analysis rules file, with all keywords compiled into one matcher"""
+
+    def __init__(self, rules: Dict[str, Any]):
+        # Documents are matched lowercased, so keywords are too
+        self.products = [
+            {
+                **product,
+                "keywords": _lowered(product["keywords"]),
+                "grades": [{**grade, "keywords": _lowered(grade["keywords"])} for grade in product.get("grades", [])]
+            }
+            for product in rules.get("products", [])
+        ]
+        self.origins = _lowered(rules.get("origins", []))
+        self.red_flags = [
+            {**rule, "keywords": _lowered(rule["keywords"]), "unless": _lowered(rule.get("unless", []))}
+            for rule in rules.get("red_flags", [])
+        ]
+        self.default_recommendation = rules.get("default_recommendation", "Within acceptable industry standards")
+        self.classification_patterns = {
+            name: _Pattern(f"classify:{name}", pattern)
+            for name, pattern in rules.get("classification_patterns", {}).items()
+        }
+        self.parameters: List[Tuple[Dict[str, Any], _Pattern]] = [
+            (parameter, _Pattern(parameter["name"], parameter["pattern"]))
+            for parameter in rules.get("parameters", [])
+        ]
+        # Parameters whose presence means the rest of a long document can be skipped
+        parameter_patterns = {pattern.name: pattern for _, pattern in self.parameters}
+        self.stop_when_found = [parameter_patterns[name] for name in rules.get("stop_when_found", [])]
+
+        keywords = {"ppm"}
+        for product in self.products:
+            keywords.update(product["keywords"])
+            for grade in product["grades"]:
+                keywords.update(grade["keywords"])
+        keywords.update(self.origins)
+        for rule in self.red_flags:
+            keywords.update(rule["keywords"])
+            keywords.update(rule["unless"])
+        patterns = list(self.classification_patterns.values()) + [pattern for _, pattern in self.parameters]
+        keywords.update(pattern.anchor for pattern in patterns if pattern.anchor)
+        self.keywords = sorted(keywords)
+
+        self._automaton = None
+        if AHOCORASICK_AVAILABLE and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, (len(keyword), keyword))
+            self._automaton.make_automaton()
+
+    def find_keywords(self, text: str) -> Dict[str, List[int]]:
+        """Start positions of every keyword occurring in text"""
+        positions: Dict[str, List[int]] = {}
+        if self._automaton is not None:
+            for end, (length, keyword) in self._automaton.iter(text):
+                positions.setdefault(keyword, []).append(end - length + 1)
+        else:
+            for keyword in self.keywords:
+                start = text.find(keyword)
+                while start != -1:
+                    positions.setdefault(keyword, []).append(start)
+                    start = text.find(keyword, start + 1)
+        return positions
+
+    def recommendation(self, parameter: Dict[str, Any], value: float) -> str:
+        rule = parameter.get("recommendation")
+        if not rule:
+            return self.default_recommendation
+        if "good_above" in rule:
+            good = value > rule["good_above"]
+        else:
+            good = value < rule["good_below"]
+        return rule["good"] if good else rule["poor"]
+
+    @classmethod
+    def from_file(cls, path: str) -> Tuple["CompiledRules", str]:
+        """The compiled rules and a digest of the file they came from"""
+        with open(path, "rb") as rules_file:
+            content = rules_file.read()
+        return cls(json.loads(content)), hashlib.sha256(content).hexdigest()
+
+class RuleStats:
+    """Calls and cumulative time per rule"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules: Dict[str, List[float]] = {}
+
+    def record(self, rule: str, seconds: float):
+        with self._lock:
+            entry = self._rules.get(rule)
+            if entry is None:
+                self._rules[rule] = [1, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Rules by total time spent, most expensive first"""
+        with self._lock:
+            items = [(rule, calls, seconds) for rule, (calls, seconds) in self._rules.items()]
+        return [
+            {
+                "rule": rule,
+                "calls": int(calls),
+                "total_ms": round(seconds * 1000, 3),
+                "avg_us": round(seconds / calls * 1e6, 2)
+            }
+            for rule, calls, seconds in sorted(items, key=lambda item: item[2], reverse=True)
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._rules.clear()
+
+class RuleEngine:
+    """
+    Evaluates the analysis rules from a file that can change without a deploy
+
+    The file's modification time is checked at most every reload_interval
+    seconds and the rules are recompiled when it changes. A file that fails
+    to load leaves the previous rules in place.
+    """
+
+    def __init__(self, rules_path: str = DEFAULT_RULES_PATH, reload_interval: float = 30):
+        self.rules_path = rules_path
+        self.reload_interval = reload_interval
+        self.stats = RuleStats()
+        self._rules: Optional[CompiledRules] = None
+        self._digest = ""
+        self._rules_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> CompiledRules:
+        now = time.monotonic()
+        if self._rules is None or now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if self._rules is None or now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    self._reload()
+        return self._rules
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the rules file in use, for versioning analysis results"""
+        self.rules  # reloads the file if it changed
+        return self._digest
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.rules_path)
+            if mtime == self._rules_mtime and self._rules is not None:
+                return
+            self._rules, self._digest = CompiledRules.from_file(self.rules_path)
+            self._rules_mtime = mtime
+            logger.info(f"Loaded analysis rules from {self.rules_path}")
+        except (OSError, ValueError, KeyError, re.error) as e:
+            logger.error(f"Could not load analysis rules from {self.rules_path}: {e}")
+            if self._rules is None:
+                self._rules, self._digest = CompiledRules({}), ""
+
+    def scan(self, text_lower: str) -> RuleScan:
+        """Find every rule keyword in a document's lowercased text in one pass"""
+        return RuleScan(self.rules, text_lower, self.stats)
+
+rule_engine = RuleEngine(os.environ.get('ANALYSIS_RULES_PATH', DEFAULT_RULES_PATH))
+
+__all__ = [
+    'RuleEngine',
+    'RuleScan',
+    'CompiledRules',
+    'RuleStats',
+    'rule_engine',
+    'literal_prefix',
+    'AHOCORASICK_AVAILABLE'
+]
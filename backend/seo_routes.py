@@ -1,126 +1,56 @@
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import Response
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, Response
 from typing import Optional, List
-from datetime import datetime
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+import os
+
+from http_caching import CACHE_POLICIES, PrebuiltPayload, PrebuiltPayloadCache
+from sitemap_generator import sitemap_generator
 
 router = APIRouter()
 
 # SEO and Sitemap Generation Routes
 
 @router.get("/sitemap.xml", response_class=Response)
-async def generate_sitemap():
-    """Generate dynamic XML sitemap for better SEO indexing"""
-    
-    # Create root sitemap element
-    urlset = ET.Element("urlset")
-    urlset.set("xmlns", "http://www.sitemaps.org/schemas/sitemap/0.9")
-    urlset.set("xmlns:xsi", "http://www.w3.org/2001/XMLSchema-instance")
-    urlset.set("xsi:schemaLocation", "http://www.sitemaps.org/schemas/sitemap/0.9 http://www.sitemaps.org/schemas/sitemap/0.9/sitemap.xsd")
-    
-    base_url = "https://oilgasfinder.com"  # Updated domain
-    
-    # Static pages
-    static_pages = [
-        {"url": "/", "priority": "1.0", "changefreq": "daily"},
-        {"url": "/browse", "priority": "0.9", "changefreq": "daily"},
-        {"url": "/market-data", "priority": "0.8", "changefreq": "hourly"},
-        {"url": "/premium", "priority": "0.7", "changefreq": "weekly"},
-        {"url": "/register", "priority": "0.6", "changefreq": "monthly"},
-        {"url": "/login", "priority": "0.5", "changefreq": "monthly"},
-    ]
-    
-    for page in static_pages:
-        url_elem = ET.SubElement(urlset, "url")
-        loc = ET.SubElement(url_elem, "loc")
-        loc.text = f"{base_url}{page['url']}"
-        
-        lastmod = ET.SubElement(url_elem, "lastmod")
-        lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        changefreq = ET.SubElement(url_elem, "changefreq")
-        changefreq.text = page['changefreq']
-        
-        priority = ET.SubElement(url_elem, "priority")
-        priority.text = page['priority']
-    
-    # Dynamic product pages
-    product_types = [
-        "crude-oil", "natural-gas", "lng", "lpg", 
-        "gasoline", "diesel", "jet-fuel", "gas-condensate"
-    ]
-    
-    for product in product_types:
-        url_elem = ET.SubElement(urlset, "url")
-        loc = ET.SubElement(url_elem, "loc")
-        loc.text = f"{base_url}/products/{product}"
-        
-        lastmod = ET.SubElement(url_elem, "lastmod")
-        lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        changefreq = ET.SubElement(url_elem, "changefreq")
-        changefreq.text = "weekly"
-        
-        priority = ET.SubElement(url_elem, "priority")
-        priority.text = "0.8"
-    
-    # Location-based pages
-    locations = [
-        "houston-tx", "dubai-uae", "singapore", "london-uk", 
-        "rotterdam-netherlands", "cushing-ok"
-    ]
-    
-    for location in locations:
-        url_elem = ET.SubElement(urlset, "url")
-        loc = ET.SubElement(url_elem, "loc")
-        loc.text = f"{base_url}/locations/{location}"
-        
-        lastmod = ET.SubElement(url_elem, "lastmod")
-        lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        changefreq = ET.SubElement(url_elem, "changefreq")
-        changefreq.text = "weekly"
-        
-        priority = ET.SubElement(url_elem, "priority")
-        priority.text = "0.7"
-    
-    # Product + Location combinations for long-tail keywords
-    for product in product_types[:4]:  # Limit to avoid too many URLs
-        for location in locations[:3]:  # Top 3 locations
-            url_elem = ET.SubElement(urlset, "url")
-            loc = ET.SubElement(url_elem, "loc")
-            loc.text = f"{base_url}/trading/{product}/{location}"
-            
-            lastmod = ET.SubElement(url_elem, "lastmod")
-            lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-            
-            changefreq = ET.SubElement(url_elem, "changefreq")
-            changefreq.text = "weekly"
-            
-            priority = ET.SubElement(url_elem, "priority")
-            priority.text = "0.6"
-    
-    # Convert to pretty XML
-    rough_string = ET.tostring(urlset, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ")
-    
-    # Remove empty lines and return
-    clean_xml = '\n'.join([line for line in pretty_xml.split('\n') if line.strip()])
-    
-    return Response(
-        content=clean_xml,
+async def get_sitemap_index():
+    """Serve the sitemap index written by the sitemap generator"""
+    await sitemap_generator.ensure_generated()
+    return FileResponse(
+        sitemap_generator.index_path,
         media_type="application/xml",
         headers={"Cache-Control": "public, max-age=3600"}
     )
 
+@router.get("/sitemap-{shard:int}.xml.gz", response_class=Response)
+async def get_sitemap_shard(shard: int):
+    """Serve one gzipped sitemap file listed in the index"""
+    path = sitemap_generator.shard_path(shard)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Sitemap not found")
+    return FileResponse(
+        path,
+        media_type="application/gzip",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
+
+# Keyword and meta data responses depend only on their parameters, so each
+# combination is encoded once and served from the prebuilt bytes
+seo_payloads = PrebuiltPayloadCache(max_entries=512)
+
 @router.get("/api/seo/keywords")
 async def get_seo_keywords(
+    request: Request,
     product_type: Optional[str] = None,
     location: Optional[str] = None
 ):
     """Generate SEO-optimized keywords for pages"""
+    payload = seo_payloads.get_or_build(
+        ("keywords", product_type, location),
+        lambda: PrebuiltPayload.json(build_seo_keywords(product_type, location), CACHE_POLICIES["seo"])
+    )
+    return payload.respond(request)
+
+def build_seo_keywords(product_type: Optional[str], location: Optional[str]) -> dict:
+    """Build the keyword lists for a product and location"""
     
     base_keywords = [
         "oil trading", "gas trading", "crude oil", "natural gas",
@@ -168,11 +98,20 @@ async def get_seo_keywords(
 
 @router.get("/api/seo/meta-data")
 async def get_page_meta_data(
+    request: Request,
     page_type: str = Query(..., description="Type of page (home, browse, product, location)"),
     product_type: Optional[str] = None,
     location: Optional[str] = None
 ):
     """Generate dynamic meta data for pages"""
+    payload = seo_payloads.get_or_build(
+        ("meta-data", page_type, product_type, location),
+        lambda: PrebuiltPayload.json(build_page_meta_data(page_type, product_type, location), CACHE_POLICIES["seo"])
+    )
+    return payload.respond(request)
+
+def build_page_meta_data(page_type: str, product_type: Optional[str], location: Optional[str]) -> dict:
+    """Build the title, description and keywords for a page"""
     
     meta_templates = {
         "home": {
@@ -281,12 +220,7 @@ async def get_schema_data(
     else:
         raise HTTPException(status_code=400, detail="Invalid schema type or missing required parameters")
 
-# Generate robots.txt dynamically
-@router.get("/robots.txt", response_class=Response)
-async def get_robots_txt():
-    """Generate robots.txt file"""
-    
-    robots_content = """User-agent: *
+ROBOTS_TXT_PAYLOAD = PrebuiltPayload.text("""User-agent: *
 Allow: /
 
 # Allow all crawlers access to key pages
@@ -314,10 +248,10 @@ Crawl-delay: 0
 
 User-agent: Bingbot
 Allow: /
-Crawl-delay: 1"""
-    
-    return Response(
-        content=robots_content,
-        media_type="text/plain",
-        headers={"Cache-Control": "public, max-age=86400"}
-    )
\ No newline at end of file
+Crawl-delay: 1""", CACHE_POLICIES["robots"])
+
+# Serve robots.txt from prebuilt bytes
+@router.get("/robots.txt", response_class=Response)
+async def get_robots_txt(request: Request):
+    """Serve robots.txt"""
+    return ROBOTS_TXT_PAYLOAD.respond(request)
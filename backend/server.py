@@ -2,11 +2,14 @@ from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks, Re
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 import os
+import asyncio
 import jwt
 import csv
 import io
@@ -16,13 +19,10 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import uuid
-import shutil
 from pathlib import Path
 from passlib.context import CryptContext
 import logging
 from enum import Enum
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
 # Configure logging
 logger = logging.getLogger(__name__)
 
@@ -43,7 +43,8 @@ try:
         MongoSanitizer,
         InputValidator,
         FileUploadValidator,
-        sanitize_request_middleware
+        SanitizeRequestMiddleware,
+        SanitizedRoute
     )
     INJECTION_PREVENTION_AVAILABLE = True
     print("✅ Injection prevention middleware loaded successfully")
@@ -85,6 +86,36 @@ except ImportError as e:
     print(f"Warning: Query optimization not available: {e}")
     QUERY_OPTIMIZATION_AVAILABLE = False
 
+from compression_middleware import CompressionMiddleware, compression_settings
+from document_store import DocumentStore, UploadError
+from auth_config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, decode_access_token
+from upload_scanner import upload_scanner
+from file_delivery import FileDelivery
+from fast_json import FastJSONResponse, trusted_response
+from http_caching import (
+    CACHE_POLICIES,
+    PrebuiltPayload,
+    PrebuiltPayloadCache,
+    conditional_response,
+    versioned_response,
+    version_etag
+)
+
+# Import caching
+try:
+    from cache_service import (
+        cache_service,
+        cached,
+        cache_warmer,
+        CacheMonitor,
+        CacheInvalidator
+    )
+    CACHE_AVAILABLE = True
+    print("✅ Cache service loaded successfully")
+except ImportError as e:
+    print(f"Warning: Cache service not available: {e}")
+    CACHE_AVAILABLE = False
+
 # Import WebSocket and subscription management
 try:
     from websocket_manager import (
@@ -117,9 +148,11 @@ content_router = None
 
 try:
     from seo_routes import router as seo_router
+    from sitemap_generator import sitemap_generator
 except ImportError as e:
     print(f"Warning: Could not import SEO routes: {e}")
     seo_router = None
+    sitemap_generator = None
 
 try:
     from analytics_routes import router as analytics_router
@@ -153,9 +186,14 @@ app = FastAPI(
     title="Oil & Gas Finder API", 
     version="1.0.0",
     docs_url="/api/docs" if os.getenv("ENVIRONMENT") != "production" else None,
-    redoc_url="/api/redoc" if os.getenv("ENVIRONMENT") != "production" else None
+    redoc_url="/api/redoc" if os.getenv("ENVIRONMENT") != "production" else None,
+    default_response_class=FastJSONResponse
 )
 
+# Route bodies are parsed once, by the sanitization middleware
+if INJECTION_PREVENTION_AVAILABLE:
+    app.router.route_class = SanitizedRoute
+
 # Conditionally setup rate limiting
 if RATE_LIMITING_AVAILABLE:
     limiter = Limiter(
@@ -172,7 +210,7 @@ else:
 
 # Add injection prevention middleware
 if INJECTION_PREVENTION_AVAILABLE:
-    app.middleware("http")(sanitize_request_middleware)
+    app.add_middleware(SanitizeRequestMiddleware)
     print("✅ Injection prevention middleware enabled")
 
 # Include SEO router if available
@@ -186,9 +224,11 @@ if analytics_router:
 # Import our AI routes
 try:
     from ai_routes import router as ai_router
+    from job_queue import analysis_queue
 except ImportError as e:
     print(f"Warning: Could not import AI routes: {e}")
     ai_router = None
+    analysis_queue = None
 
 # Include AI router if available
 if ai_router:
@@ -222,21 +262,14 @@ app.add_middleware(
 # Security and configuration with enhanced settings
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-SECRET_KEY = os.environ.get('SECRET_KEY', secrets.token_urlsafe(32))
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-# Add security headers middleware
-@app.middleware("http")
-async def add_security_headers(request: Request, call_next):
-    response = await call_next(request)
-    
-    # Enhanced security headers
-    response.headers["X-Content-Type-Options"] = "nosniff"
-    response.headers["X-Frame-Options"] = "DENY"
-    response.headers["X-XSS-Protection"] = "1; mode=block"
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains; preload"
-    response.headers["Content-Security-Policy"] = (
+
+# Enhanced security headers, set on every response
+SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains; preload",
+    "Content-Security-Policy": (
         "default-src 'self'; "
         "script-src 'self' 'unsafe-inline' 'unsafe-eval'; "
         "style-src 'self' 'unsafe-inline'; "
@@ -244,11 +277,41 @@ async def add_security_headers(request: Request, call_next):
         "font-src 'self' https:; "
         "connect-src 'self' https:; "
         "frame-ancestors 'none';"
-    )
-    response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-    response.headers["Permissions-Policy"] = "camera=(), microphone=(), geolocation=(), payment=()"
-    
-    return response
+    ),
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+    "Permissions-Policy": "camera=(), microphone=(), geolocation=(), payment=()"
+}
+
+class SecurityHeadersMiddleware:
+    """
+    Adds SECURITY_HEADERS to every response
+
+    Pure ASGI, so body messages pass through as the app sent them; an
+    @app.middleware("http") function re-sends every body in chunks, which
+    hides small bodies from the compression middleware.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                for name, value in SECURITY_HEADERS.items():
+                    headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+app.add_middleware(SecurityHeadersMiddleware)
+
+# Outermost middleware, so it compresses the final response with all headers set
+app.add_middleware(CompressionMiddleware, **compression_settings())
 
 # MongoDB connection
 # MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
@@ -432,6 +495,32 @@ if SUBSCRIPTION_MANAGER_AVAILABLE:
 else:
     subscription_manager = None
 
+@app.on_event("startup")
+async def start_background_services():
+    """Start background workers shared by the API"""
+    if subscription_manager:
+        asyncio.create_task(subscription_manager.usage_meter.start_flushing())
+    if CACHE_AVAILABLE:
+        asyncio.create_task(cache_warmer.start_warming())
+    if sitemap_generator:
+        asyncio.create_task(sitemap_generator.start_scheduling())
+    asyncio.create_task(document_store.start_collecting())
+    if analysis_queue:
+        asyncio.create_task(analysis_queue.start_processing())
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    """Flush in-memory state before the worker exits"""
+    if subscription_manager:
+        subscription_manager.usage_meter.stop_flushing()
+    if CACHE_AVAILABLE:
+        cache_warmer.stop_warming()
+    if sitemap_generator:
+        sitemap_generator.stop_scheduling()
+    document_store.stop_collecting()
+    if analysis_queue:
+        analysis_queue.stop_processing()
+
 # Enums
 class UserRole(str, Enum):
     BASIC = "basic"
@@ -585,7 +674,7 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     """Enhanced user authentication with security logging"""
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
@@ -961,12 +1050,12 @@ async def get_users_management(
     
     total_count = users_collection.count_documents(query)
     
-    return {
+    return trusted_response({
         "users": users,
         "total_count": total_count,
         "skip": skip,
         "limit": limit
-    }
+    })
 
 @app.put("/api/admin/users/{user_id}")
 async def manage_user(
@@ -1128,6 +1217,30 @@ async def get_email_config(admin: dict = Depends(get_admin_user)):
     """Get email configuration status for admin"""
     return get_email_config_status()
 
+@app.get("/api/admin/cache/stats")
+async def get_cache_stats(admin: dict = Depends(get_admin_user)):
+    """Get cache statistics, broken down per key prefix"""
+    if not CACHE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Cache service not available")
+    return CacheMonitor.get_cache_stats()
+
+@app.get("/api/admin/cache/top-keys")
+async def get_cache_top_keys(limit: int = 20, admin: dict = Depends(get_admin_user)):
+    """Get the cached keys that cost the most time to recompute"""
+    if not CACHE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Cache service not available")
+    return {
+        "keys": CacheMonitor.get_top_keys(min(max(limit, 1), 200)),
+        "prefixes": CacheMonitor.get_prefix_stats()
+    }
+
+@app.get("/api/admin/analysis/queue")
+async def get_analysis_queue_metrics(admin: dict = Depends(get_admin_user)):
+    """Get document analysis queue depth, throughput and timings"""
+    if not analysis_queue:
+        raise HTTPException(status_code=503, detail="Document analysis not available")
+    return analysis_queue.metrics()
+
 @app.post("/api/admin/test-email")
 async def test_email_config(admin: dict = Depends(get_admin_user)):
     """Test email configuration by sending a test email to admin"""
@@ -1174,7 +1287,7 @@ async def get_user_profile(user_id: str = Depends(get_current_user)):
     
     # Remove MongoDB _id field
     user.pop("_id", None)
-    return user
+    return trusted_response(user)
 
 @app.put("/api/user/profile")
 async def update_user_profile(profile_data: CompanyProfile, user_id: str = Depends(get_current_user)):
@@ -1192,46 +1305,39 @@ async def update_user_profile(profile_data: CompanyProfile, user_id: str = Depen
 UPLOADS_DIR = Path("/app/uploads")
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+# Procedure documents are stored once per distinct content
+document_store = DocumentStore(db.documents, UPLOADS_DIR, max_size=10 * 1024 * 1024, scanner=upload_scanner)
+
+# Handed to nginx with X-Accel-Redirect when an internal location is configured
+procedure_downloads = FileDelivery(
+    UPLOADS_DIR,
+    CACHE_POLICIES["documents"],
+    accel_prefix=os.environ.get('UPLOADS_ACCEL_PREFIX')
+)
+
 @app.post("/api/upload/procedure")
 async def upload_procedure_document(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: dict = Depends(get_current_user)
 ):
-    """Upload PDF procedure document for trading listings"""
+    """Upload PDF procedure document for trading listings (multipart field "file")"""
     try:
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(
-                status_code=400, 
-                detail="Only PDF files are allowed"
-            )
-        
-        # Validate file size (10MB limit)
-        if not file.size or file.size > 10 * 1024 * 1024:
-            raise HTTPException(
-                status_code=400,
-                detail="File size must be less than 10MB"
-            )
-        
-        # Generate unique filename
-        file_id = str(uuid.uuid4())
-        file_extension = ".pdf"
-        filename = f"{file_id}{file_extension}"
-        file_path = UPLOADS_DIR / filename
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        document = await document_store.receive_upload(
+            request, current_user.get("user_id"), field="file", allowed_extensions=(".pdf",)
+        )
         
         # Return file info
         return {
             "message": "File uploaded successfully",
-            "file_id": file_id,
-            "filename": file.filename,
-            "file_path": filename,
-            "file_size": file.size
+            "file_id": document["content_hash"],
+            "filename": document["filename"],
+            "file_path": document["file_path"],
+            "file_size": document["file_size"],
+            "deduplicated": document["deduplicated"]
         }
         
+    except UploadError as e:
+        raise HTTPException(status_code=400, detail=e.detail)
     except HTTPException:
         raise
     except Exception as e:
@@ -1239,20 +1345,10 @@ async def upload_procedure_document(
         raise HTTPException(status_code=500, detail="File upload failed")
 
 @app.get("/api/download/procedure/{file_path}")
-async def download_procedure_document(file_path: str):
+async def download_procedure_document(file_path: str, request: Request):
     """Download procedure document"""
     try:
-        file_full_path = UPLOADS_DIR / file_path
-        
-        if not file_full_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        from fastapi.responses import FileResponse
-        return FileResponse(
-            path=str(file_full_path),
-            media_type='application/pdf',
-            filename=file_path
-        )
+        return procedure_downloads.respond(request, file_path, media_type="application/pdf")
         
     except HTTPException:
         raise
@@ -1260,6 +1356,18 @@ async def download_procedure_document(file_path: str):
         print(f"File download error: {e}")
         raise HTTPException(status_code=500, detail="File download failed")
 
+# Sanitizers compiled once for the documents create_listing builds
+if INJECTION_PREVENTION_AVAILABLE:
+    USER_QUERY_SANITIZER = MongoSanitizer.compile({"user_id": str})
+    LISTING_DOCUMENT_SANITIZER = MongoSanitizer.compile(TradingListing, extra={
+        "listing_id": str,
+        "user_id": str,
+        "company_name": str,
+        "status": ListingStatus,
+        "created_at": datetime,
+        "updated_at": datetime
+    })
+
 @app.post("/api/listings")
 async def create_listing(listing_data: TradingListing, request: Request, current_user: dict = Depends(get_current_user)):
     """
@@ -1296,7 +1404,7 @@ async def create_listing(listing_data: TradingListing, request: Request, current
         # Additional security: Sanitize MongoDB query for user lookup
         user_query = {"user_id": user_id}
         if INJECTION_PREVENTION_AVAILABLE:
-            user_query = MongoSanitizer.sanitize_query(user_query)
+            user_query = USER_QUERY_SANITIZER.sanitize(user_query)
         
         user = users_collection.find_one(user_query)
         if not user:
@@ -1323,9 +1431,17 @@ async def create_listing(listing_data: TradingListing, request: Request, current
         
         # Sanitize the entire document before insertion
         if INJECTION_PREVENTION_AVAILABLE:
-            listing_doc = MongoSanitizer.sanitize_query(listing_doc)
+            listing_doc = LISTING_DOCUMENT_SANITIZER.sanitize(listing_doc)
         
-        listings_collection.insert_one(listing_doc)
+        if not document_store.acquire(listing_doc.get("procedure_document"), user_id):
+            raise HTTPException(status_code=400, detail="Unknown procedure document; upload it first")
+        try:
+            listings_collection.insert_one(listing_doc)
+        except Exception:
+            document_store.release(listing_doc.get("procedure_document"))
+            raise
+        if CACHE_AVAILABLE:
+            CacheInvalidator.invalidate_listings_cache()
         
         # Log security event
         if ENHANCED_SECURITY_AVAILABLE and RATE_LIMITING_AVAILABLE:
@@ -1365,15 +1481,14 @@ async def create_listing(listing_data: TradingListing, request: Request, current
         print(f"Listing creation error: {e}")
         raise HTTPException(status_code=500, detail="Failed to create listing")
 
-@app.get("/api/listings")
-async def get_listings(
-    skip: int = 0,
-    limit: int = 20,
-    product_type: Optional[str] = None,
-    listing_type: Optional[str] = None,
-    location: Optional[str] = None,
-    trading_hub: Optional[str] = None
-):
+def query_listings(
+    skip: int,
+    limit: int,
+    product_type: Optional[str],
+    listing_type: Optional[str],
+    location: Optional[str],
+    trading_hub: Optional[str]
+) -> Dict[str, Any]:
     query = {"status": {"$in": [ListingStatus.ACTIVE, ListingStatus.FEATURED]}}
     
     if product_type:
@@ -1402,6 +1517,35 @@ async def get_listings(
         "limit": limit
     }
 
+if CACHE_AVAILABLE:
+    query_listings = cached(expiry_seconds=60, key_prefix="listings", l1_ttl=10, stale_ttl=120, warm=True)(query_listings)
+
+@app.get("/api/listings")
+async def get_listings(
+    request: Request,
+    skip: int = 0,
+    limit: int = 20,
+    product_type: Optional[str] = None,
+    listing_type: Optional[str] = None,
+    location: Optional[str] = None,
+    trading_hub: Optional[str] = None
+):
+    policy = CACHE_POLICIES["listings"]
+    version = cache_service.data_version("listings") if CACHE_AVAILABLE else None
+    if version is None:
+        # No version shared by all workers, so the page's content validates it
+        listings = await run_in_threadpool(
+            query_listings, skip, limit, product_type, listing_type, location, trading_hub
+        )
+        return conditional_response(request, listings, policy)
+    
+    # Every listing write invalidates the "listings" tag, so its version validates the page
+    etag = version_etag("listings", version, skip, limit, product_type, listing_type, location, trading_hub)
+    return await versioned_response(
+        request, policy, etag,
+        lambda: run_in_threadpool(query_listings, skip, limit, product_type, listing_type, location, trading_hub)
+    )
+
 @app.get("/api/listings/my")
 async def get_my_listings(current_user: dict = Depends(get_current_user)):
     user_id = current_user.get("user_id")
@@ -1410,7 +1554,7 @@ async def get_my_listings(current_user: dict = Depends(get_current_user)):
         .sort("created_at", -1)
     )
     
-    return {"listings": listings}
+    return trusted_response({"listings": listings})
 
 @app.put("/api/listings/{listing_id}")
 async def update_listing(
@@ -1426,19 +1570,32 @@ async def update_listing(
     update_data = listing_data.dict()
     update_data["updated_at"] = datetime.utcnow()
     
+    document_changed = update_data.get("procedure_document") != existing_listing.get("procedure_document")
+    if document_changed and not document_store.acquire(update_data.get("procedure_document"), user_id):
+        raise HTTPException(status_code=400, detail="Unknown procedure document; upload it first")
     listings_collection.update_one(
         {"listing_id": listing_id},
         {"$set": update_data}
     )
+    if document_changed:
+        document_store.release(existing_listing.get("procedure_document"))
+    if CACHE_AVAILABLE:
+        CacheInvalidator.invalidate_listings_cache()
     
     return {"message": "Listing updated successfully"}
 
 @app.delete("/api/listings/{listing_id}")
 async def delete_listing(listing_id: str, current_user: dict = Depends(get_current_user)):
     user_id = current_user.get("user_id")
-    result = listings_collection.delete_one({"listing_id": listing_id, "user_id": user_id})
-    if result.deleted_count == 0:
+    deleted_listing = listings_collection.find_one_and_delete(
+        {"listing_id": listing_id, "user_id": user_id},
+        projection={"_id": 0, "procedure_document": 1}
+    )
+    if deleted_listing is None:
         raise HTTPException(status_code=404, detail="Listing not found")
+    document_store.release(deleted_listing.get("procedure_document"))
+    if CACHE_AVAILABLE:
+        CacheInvalidator.invalidate_listings_cache()
     
     return {"message": "Listing deleted successfully"}
 
@@ -1505,10 +1662,9 @@ async def get_connections(user_id: str = Depends(get_current_user)):
         }, {"_id": 0}).sort("created_at", -1)
     )
     
-    return {"connections": connections}
+    return trusted_response({"connections": connections})
 
-@app.get("/api/stats")
-async def get_platform_stats():
+def query_platform_stats() -> Dict[str, Any]:
     total_traders = users_collection.count_documents({})
     active_listings = listings_collection.count_documents({"status": {"$in": [ListingStatus.ACTIVE, ListingStatus.FEATURED]}})
     successful_connections = connections_collection.count_documents({"status": "accepted"})
@@ -1523,6 +1679,15 @@ async def get_platform_stats():
         "featured_opportunities": featured_listings
     }
 
+if CACHE_AVAILABLE:
+    query_platform_stats = cached(expiry_seconds=120, key_prefix="stats", stale_ttl=300,
+                                  tags=lambda: ["listings"], warm=True)(query_platform_stats)
+
+@app.get("/api/stats")
+async def get_platform_stats(request: Request):
+    # Blocking queries, and the cache may wait for another worker computing the stats
+    return conditional_response(request, await run_in_threadpool(query_platform_stats), CACHE_POLICIES["stats"])
+
 @app.post("/api/subscriptions/upgrade")
 async def upgrade_subscription(
     subscription_data: PremiumSubscription,
@@ -1561,11 +1726,9 @@ async def upgrade_subscription(
 # Note: Advanced subscription features temporarily disabled due to import issues
 # Basic subscription functionality available through existing endpoints
 
-@app.get("/api/subscription/plans")
-async def get_available_plans():
-    """Get all available subscription plans"""
-    # Return basic subscription plans without advanced features
-    basic_plans = {
+# Basic subscription plans without advanced features, encoded once
+BASIC_PLANS_PAYLOAD = PrebuiltPayload.json({
+    "plans": {
         "basic": {
             "id": "basic",
             "name": "Basic",
@@ -1590,12 +1753,14 @@ async def get_available_plans():
             "features": ["All Premium Features", "Advanced Analytics", "API Access", "Priority Support", "Custom Branding"],
             "description": "Complete solution for enterprise trading operations"
         }
-    }
-    
-    return {
-        "plans": basic_plans,
-        "message": "Available subscription plans"
-    }
+    },
+    "message": "Available subscription plans"
+}, CACHE_POLICIES["plans"])
+
+@app.get("/api/subscription/plans")
+async def get_available_plans(request: Request):
+    """Get all available subscription plans"""
+    return BASIC_PLANS_PAYLOAD.respond(request)
 
 @app.get("/api/subscription/current")
 async def get_current_subscription(current_user: dict = Depends(get_current_user)):
@@ -1640,15 +1805,14 @@ async def search_companies(
     
     total_count = users_collection.count_documents(query)
     
-    return {
+    return trusted_response({
         "companies": companies,
         "total": total_count,
         "skip": skip,
         "limit": limit
-    }
+    })
 
-@app.get("/api/market-data")
-async def get_market_data():
+async def fetch_market_data() -> Dict[str, Any]:
     # In a real implementation, this would fetch from external APIs
     mock_data = {
         "oil_prices": {
@@ -1672,6 +1836,13 @@ async def get_market_data():
     
     return mock_data
 
+if CACHE_AVAILABLE:
+    fetch_market_data = cached(expiry_seconds=60, key_prefix="market_data", l1_ttl=5, warm=True)(fetch_market_data)
+
+@app.get("/api/market-data")
+async def get_market_data(request: Request):
+    return conditional_response(request, await fetch_market_data(), CACHE_POLICIES["market_data"])
+
 # PayPal Payment Endpoints
 
 @app.post("/api/payments/create-subscription")
@@ -1814,8 +1985,7 @@ async def get_user_analytics_endpoint(user_id: str = Depends(get_current_user)):
             "financial": {"total_spent": 0, "payment_history": [], "subscription_status": "basic"}
         }
 
-@app.get("/api/analytics/market")
-async def get_market_analytics():
+async def fetch_market_analytics() -> Dict[str, Any]:
     """Get market analytics and trends"""
     if analytics_service:
         analytics = await analytics_service.get_market_analytics()
@@ -1846,6 +2016,15 @@ async def get_market_analytics():
             "activity_trends": []
         }
 
+if CACHE_AVAILABLE:
+    fetch_market_analytics = cached(expiry_seconds=300, key_prefix="analytics", stale_ttl=600,
+                                    tags=lambda: ["listings"], warm=True)(fetch_market_analytics)
+
+@app.get("/api/analytics/market")
+async def get_market_analytics():
+    """Get market analytics and trends"""
+    return await fetch_market_analytics()
+
 @app.get("/api/analytics/revenue")
 async def get_revenue_analytics(user_id: str = Depends(get_current_user)):
     """Get revenue analytics (admin only)"""
@@ -2093,65 +2272,65 @@ async def create_partnership_program(
 
 # Enhanced market data with business intelligence
 
-@app.get("/api/market-intelligence")
-async def get_market_intelligence():
-    """Get comprehensive market intelligence and business insights"""
-    # Enhanced market data with business insights
-    intelligence = {
-        "market_overview": {
-            "oil_markets": {
-                "wti_crude": {"price": 78.45, "trend": "bullish", "support": 75.00, "resistance": 82.00},
-                "brent_crude": {"price": 82.15, "trend": "bullish", "support": 79.00, "resistance": 85.00},
-                "dubai_crude": {"price": 81.23, "trend": "neutral", "support": 78.00, "resistance": 84.00}
-            },
-            "gas_markets": {
-                "natural_gas": {"price": 2.85, "trend": "bearish", "support": 2.70, "resistance": 3.00},
-                "lng_asia": {"price": 12.45, "trend": "bullish", "support": 11.50, "resistance": 13.50}
-            }
+# Enhanced market data with business insights, encoded once
+MARKET_INTELLIGENCE_PAYLOAD = PrebuiltPayload.json({
+    "market_overview": {
+        "oil_markets": {
+            "wti_crude": {"price": 78.45, "trend": "bullish", "support": 75.00, "resistance": 82.00},
+            "brent_crude": {"price": 82.15, "trend": "bullish", "support": 79.00, "resistance": 85.00},
+            "dubai_crude": {"price": 81.23, "trend": "neutral", "support": 78.00, "resistance": 84.00}
         },
-        "trading_opportunities": [
-            {
-                "market": "WTI Crude",
-                "opportunity": "Bullish breakout above $80",
-                "risk_reward": "1:3",
-                "time_horizon": "2-4 weeks",
-                "confidence": "High"
-            },
-            {
-                "market": "Natural Gas",
-                "opportunity": "Seasonal winter demand support",
-                "risk_reward": "1:2",
-                "time_horizon": "1-3 months",
-                "confidence": "Medium"
-            }
-        ],
-        "risk_factors": [
-            "OPEC+ production policy changes",
-            "US Federal Reserve interest rate decisions",
-            "Geopolitical tensions in Middle East",
-            "Winter weather patterns in Northern Hemisphere"
-        ],
-        "industry_insights": {
-            "supply_demand": "Tight supply conditions support oil prices",
-            "inventory_levels": "Below 5-year average for crude oil",
-            "refining_margins": "Strong crack spreads indicate healthy demand",
-            "transportation": "Shipping costs elevated due to supply chain issues"
+        "gas_markets": {
+            "natural_gas": {"price": 2.85, "trend": "bearish", "support": 2.70, "resistance": 3.00},
+            "lng_asia": {"price": 12.45, "trend": "bullish", "support": 11.50, "resistance": 13.50}
+        }
+    },
+    "trading_opportunities": [
+        {
+            "market": "WTI Crude",
+            "opportunity": "Bullish breakout above $80",
+            "risk_reward": "1:3",
+            "time_horizon": "2-4 weeks",
+            "confidence": "High"
         },
-        "weekly_outlook": {
-            "key_events": [
-                "EIA Weekly Petroleum Status Report (Wednesday)",
-                "OPEC+ Technical Committee Meeting",
-                "Chinese economic data release",
-                "US inflation data (CPI)"
-            ],
-            "price_targets": {
-                "wti_crude": {"bull_target": 85.00, "bear_target": 72.00},
-                "natural_gas": {"bull_target": 3.20, "bear_target": 2.50}
-            }
+        {
+            "market": "Natural Gas",
+            "opportunity": "Seasonal winter demand support",
+            "risk_reward": "1:2",
+            "time_horizon": "1-3 months",
+            "confidence": "Medium"
+        }
+    ],
+    "risk_factors": [
+        "OPEC+ production policy changes",
+        "US Federal Reserve interest rate decisions",
+        "Geopolitical tensions in Middle East",
+        "Winter weather patterns in Northern Hemisphere"
+    ],
+    "industry_insights": {
+        "supply_demand": "Tight supply conditions support oil prices",
+        "inventory_levels": "Below 5-year average for crude oil",
+        "refining_margins": "Strong crack spreads indicate healthy demand",
+        "transportation": "Shipping costs elevated due to supply chain issues"
+    },
+    "weekly_outlook": {
+        "key_events": [
+            "EIA Weekly Petroleum Status Report (Wednesday)",
+            "OPEC+ Technical Committee Meeting",
+            "Chinese economic data release",
+            "US inflation data (CPI)"
+        ],
+        "price_targets": {
+            "wti_crude": {"bull_target": 85.00, "bear_target": 72.00},
+            "natural_gas": {"bull_target": 3.20, "bear_target": 2.50}
         }
     }
-    
-    return intelligence
+}, CACHE_POLICIES["market_intelligence"])
+
+@app.get("/api/market-intelligence")
+async def get_market_intelligence(request: Request):
+    """Get comprehensive market intelligence and business insights"""
+    return MARKET_INTELLIGENCE_PAYLOAD.respond(request)
 
 @app.post("/api/payments/webhook")
 async def paypal_webhook(request: Request):
@@ -2204,102 +2383,9 @@ async def get_revenue_dashboard(user_id: str = Depends(get_current_user)):
     }
 
 # SEO ROUTES - Added directly to avoid import issues
+# (sitemap.xml is served by seo_routes from files written by sitemap_generator)
 
-@app.get("/sitemap.xml", response_class=Response)
-async def generate_sitemap():
-    """Generate dynamic XML sitemap for better SEO indexing"""
-    
-    # Create root sitemap element
-    urlset = ET.Element("urlset")
-    urlset.set("xmlns", "http://www.sitemaps.org/schemas/sitemap/0.9")
-    urlset.set("xmlns:xsi", "http://www.w3.org/2001/XMLSchema-instance")
-    urlset.set("xsi:schemaLocation", "http://www.sitemaps.org/schemas/sitemap/0.9 http://www.sitemaps.org/schemas/sitemap/0.9/sitemap.xsd")
-    
-    base_url = "https://oilgasfinder.com"
-    
-    # Static pages
-    static_pages = [
-        {"url": "/", "priority": "1.0", "changefreq": "daily"},
-        {"url": "/browse", "priority": "0.9", "changefreq": "daily"},
-        {"url": "/market-data", "priority": "0.8", "changefreq": "hourly"},
-        {"url": "/premium", "priority": "0.7", "changefreq": "weekly"},
-        {"url": "/register", "priority": "0.6", "changefreq": "monthly"},
-        {"url": "/login", "priority": "0.5", "changefreq": "monthly"},
-    ]
-    
-    for page in static_pages:
-        url_elem = ET.SubElement(urlset, "url")
-        loc = ET.SubElement(url_elem, "loc")
-        loc.text = f"{base_url}{page['url']}"
-        
-        lastmod = ET.SubElement(url_elem, "lastmod")
-        lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        changefreq = ET.SubElement(url_elem, "changefreq")
-        changefreq.text = page['changefreq']
-        
-        priority = ET.SubElement(url_elem, "priority")
-        priority.text = page['priority']
-    
-    # Dynamic product pages
-    product_types = [
-        "crude-oil", "natural-gas", "lng", "lpg", 
-        "gasoline", "diesel", "jet-fuel", "gas-condensate"
-    ]
-    
-    for product in product_types:
-        url_elem = ET.SubElement(urlset, "url")
-        loc = ET.SubElement(url_elem, "loc")
-        loc.text = f"{base_url}/products/{product}"
-        
-        lastmod = ET.SubElement(url_elem, "lastmod")
-        lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        changefreq = ET.SubElement(url_elem, "changefreq")
-        changefreq.text = "weekly"
-        
-        priority = ET.SubElement(url_elem, "priority")
-        priority.text = "0.8"
-    
-    # Location-based pages
-    locations = [
-        "houston-tx", "dubai-uae", "singapore", "london-uk", 
-        "rotterdam-netherlands", "cushing-ok"
-    ]
-    
-    for location in locations:
-        url_elem = ET.SubElement(urlset, "url")
-        loc = ET.SubElement(url_elem, "loc")
-        loc.text = f"{base_url}/locations/{location}"
-        
-        lastmod = ET.SubElement(url_elem, "lastmod")
-        lastmod.text = datetime.utcnow().strftime("%Y-%m-%d")
-        
-        changefreq = ET.SubElement(url_elem, "changefreq")
-        changefreq.text = "weekly"
-        
-        priority = ET.SubElement(url_elem, "priority")
-        priority.text = "0.7"
-    
-    # Convert to pretty XML
-    rough_string = ET.tostring(urlset, 'utf-8')
-    reparsed = minidom.parseString(rough_string)
-    pretty_xml = reparsed.toprettyxml(indent="  ")
-    
-    # Remove empty lines and return
-    clean_xml = '\n'.join([line for line in pretty_xml.split('\n') if line.strip()])
-    
-    return Response(
-        content=clean_xml,
-        media_type="application/xml",
-        headers={"Cache-Control": "public, max-age=3600"}
-    )
-
-@app.get("/robots.txt", response_class=Response)
-async def get_robots_txt():
-    """Generate robots.txt file"""
-    
-    robots_content = """User-agent: *
+ROBOTS_TXT_PAYLOAD = PrebuiltPayload.text("""User-agent: *
 Allow: /
 
 # Allow all crawlers access to key pages
@@ -2327,13 +2413,12 @@ Crawl-delay: 0
 
 User-agent: Bingbot
 Allow: /
-Crawl-delay: 1"""
-    
-    return Response(
-        content=robots_content,
-        media_type="text/plain",
-        headers={"Cache-Control": "public, max-age=86400"}
-    )
+Crawl-delay: 1""", CACHE_POLICIES["robots"])
+
+@app.get("/robots.txt", response_class=Response)
+async def get_robots_txt(request: Request):
+    """Serve robots.txt"""
+    return ROBOTS_TXT_PAYLOAD.respond(request)
 
 # ANALYTICS ROUTES
 
@@ -2516,84 +2601,60 @@ async def analyze_document(file: UploadFile = File(...)):
 
 # CONTENT API ROUTES - Added directly to server.py
 
-@app.get("/api/blog/posts")
-async def get_blog_posts(limit: int = 10, offset: int = 0, category: str = None):
-    """Get blog posts with pagination"""
-    try:
-        # Sample blog posts for demo - in production, fetch from database
-        sample_posts = [
-            {
-                "id": "1",
-                "title": "Oil Market Analysis: Global Trends and Trading Opportunities",
-                "slug": "oil-market-analysis-global-trends-2024",
-                "excerpt": "Comprehensive analysis of current oil market conditions, price trends, and emerging trading opportunities across global markets.",
-                "content": "The global oil market continues to evolve with changing geopolitical dynamics...",
-                "category": "Market Analysis",
-                "keywords": "oil market, crude oil prices, trading opportunities, market analysis",
-                "author": "Oil & Gas Finder Team",
-                "featured_image": "/images/blog/oil-market-analysis.jpg",
-                "read_time": 8,
-                "created_at": "2024-05-30T10:00:00Z",
-                "views": 1250
-            },
-            {
-                "id": "2", 
-                "title": "Natural Gas Trading Strategies for 2024",
-                "slug": "natural-gas-trading-strategies-2024",
-                "excerpt": "Expert insights into natural gas trading strategies, market forecasts, and risk management techniques for successful trading.",
-                "content": "Natural gas markets present unique opportunities for traders who understand...",
-                "category": "Trading Strategies",
-                "keywords": "natural gas trading, LNG market, gas prices, trading strategies",
-                "author": "Energy Trading Expert",
-                "featured_image": "/images/blog/natural-gas-trading.jpg", 
-                "read_time": 6,
-                "created_at": "2024-05-28T14:30:00Z",
-                "views": 987
-            },
-            {
-                "id": "3",
-                "title": "Houston Energy Trading Hub: Market Insights and Opportunities", 
-                "slug": "houston-energy-trading-hub-market-insights",
-                "excerpt": "Deep dive into Houston's role as a global energy trading center, key players, and opportunities for traders.",
-                "content": "Houston remains the energy capital of the world, serving as a critical hub...",
-                "category": "Market Insights",
-                "keywords": "Houston oil trading, energy hub, Texas crude oil, trading opportunities",
-                "author": "Market Research Team",
-                "featured_image": "/images/blog/houston-trading-hub.jpg",
-                "read_time": 7,
-                "created_at": "2024-05-26T09:15:00Z", 
-                "views": 1543
-            }
-        ]
-        
-        # Apply filters
-        filtered_posts = sample_posts
-        if category:
-            filtered_posts = [p for p in sample_posts if p["category"].lower() == category.lower()]
-        
-        # Apply pagination
-        paginated_posts = filtered_posts[offset:offset + limit]
-        
-        return {
-            "posts": paginated_posts,
-            "total": len(filtered_posts),
-            "has_more": (offset + limit) < len(filtered_posts)
-        }
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+# Sample blog content - in production, fetch from database. Responses are
+# encoded once per distinct request and served from the prebuilt bytes.
+BLOG_POSTS = [
+    {
+        "id": "1",
+        "title": "Oil Market Analysis: Global Trends and Trading Opportunities",
+        "slug": "oil-market-analysis-global-trends-2024",
+        "excerpt": "Comprehensive analysis of current oil market conditions, price trends, and emerging trading opportunities across global markets.",
+        "content": "The global oil market continues to evolve with changing geopolitical dynamics...",
+        "category": "Market Analysis",
+        "keywords": "oil market, crude oil prices, trading opportunities, market analysis",
+        "author": "Oil & Gas Finder Team",
+        "featured_image": "/images/blog/oil-market-analysis.jpg",
+        "read_time": 8,
+        "created_at": "2024-05-30T10:00:00Z",
+        "views": 1250
+    },
+    {
+        "id": "2", 
+        "title": "Natural Gas Trading Strategies for 2024",
+        "slug": "natural-gas-trading-strategies-2024",
+        "excerpt": "Expert insights into natural gas trading strategies, market forecasts, and risk management techniques for successful trading.",
+        "content": "Natural gas markets present unique opportunities for traders who understand...",
+        "category": "Trading Strategies",
+        "keywords": "natural gas trading, LNG market, gas prices, trading strategies",
+        "author": "Energy Trading Expert",
+        "featured_image": "/images/blog/natural-gas-trading.jpg", 
+        "read_time": 6,
+        "created_at": "2024-05-28T14:30:00Z",
+        "views": 987
+    },
+    {
+        "id": "3",
+        "title": "Houston Energy Trading Hub: Market Insights and Opportunities", 
+        "slug": "houston-energy-trading-hub-market-insights",
+        "excerpt": "Deep dive into Houston's role as a global energy trading center, key players, and opportunities for traders.",
+        "content": "Houston remains the energy capital of the world, serving as a critical hub...",
+        "category": "Market Insights",
+        "keywords": "Houston oil trading, energy hub, Texas crude oil, trading opportunities",
+        "author": "Market Research Team",
+        "featured_image": "/images/blog/houston-trading-hub.jpg",
+        "read_time": 7,
+        "created_at": "2024-05-26T09:15:00Z", 
+        "views": 1543
+    }
+]
 
-@app.get("/api/blog/posts/{slug}")
-async def get_blog_post(slug: str):
-    """Get individual blog post by slug"""
-    try:
-        # Sample post data - in production, fetch from database
-        sample_posts = {
-            "oil-market-analysis-global-trends-2024": {
-                "id": "1",
-                "title": "Oil Market Analysis: Global Trends and Trading Opportunities",
-                "slug": "oil-market-analysis-global-trends-2024",
-                "excerpt": "Comprehensive analysis of current oil market conditions, price trends, and emerging trading opportunities.",
-                "content": """
+BLOG_POST_DETAILS = {
+    "oil-market-analysis-global-trends-2024": {
+        "id": "1",
+        "title": "Oil Market Analysis: Global Trends and Trading Opportunities",
+        "slug": "oil-market-analysis-global-trends-2024",
+        "excerpt": "Comprehensive analysis of current oil market conditions, price trends, and emerging trading opportunities.",
+        "content": """
                 <h2>Current Market Conditions</h2>
                 <p>The global oil market is experiencing significant volatility driven by multiple factors including geopolitical tensions, supply chain disruptions, and changing demand patterns.</p>
                 
@@ -2607,54 +2668,79 @@ async def get_blog_post(slug: str):
                 <h2>Market Outlook</h2>
                 <p>Looking ahead, we expect continued volatility with potential for upward price pressure due to supply constraints and growing global demand.</p>
                 """,
-                "category": "Market Analysis",
-                "keywords": "oil market, crude oil prices, trading opportunities, market analysis",
-                "author": "Oil & Gas Finder Team",
-                "featured_image": "/images/blog/oil-market-analysis.jpg",
-                "read_time": 8,
-                "created_at": "2024-05-30T10:00:00Z",
-                "views": 1250
-            }
-        }
-        
-        post = sample_posts.get(slug)
-        if not post:
-            return {"status": "error", "message": "Post not found"}
+        "category": "Market Analysis",
+        "keywords": "oil market, crude oil prices, trading opportunities, market analysis",
+        "author": "Oil & Gas Finder Team",
+        "featured_image": "/images/blog/oil-market-analysis.jpg",
+        "read_time": 8,
+        "created_at": "2024-05-30T10:00:00Z",
+        "views": 1250
+    }
+}
+
+BLOG_RELATED_POSTS = [
+    {
+        "id": "2",
+        "title": "Natural Gas Trading Strategies for 2024", 
+        "slug": "natural-gas-trading-strategies-2024",
+        "excerpt": "Expert insights into natural gas trading strategies and market forecasts.",
+        "category": "Trading Strategies",
+        "featured_image": "/images/blog/natural-gas-trading.jpg",
+        "created_at": "2024-05-28T14:30:00Z"
+    }
+]
+
+BLOG_CATEGORIES = [
+    {"_id": "Market Analysis", "count": 15},
+    {"_id": "Trading Strategies", "count": 12}, 
+    {"_id": "Market Insights", "count": 8},
+    {"_id": "Industry News", "count": 20},
+    {"_id": "Technology", "count": 6}
+]
+
+blog_payloads = PrebuiltPayloadCache()
+BLOG_POST_PAYLOADS = {
+    slug: PrebuiltPayload.json({"post": post, "related_posts": BLOG_RELATED_POSTS}, CACHE_POLICIES["blog"])
+    for slug, post in BLOG_POST_DETAILS.items()
+}
+BLOG_CATEGORIES_PAYLOAD = PrebuiltPayload.json({"categories": BLOG_CATEGORIES}, CACHE_POLICIES["blog"])
+
+@app.get("/api/blog/posts")
+async def get_blog_posts(request: Request, limit: int = 10, offset: int = 0, category: str = None):
+    """Get blog posts with pagination"""
+    try:
+        def build_page() -> PrebuiltPayload:
+            # Apply filters
+            filtered_posts = BLOG_POSTS
+            if category:
+                filtered_posts = [p for p in BLOG_POSTS if p["category"].lower() == category.lower()]
             
-        # Related posts
-        related_posts = [
-            {
-                "id": "2",
-                "title": "Natural Gas Trading Strategies for 2024", 
-                "slug": "natural-gas-trading-strategies-2024",
-                "excerpt": "Expert insights into natural gas trading strategies and market forecasts.",
-                "category": "Trading Strategies",
-                "featured_image": "/images/blog/natural-gas-trading.jpg",
-                "created_at": "2024-05-28T14:30:00Z"
-            }
-        ]
-        
-        return {
-            "post": post,
-            "related_posts": related_posts
-        }
+            # Apply pagination
+            paginated_posts = filtered_posts[offset:offset + limit]
+            
+            return PrebuiltPayload.json({
+                "posts": paginated_posts,
+                "total": len(filtered_posts),
+                "has_more": (offset + limit) < len(filtered_posts)
+            }, CACHE_POLICIES["blog"])
+        
+        page_key = (limit, offset, category.lower() if category else None)
+        return blog_payloads.get_or_build(page_key, build_page).respond(request)
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/blog/posts/{slug}")
+async def get_blog_post(slug: str, request: Request):
+    """Get individual blog post by slug"""
+    payload = BLOG_POST_PAYLOADS.get(slug)
+    if not payload:
+        return {"status": "error", "message": "Post not found"}
+    return payload.respond(request)
+
 @app.get("/api/blog/categories") 
-async def get_blog_categories():
+async def get_blog_categories(request: Request):
     """Get all blog categories"""
-    try:
-        categories = [
-            {"_id": "Market Analysis", "count": 15},
-            {"_id": "Trading Strategies", "count": 12}, 
-            {"_id": "Market Insights", "count": 8},
-            {"_id": "Industry News", "count": 20},
-            {"_id": "Technology", "count": 6}
-        ]
-        return {"categories": categories}
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    return BLOG_CATEGORIES_PAYLOAD.respond(request)
 
 @app.get("/api/locations/{location}")
 async def get_location_data(location: str):
@@ -2720,7 +2806,7 @@ async def get_location_data(location: str):
         return {"status": "error", "message": str(e)}
 
 @app.get("/api/products/{product_type}")
-async def get_product_data(product_type: str):
+async def get_product_data(product_type: str, request: Request):
     """Get product-specific trading data"""
     try:
         # Sample product data
@@ -2753,7 +2839,7 @@ async def get_product_data(product_type: str):
         
         product_info.update(market_data)
         
-        return product_info
+        return conditional_response(request, product_info, CACHE_POLICIES["products"])
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
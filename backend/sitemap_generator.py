@@ -0,0 +1,311 @@
+"""
+Sitemap Generator
+Writes sharded, gzipped XML sitemaps from the listings database
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from pymongo import MongoClient
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+client = MongoClient(MONGO_URL)
+db = client.oil_gas_finder
+
+SITEMAP_NAMESPACE = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+# Sitemap protocol limit per file
+MAX_URLS_PER_FILE = 50000
+
+SHARD_PATTERN = re.compile(r"^sitemap-\d+\.xml\.gz$")
+
+ACTIVE_STATUSES = ["active", "featured"]
+
+STATIC_PAGES = [
+    {"url": "/", "priority": "1.0", "changefreq": "daily"},
+    {"url": "/browse", "priority": "0.9", "changefreq": "daily"},
+    {"url": "/market-data", "priority": "0.8", "changefreq": "hourly"},
+    {"url": "/premium", "priority": "0.7", "changefreq": "weekly"},
+    {"url": "/register", "priority": "0.6", "changefreq": "monthly"},
+    {"url": "/login", "priority": "0.5", "changefreq": "monthly"},
+]
+
+# Pages whose content is the listing feed, so they change with every listing
+LISTING_FEED_PAGES = {"/", "/browse", "/market-data"}
+
+PRODUCT_SLUGS = [
+    "crude-oil", "natural-gas", "lng", "lpg",
+    "gasoline", "diesel", "jet-fuel", "gas-condensate"
+]
+
+LOCATION_SLUGS = [
+    "houston-tx", "dubai-uae", "singapore", "london-uk",
+    "rotterdam-netherlands", "cushing-ok"
+]
+
+# (path, lastmod, changefreq, priority)
+SitemapUrl = Tuple[str, Optional[datetime], str, str]
+
+def _format_lastmod(value: datetime) -> str:
+    """W3C datetime; stored datetimes are naive UTC"""
+    return value.strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+class SitemapGenerator:
+    """
+    Streams every public URL into sitemap files on disk
+
+    URLs are read from MongoDB with a projected cursor and written straight
+    into gzipped shards of at most max_urls_per_file URLs, plus a sitemap.xml
+    index pointing at them. Files are written under unique temporary names
+    and replaced atomically, so they can be served statically while a new
+    set is being written. Every worker runs the schedule, but a lock file in
+    output_dir lets only one of them generate at a time.
+    """
+
+    def __init__(self, listings_collection, output_dir: str, base_url: str,
+                 max_urls_per_file: int = MAX_URLS_PER_FILE, interval_seconds: float = 3600):
+        self.listings_collection = listings_collection
+        self.output_dir = output_dir
+        self.base_url = base_url.rstrip("/")
+        self.max_urls_per_file = min(max_urls_per_file, MAX_URLS_PER_FILE)
+        self.interval_seconds = interval_seconds
+        self.is_running = False
+        self.last_result: Dict[str, Any] = {}
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.output_dir, "sitemap.xml")
+
+    @property
+    def lock_path(self) -> str:
+        return os.path.join(self.output_dir, ".sitemap.lock")
+
+    def shard_name(self, number: int) -> str:
+        return f"sitemap-{number}.xml.gz"
+
+    def shard_path(self, number: int) -> str:
+        return os.path.join(self.output_dir, self.shard_name(number))
+
+    def _newest_update(self) -> Optional[datetime]:
+        newest = self.listings_collection.find_one(
+            {"status": {"$in": ACTIVE_STATUSES}},
+            {"_id": 0, "updated_at": 1},
+            sort=[("updated_at", -1)]
+        )
+        return newest.get("updated_at") if newest else None
+
+    def _product_updates(self) -> Dict[str, datetime]:
+        """Latest listing change per product, keyed by URL slug"""
+        pipeline = [
+            {"$match": {"status": {"$in": ACTIVE_STATUSES}}},
+            {"$group": {
+                "_id": "$product_type",
+                "lastmod": {"$max": {"$ifNull": ["$updated_at", "$created_at"]}}
+            }}
+        ]
+        return {
+            str(row["_id"]).replace("_", "-"): row["lastmod"]
+            for row in self.listings_collection.aggregate(pipeline)
+            if row["_id"]
+        }
+
+    def iter_urls(self) -> Iterator[SitemapUrl]:
+        """Yield every public URL, listings last and streamed from the cursor"""
+        newest = self._newest_update()
+        for page in STATIC_PAGES:
+            lastmod = newest if page["url"] in LISTING_FEED_PAGES else None
+            yield page["url"], lastmod, page["changefreq"], page["priority"]
+
+        product_updates = self._product_updates()
+        product_slugs = PRODUCT_SLUGS + sorted(set(product_updates) - set(PRODUCT_SLUGS))
+        for product in product_slugs:
+            yield f"/products/{product}", product_updates.get(product), "weekly", "0.8"
+
+        for location in LOCATION_SLUGS:
+            yield f"/locations/{location}", newest, "weekly", "0.7"
+
+        # Product + location combinations for long-tail keywords
+        for product in PRODUCT_SLUGS[:4]:
+            for location in LOCATION_SLUGS[:3]:
+                yield f"/trading/{product}/{location}", product_updates.get(product), "weekly", "0.6"
+
+        cursor = self.listings_collection.find(
+            {"status": {"$in": ACTIVE_STATUSES}},
+            {"_id": 0, "listing_id": 1, "updated_at": 1, "created_at": 1}
+        ).batch_size(1000)
+        for listing in cursor:
+            lastmod = listing.get("updated_at") or listing.get("created_at")
+            yield f"/listings/{listing['listing_id']}", lastmod, "daily", "0.6"
+
+    def _url_entry(self, url: SitemapUrl) -> str:
+        path, lastmod, changefreq, priority = url
+        entry = f"<url><loc>{escape(self.base_url + path)}</loc>"
+        if lastmod:
+            entry += f"<lastmod>{_format_lastmod(lastmod)}</lastmod>"
+        return entry + f"<changefreq>{changefreq}</changefreq><priority>{priority}</priority></url>\n"
+
+    @contextmanager
+    def _replacing(self, path: str):
+        """Yield a unique temporary path that replaces path once the block completes"""
+        with tempfile.NamedTemporaryFile(dir=self.output_dir, prefix=f".{os.path.basename(path)}.",
+                                         suffix=".tmp", delete=False) as temp_file:
+            temp_path = temp_file.name
+        try:
+            yield temp_path
+            # Temporary files are private; the sitemaps are served to everyone
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _write_shard(self, number: int, urls: List[SitemapUrl]) -> Optional[datetime]:
+        """Write one gzipped shard, returning its newest lastmod"""
+        newest = None
+        with self._replacing(self.shard_path(number)) as temp_path:
+            with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as shard:
+                shard.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NAMESPACE}">\n')
+                for url in urls:
+                    shard.write(self._url_entry(url))
+                    if url[1] and (newest is None or url[1] > newest):
+                        newest = url[1]
+                shard.write("</urlset>\n")
+        return newest
+
+    def _write_index(self, shard_updates: List[Optional[datetime]]):
+        with self._replacing(self.index_path) as temp_path:
+            with open(temp_path, "w", encoding="utf-8") as index:
+                index.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NAMESPACE}">\n')
+                for number, lastmod in enumerate(shard_updates, start=1):
+                    index.write(f"<sitemap><loc>{escape(self.base_url)}/{self.shard_name(number)}</loc>")
+                    if lastmod:
+                        index.write(f"<lastmod>{_format_lastmod(lastmod)}</lastmod>")
+                    index.write("</sitemap>\n")
+                index.write("</sitemapindex>\n")
+
+    def generate(self) -> Dict[str, Any]:
+        """Write all shards and the index, returning a summary"""
+        started = time.monotonic()
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        shard_updates = []
+        batch: List[SitemapUrl] = []
+        total = 0
+        for url in self.iter_urls():
+            batch.append(url)
+            if len(batch) >= self.max_urls_per_file:
+                shard_updates.append(self._write_shard(len(shard_updates) + 1, batch))
+                total += len(batch)
+                batch = []
+        if batch or not shard_updates:
+            shard_updates.append(self._write_shard(len(shard_updates) + 1, batch))
+            total += len(batch)
+
+        self._write_index(shard_updates)
+
+        # Remove shards left over from a larger previous run
+        current = {self.shard_name(number) for number in range(1, len(shard_updates) + 1)}
+        for name in os.listdir(self.output_dir):
+            if SHARD_PATTERN.match(name) and name not in current:
+                os.remove(os.path.join(self.output_dir, name))
+
+        self.last_result = {
+            "urls": total,
+            "files": len(shard_updates),
+            "seconds": round(time.monotonic() - started, 3),
+            "generated_at": datetime.utcnow().isoformat()
+        }
+        logger.info(f"Generated sitemap with {total} URLs in {len(shard_updates)} files")
+        return self.last_result
+
+    def is_fresh(self) -> bool:
+        """Whether the files on disk are recent enough to skip a run (shared by all workers)"""
+        try:
+            return time.time() - os.path.getmtime(self.index_path) < self.interval_seconds * 0.9
+        except OSError:
+            return False
+
+    @contextmanager
+    def _generation_lock(self, wait: bool) -> Iterator[bool]:
+        """
+        Lock shared by every process writing to output_dir; yields whether it was taken
+
+        Uses flock on a lock file, so it is released even if the holder dies.
+        Without fcntl (Windows) the lock is always taken.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            if FCNTL_AVAILABLE:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+            yield True
+
+    def generate_if_stale(self) -> Optional[Dict[str, Any]]:
+        """Generate unless another worker is generating or just has; returns the summary if it ran"""
+        with self._generation_lock(wait=False) as locked:
+            if locked and not self.is_fresh():
+                return self.generate()
+        return None
+
+    def generate_if_missing(self):
+        """Generate if there's no sitemap yet, waiting for a run in progress elsewhere"""
+        with self._generation_lock(wait=True):
+            if not os.path.exists(self.index_path):
+                self.generate()
+
+    async def ensure_generated(self):
+        """Generate the sitemap now if it has never been written"""
+        if not os.path.exists(self.index_path):
+            await asyncio.get_running_loop().run_in_executor(None, self.generate_if_missing)
+
+    async def start_scheduling(self):
+        """Regenerate the sitemap periodically"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        logger.info("Starting sitemap generation loop")
+
+        while self.is_running:
+            try:
+                if not self.is_fresh():
+                    await asyncio.get_running_loop().run_in_executor(None, self.generate_if_stale)
+            except Exception as e:
+                logger.error(f"Error generating sitemap: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def stop_scheduling(self):
+        self.is_running = False
+        logger.info("Stopped sitemap generation loop")
+
+sitemap_generator = SitemapGenerator(
+    db.listings,
+    output_dir=os.environ.get('SITEMAP_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), "sitemaps")),
+    base_url=os.environ.get('SITE_BASE_URL', 'https://oilgasfinder.com'),
+    interval_seconds=float(os.environ.get('SITEMAP_INTERVAL', 3600))
+)
+
+__all__ = [
+    'SitemapGenerator',
+    'sitemap_generator'
+]
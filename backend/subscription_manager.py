@@ -5,9 +5,14 @@ Handles subscription plans, upgrades, billing, and feature access control
 
 from fastapi import HTTPException, Depends, status
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import threading
+import time
 import uuid
 import logging
 
@@ -149,14 +154,268 @@ class FeatureAccess(BaseModel):
     has_access: bool
     plan_required: Optional[str] = None
 
+# Usage document field for each plan limit
+USAGE_FIELD_MAPPING = {
+    "listings_per_month": "listings_used",
+    "connections_per_month": "connections_used",
+    "exports_per_month": "exports_used",
+    "api_calls_per_day": "api_calls_used"
+}
+
+# High-frequency limits metered in memory and reconciled with MongoDB periodically
+WRITE_BEHIND_LIMITS = {"api_calls_per_day"}
+
+def get_usage_field(limit_type: str) -> str:
+    """Get the usage document field that tracks a limit type"""
+    return USAGE_FIELD_MAPPING.get(
+        limit_type,
+        limit_type.replace("_per_month", "_used").replace("_per_day", "_used")
+    )
+
+class UsageMeter:
+    """
+    Atomic usage metering engine
+
+    Hard limits are checked and incremented with a single conditional
+    find_one_and_update, so concurrent requests on any worker can never push a
+    counter past its limit. Write-behind limits (daily API calls) are served
+    from quota leases reserved atomically in MongoDB and consumed in memory;
+    unused lease quota and unlimited-plan counts are flushed periodically.
+    """
+
+    def __init__(self, usage_collection, lease_size: int = 50, flush_interval: float = 5.0):
+        self.usage_collection = usage_collection
+        self.lease_size = lease_size
+        self.flush_interval = flush_interval
+        # (user_id, field, day) -> {"available": reserved but unused units, "reserved_total": counter after last reservation}
+        self._leases: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+        # (user_id, field, day) -> units consumed by unlimited plans not yet written
+        self._pending: Dict[Tuple[str, str, str], int] = {}
+        self._lock = threading.Lock()
+        self.is_running = False
+
+    async def consume(self, user_id: str, limit_type: str, limit: int, increment: int,
+                      period_start: datetime, period_end: datetime) -> Dict:
+        """Check a limit and consume usage against it"""
+        if limit_type in WRITE_BEHIND_LIMITS:
+            return self._consume_daily(user_id, limit_type, limit, increment)
+        return self._consume_period(user_id, limit_type, limit, increment, period_start, period_end)
+
+    def _consume_period(self, user_id: str, limit_type: str, limit: int, increment: int,
+                        period_start: datetime, period_end: datetime) -> Dict:
+        """Consume a billing-period limit with one conditional update"""
+        field_name = get_usage_field(limit_type)
+        now = datetime.utcnow()
+        period_query = {
+            "user_id": user_id,
+            "period_start": {"$lte": now},
+            "period_end": {"$gte": now}
+        }
+
+        doc = self._conditional_increment(period_query, field_name, limit, increment)
+        if doc is None and self.usage_collection.find_one(period_query, {"_id": True}) is None:
+            # First metered action of the period
+            self._ensure_document(
+                {"user_id": user_id, "period_start": period_start},
+                {
+                    "listings_used": 0,
+                    "connections_used": 0,
+                    "searches_performed": 0,
+                    "exports_used": 0,
+                    "api_calls_used": 0,
+                    "period_end": period_end,
+                    "created_at": now
+                }
+            )
+            doc = self._conditional_increment(period_query, field_name, limit, increment)
+
+        if doc is None:
+            current = self.usage_collection.find_one(period_query, {field_name: True}) or {}
+            return self._denied(limit_type, limit, current.get(field_name, 0))
+
+        return self._allowed(limit, doc.get(field_name, 0))
+
+    def _consume_daily(self, user_id: str, limit_type: str, limit: int, increment: int) -> Dict:
+        """Consume a daily limit from the in-memory lease, reserving more quota when it runs out"""
+        field_name = get_usage_field(limit_type)
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        key = (user_id, field_name, day)
+
+        if limit == -1:
+            with self._lock:
+                self._pending[key] = self._pending.get(key, 0) + increment
+            return {"allowed": True, "limit": -1, "used": -1, "remaining": -1}
+
+        if increment <= 0:
+            used = self.get_daily_usage(user_id, limit_type)
+            if used > limit:
+                return self._denied(limit_type, limit, used)
+            return self._allowed(limit, used)
+
+        with self._lock:
+            lease = self._leases.get(key)
+            if lease and lease["available"] >= increment:
+                lease["available"] -= increment
+                return self._allowed(limit, lease["reserved_total"] - lease["available"])
+            available = lease["available"] if lease else 0
+
+        # Reserve a batch so later calls are served from memory; never reserve
+        # more than a tenth of the limit so one worker can't hoard the quota
+        needed = increment - available
+        batch = max(needed, min(self.lease_size, max(1, limit // 10)))
+
+        reserved_total = self._reserve_daily(user_id, field_name, day, limit, batch)
+        if reserved_total is None and batch > needed:
+            batch = needed
+            reserved_total = self._reserve_daily(user_id, field_name, day, limit, batch)
+
+        if reserved_total is None:
+            current = self.usage_collection.find_one(
+                {"user_id": user_id, "metric": field_name, "day": day}, {field_name: True}
+            ) or {}
+            return self._denied(limit_type, limit, current.get(field_name, 0))
+
+        with self._lock:
+            lease = self._leases.setdefault(key, {"available": 0, "reserved_total": 0})
+            lease["available"] += batch - increment
+            lease["reserved_total"] = reserved_total
+            return self._allowed(limit, lease["reserved_total"] - lease["available"])
+
+    def _reserve_daily(self, user_id: str, field_name: str, day: str, limit: int, amount: int) -> Optional[int]:
+        """Atomically reserve quota on the daily counter, returning the new total or None if over limit"""
+        daily_query = {"user_id": user_id, "metric": field_name, "day": day}
+
+        doc = self._conditional_increment(daily_query, field_name, limit, amount)
+        if doc is None and self.usage_collection.find_one(daily_query, {"_id": True}) is None:
+            day_start = datetime.strptime(day, "%Y-%m-%d")
+            self._ensure_document(daily_query, {
+                field_name: 0,
+                # Kept for a week after the day ends, then removed by the TTL index
+                "expires_at": day_start + timedelta(days=8)
+            })
+            doc = self._conditional_increment(daily_query, field_name, limit, amount)
+
+        return doc.get(field_name, 0) if doc else None
+
+    def _conditional_increment(self, query: Dict, field_name: str, limit: int, increment: int) -> Optional[Dict]:
+        """Increment a counter only if the result stays within the limit"""
+        query = dict(query)
+        if limit != -1:
+            # $not/$gt also matches documents where the counter is missing
+            query[field_name] = {"$not": {"$gt": limit - increment}}
+
+        return self.usage_collection.find_one_and_update(
+            query,
+            {"$inc": {field_name: increment}},
+            projection={field_name: True, "_id": False},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _ensure_document(self, key_fields: Dict, defaults: Dict):
+        """Create a usage document if it doesn't exist yet"""
+        try:
+            self.usage_collection.update_one(key_fields, {"$setOnInsert": defaults}, upsert=True)
+        except DuplicateKeyError:
+            # Another worker created it first
+            pass
+
+    def _allowed(self, limit: int, used: int) -> Dict:
+        return {
+            "allowed": True,
+            "limit": limit,
+            "used": used if limit != -1 else -1,
+            "remaining": max(0, limit - used) if limit != -1 else -1
+        }
+
+    def _denied(self, limit_type: str, limit: int, used: int) -> Dict:
+        return {
+            "allowed": False,
+            "limit": limit,
+            "used": used,
+            "remaining": max(0, limit - used),
+            "reason": f"Would exceed {limit_type} limit"
+        }
+
+    def get_daily_usage(self, user_id: str, limit_type: str) -> int:
+        """Get today's usage of a write-behind limit, including counts not yet flushed"""
+        field_name = get_usage_field(limit_type)
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        key = (user_id, field_name, day)
+
+        doc = self.usage_collection.find_one(
+            {"user_id": user_id, "metric": field_name, "day": day}, {field_name: True}
+        ) or {}
+        with self._lock:
+            lease = self._leases.get(key)
+            unused = lease["available"] if lease else 0
+            pending = self._pending.get(key, 0)
+
+        return max(0, doc.get(field_name, 0) - unused + pending)
+
+    def flush(self):
+        """Write pending counts and return unused lease quota to MongoDB"""
+        with self._lock:
+            leases, self._leases = self._leases, {}
+            pending, self._pending = self._pending, {}
+
+        for (user_id, field_name, day), lease in leases.items():
+            if lease["available"] <= 0:
+                continue
+            try:
+                self.usage_collection.update_one(
+                    {"user_id": user_id, "metric": field_name, "day": day},
+                    {"$inc": {field_name: -lease["available"]}}
+                )
+            except Exception as e:
+                logger.error(f"Error returning usage lease for user {user_id}: {e}")
+
+        for (user_id, field_name, day), count in pending.items():
+            try:
+                self.usage_collection.update_one(
+                    {"user_id": user_id, "metric": field_name, "day": day},
+                    {
+                        "$inc": {field_name: count},
+                        "$setOnInsert": {"expires_at": datetime.strptime(day, "%Y-%m-%d") + timedelta(days=8)}
+                    },
+                    upsert=True
+                )
+            except Exception as e:
+                logger.error(f"Error flushing usage for user {user_id}: {e}")
+
+    async def start_flushing(self):
+        """Periodically flush write-behind counters"""
+        if self.is_running:
+            return
+
+        self.is_running = True
+        logger.info("Starting usage metering flush loop")
+
+        while self.is_running:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing usage counters: {e}")
+
+    def stop_flushing(self):
+        """Stop the flush loop and write out everything still held in memory"""
+        self.is_running = False
+        self.flush()
+        logger.info("Stopped usage metering flush loop")
+
 class SubscriptionManager:
     """Manages subscription operations and feature access"""
-    
+
+    # Seconds a user's subscription is cached for usage checks
+    SUBSCRIPTION_CACHE_TTL = 30
+
     def __init__(self, users_collection, subscriptions_collection, usage_collection):
         self.users_collection = users_collection
         self.subscriptions_collection = subscriptions_collection
         self.usage_collection = usage_collection
-    
+        self.usage_meter = UsageMeter(usage_collection)
+        self._subscription_cache: Dict[str, Tuple[float, SubscriptionResponse]] = {}
+
     async def create_subscription(self, user_id: str, subscription_data: SubscriptionCreate) -> SubscriptionResponse:
         """Create a new subscription for a user"""
         try:
@@ -216,6 +475,7 @@ class SubscriptionManager:
             # Initialize usage stats
             await self._initialize_usage_stats(user_id, current_period_start, current_period_end)
             
+            self._invalidate_subscription_cache(user_id)
             logger.info(f"Created subscription {subscription_id} for user {user_id}")
             
             return SubscriptionResponse(**subscription_doc)
@@ -308,6 +568,7 @@ class SubscriptionManager:
             # Reset usage stats for new period
             await self._initialize_usage_stats(user_id, current_period_start, current_period_end)
             
+            self._invalidate_subscription_cache(user_id)
             logger.info(f"Upgraded subscription for user {user_id} to {new_plan}")
             
             # Return updated subscription
@@ -339,6 +600,7 @@ class SubscriptionManager:
                 }
             )
             
+            self._invalidate_subscription_cache(user_id)
             logger.info(f"Cancelled subscription for user {user_id}")
             
             return await self.get_user_subscription(user_id)
@@ -375,7 +637,7 @@ class SubscriptionManager:
     async def check_usage_limit(self, user_id: str, limit_type: str, increment: int = 1) -> Dict:
         """Check and optionally increment usage against limits"""
         try:
-            user_subscription = await self.get_user_subscription(user_id)
+            user_subscription = await self._get_cached_subscription(user_id)
             if not user_subscription:
                 return {"allowed": False, "reason": "No subscription found"}
             
@@ -385,41 +647,35 @@ class SubscriptionManager:
             
             limit = plan_info["limits"].get(limit_type, 0)
             
-            # Unlimited access
-            if limit == -1:
-                if increment > 0:
-                    await self._increment_usage(user_id, limit_type, increment)
-                return {"allowed": True, "limit": -1, "used": -1, "remaining": -1}
-            
-            # Get current usage
-            current_usage = await self._get_current_usage(user_id, limit_type)
-            
-            # Check if increment would exceed limit
-            if current_usage + increment > limit:
-                return {
-                    "allowed": False,
-                    "limit": limit,
-                    "used": current_usage,
-                    "remaining": max(0, limit - current_usage),
-                    "reason": f"Would exceed {limit_type} limit"
-                }
-            
-            # Increment usage if requested
-            if increment > 0:
-                await self._increment_usage(user_id, limit_type, increment)
-                current_usage += increment
-            
-            return {
-                "allowed": True,
-                "limit": limit,
-                "used": current_usage,
-                "remaining": max(0, limit - current_usage)
-            }
+            # Check and increment in a single atomic operation
+            return await self.usage_meter.consume(
+                user_id,
+                limit_type,
+                limit,
+                increment,
+                user_subscription.current_period_start,
+                user_subscription.current_period_end
+            )
             
         except Exception as e:
             logger.error(f"Error checking usage limit: {e}")
             return {"allowed": False, "reason": "Error checking usage"}
     
+    async def _get_cached_subscription(self, user_id: str) -> Optional[SubscriptionResponse]:
+        """Get user's subscription, reusing a recent lookup for hot paths like usage checks"""
+        cached = self._subscription_cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        
+        subscription = await self.get_user_subscription(user_id)
+        if subscription:
+            self._subscription_cache[user_id] = (time.monotonic() + self.SUBSCRIPTION_CACHE_TTL, subscription)
+        return subscription
+    
+    def _invalidate_subscription_cache(self, user_id: str):
+        """Drop a cached subscription after it changes"""
+        self._subscription_cache.pop(user_id, None)
+    
     async def get_usage_stats(self, user_id: str) -> UsageStats:
         """Get user's current usage statistics"""
         try:
@@ -437,6 +693,7 @@ class SubscriptionManager:
             })
             
             if usage_doc:
+                usage_doc["api_calls_used"] = self.usage_meter.get_daily_usage(user_id, "api_calls_per_day")
                 return UsageStats(**usage_doc)
             
             # Initialize if not found
@@ -479,48 +736,6 @@ class SubscriptionManager:
         })
         
         self.usage_collection.insert_one(usage_doc)
-    
-    async def _get_current_usage(self, user_id: str, limit_type: str) -> int:
-        """Get current usage for a specific limit type"""
-        usage_doc = self.usage_collection.find_one({
-            "user_id": user_id,
-            "period_start": {"$lte": datetime.utcnow()},
-            "period_end": {"$gte": datetime.utcnow()}
-        })
-        
-        if not usage_doc:
-            return 0
-        
-        field_mapping = {
-            "listings_per_month": "listings_used",
-            "connections_per_month": "connections_used",
-            "exports_per_month": "exports_used",
-            "api_calls_per_day": "api_calls_used"
-        }
-        
-        field_name = field_mapping.get(limit_type, limit_type.replace("_per_month", "_used").replace("_per_day", "_used"))
-        return usage_doc.get(field_name, 0)
-    
-    async def _increment_usage(self, user_id: str, limit_type: str, increment: int):
-        """Increment usage counter for a specific limit type"""
-        field_mapping = {
-            "listings_per_month": "listings_used",
-            "connections_per_month": "connections_used",
-            "exports_per_month": "exports_used",
-            "api_calls_per_day": "api_calls_used"
-        }
-        
-        field_name = field_mapping.get(limit_type, limit_type.replace("_per_month", "_used").replace("_per_day", "_used"))
-        
-        self.usage_collection.update_one(
-            {
-                "user_id": user_id,
-                "period_start": {"$lte": datetime.utcnow()},
-                "period_end": {"$gte": datetime.utcnow()}
-            },
-            {"$inc": {field_name: increment}},
-            upsert=True
-        )
 
 # Export subscription plans for frontend use
 def get_subscription_plans():
@@ -530,6 +745,7 @@ def get_subscription_plans():
 # Export for use in other modules
 __all__ = [
     'SubscriptionManager',
+    'UsageMeter',
     'SubscriptionPlan',
     'SubscriptionStatus',
     'BillingCycle',
@@ -0,0 +1,250 @@
+"""
+Upload Scanner
+Single-pass signature and file-type scanning for streamed uploads
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "upload_rules.json")
+
+class UploadRejected(Exception):
+    """The upload failed a file-type or signature check"""
+
+    def __init__(self, detail: str, rule: Optional[str] = None):
+        super().__init__(detail)
+        self.detail = detail
+        self.rule = rule
+
+def _rule_bytes(rule: Dict[str, Any]) -> bytes:
+    """A rule's pattern, given as "hex" or as a latin-1 "pattern" string"""
+    if "hex" in rule:
+        return bytes.fromhex(rule["hex"])
+    return rule["pattern"].encode("latin-1")
+
+class _MultiPatternMatcher:
+    """
+    Finds whether any of a set of byte patterns occurs in a buffer
+
+    All patterns are matched in one pass over the lowercased buffer: with an
+    Aho-Corasick automaton when pyahocorasick is installed, otherwise with a
+    single compiled alternation. Case-sensitive patterns are then confirmed
+    against the original bytes at the match position.
+    """
+
+    def __init__(self, rules: List[Tuple[bytes, str, bool]]):
+        # lowercased pattern -> [(rule name, exact pattern or None when case-insensitive)]
+        self.patterns: Dict[bytes, List[Tuple[str, Optional[bytes]]]] = {}
+        for pattern, name, nocase in rules:
+            self.patterns.setdefault(pattern.lower(), []).append((name, None if nocase else pattern))
+        self.max_length = max((len(pattern) for pattern in self.patterns), default=0)
+
+        self._automaton = self._regex = None
+        if self.patterns and AHOCORASICK_AVAILABLE:
+            # Bytes are mapped 1:1 onto latin-1 characters
+            self._automaton = ahocorasick.Automaton()
+            for pattern in self.patterns:
+                self._automaton.add_word(pattern.decode("latin-1"), pattern)
+            self._automaton.make_automaton()
+        elif self.patterns:
+            alternatives = sorted(self.patterns, key=len, reverse=True)
+            self._regex = re.compile(b"|".join(re.escape(pattern) for pattern in alternatives))
+
+    def _confirm(self, pattern: bytes, start: int, data: bytes) -> Optional[str]:
+        for name, exact in self.patterns[pattern]:
+            if exact is None or data[start:start + len(exact)] == exact:
+                return name
+        return None
+
+    def search(self, data: bytes) -> Optional[str]:
+        """Name of the first rule matching data, if any"""
+        lowered = data.lower()
+        if self._automaton is not None:
+            for end, pattern in self._automaton.iter(lowered.decode("latin-1")):
+                name = self._confirm(pattern, end - len(pattern) + 1, data)
+                if name:
+                    return name
+        elif self._regex is not None:
+            for match in self._regex.finditer(lowered):
+                name = self._confirm(match.group(0), match.start(), data)
+                if name:
+                    return name
+        return None
+
+class ScanRules:
+    """A compiled rule set: expected magic bytes, forbidden magic bytes and content signatures"""
+
+    def __init__(self, rules: Dict[str, Any]):
+        # extension -> accepted leading bytes
+        self.magic: Dict[str, List[bytes]] = {
+            extension.lower(): [bytes.fromhex(value) for value in values]
+            for extension, values in rules.get("magic", {}).items()
+        }
+        self.forbidden_magic: List[Tuple[bytes, str]] = [
+            (_rule_bytes(rule), rule["name"]) for rule in rules.get("forbidden_magic", [])
+        ]
+        self.header_length = max(
+            [len(value) for values in self.magic.values() for value in values] +
+            [len(value) for value, _ in self.forbidden_magic] + [0]
+        )
+
+        self.signatures = rules.get("signatures", [])
+        self._matchers: Dict[str, _MultiPatternMatcher] = {}
+
+    def matcher(self, extension: str) -> _MultiPatternMatcher:
+        """Matcher for the signatures that apply to an extension, built on first use"""
+        matcher = self._matchers.get(extension)
+        if matcher is None:
+            matcher = _MultiPatternMatcher([
+                (_rule_bytes(rule), rule["name"], rule.get("nocase", False))
+                for rule in self.signatures
+                if not rule.get("extensions") or extension in rule["extensions"]
+            ])
+            self._matchers[extension] = matcher
+        return matcher
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScanRules":
+        with open(path, "r", encoding="utf-8") as rules_file:
+            return cls(json.load(rules_file))
+
+class UploadScan:
+    """
+    Scans one upload as its chunks arrive
+
+    The leading bytes are checked against the extension's magic numbers and
+    the forbidden ones; every chunk is then matched against all signatures in
+    one pass. Only the last few bytes of the previous chunk are kept, so
+    signatures spanning chunk boundaries are found while memory stays constant.
+    """
+
+    def __init__(self, rules: ScanRules, extension: str):
+        self.rules = rules
+        self.extension = extension.lower()
+        self.matcher = rules.matcher(self.extension)
+        self.overlap = self.matcher.max_length - 1
+        self.size = 0
+        self._header = b""
+        self._header_checked = False
+        self._tail = b""
+
+    def feed(self, chunk: bytes):
+        """Scan the next chunk, raising UploadRejected on the first problem"""
+        if not chunk:
+            return
+        self.size += len(chunk)
+
+        if not self._header_checked:
+            self._header += chunk[:self.rules.header_length]
+            if len(self._header) >= self.rules.header_length:
+                self._check_header()
+
+        data = self._tail + chunk if self._tail else chunk
+        name = self.matcher.search(data)
+        if name:
+            logger.warning(f"Upload rejected by signature {name}")
+            raise UploadRejected("File contains potentially malicious content", name)
+        if self.overlap > 0:
+            self._tail = data[-self.overlap:]
+
+    def finish(self):
+        """Complete the scan once the whole file has been fed"""
+        if not self._header_checked:
+            self._check_header()
+
+    def _check_header(self):
+        self._header_checked = True
+        header = self._header
+        for value, name in self.rules.forbidden_magic:
+            if header.startswith(value):
+                logger.warning(f"Upload rejected by magic number {name}")
+                raise UploadRejected("File appears to be corrupted or malicious", name)
+        expected = self.rules.magic.get(self.extension)
+        if expected and not any(header.startswith(value) for value in expected):
+            raise UploadRejected("File appears to be corrupted or malicious")
+
+class UploadScanner:
+    """
+    Creates scans from a rules file that can change without a deploy
+
+    The file's modification time is checked at most every reload_interval
+    seconds and the rules are recompiled when it changes. A file that fails
+    to load leaves the previous rules in place.
+    """
+
+    def __init__(self, rules_path: str = DEFAULT_RULES_PATH, reload_interval: float = 30):
+        self.rules_path = rules_path
+        self.reload_interval = reload_interval
+        self._rules: Optional[ScanRules] = None
+        self._rules_mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rules(self) -> ScanRules:
+        now = time.monotonic()
+        if self._rules is None or now - self._checked_at >= self.reload_interval:
+            with self._lock:
+                if self._rules is None or now - self._checked_at >= self.reload_interval:
+                    self._checked_at = now
+                    self._reload()
+        return self._rules
+
+    def _reload(self):
+        try:
+            mtime = os.path.getmtime(self.rules_path)
+            if mtime == self._rules_mtime and self._rules is not None:
+                return
+            self._rules = ScanRules.from_file(self.rules_path)
+            self._rules_mtime = mtime
+            logger.info(f"Loaded upload scan rules from {self.rules_path}")
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not load upload scan rules from {self.rules_path}: {e}")
+            if self._rules is None:
+                self._rules = ScanRules({})
+
+    def start(self, extension: str) -> UploadScan:
+        """Begin scanning an upload with the given file extension"""
+        return UploadScan(self.rules, extension)
+
+    def scan(self, chunks: Iterable[bytes], extension: str):
+        """Scan a complete file given as chunks"""
+        scan = self.start(extension)
+        for chunk in chunks:
+            scan.feed(chunk)
+        scan.finish()
+
+def iter_chunks(content: bytes, chunk_size: int = 1024 * 1024) -> Iterable[bytes]:
+    """
+    Slice in-memory content into chunks
+
+    Each chunk is a copy (the matcher needs bytes), but only one chunk
+    exists at a time on top of the content itself.
+    """
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
+
+upload_scanner = UploadScanner(os.environ.get('UPLOAD_RULES_PATH', DEFAULT_RULES_PATH))
+
+__all__ = [
+    'UploadScanner',
+    'UploadScan',
+    'UploadRejected',
+    'ScanRules',
+    'upload_scanner',
+    'iter_chunks',
+    'AHOCORASICK_AVAILABLE'
+]
@@ -21,6 +21,7 @@ class ConnectionManager:
         self.active_connections: Dict[str, WebSocket] = {}
         self.user_connections: Dict[str, Set[str]] = {}  # user_id -> connection_ids
         self.connection_subscriptions: Dict[str, Set[str]] = {}  # connection_id -> subscribed topics
+        self.topic_subscribers: Dict[str, Set[str]] = {}  # topic -> subscribed connection_ids
         
     async def connect(self, websocket: WebSocket, connection_id: str, user_id: str = None):
         """Accept a new WebSocket connection"""
@@ -40,8 +41,8 @@ class ConnectionManager:
         if connection_id in self.active_connections:
             del self.active_connections[connection_id]
             
-        if connection_id in self.connection_subscriptions:
-            del self.connection_subscriptions[connection_id]
+        for topic in self.connection_subscriptions.pop(connection_id, ()):
+            self._remove_subscriber(topic, connection_id)
             
         if user_id and user_id in self.user_connections:
             self.user_connections[user_id].discard(connection_id)
@@ -52,10 +53,13 @@ class ConnectionManager:
         
     async def send_personal_message(self, message: dict, connection_id: str):
         """Send a message to a specific connection"""
+        await self._send_text(json.dumps(message), connection_id)
+
+    async def _send_text(self, text: str, connection_id: str):
         websocket = self.active_connections.get(connection_id)
         if websocket:
             try:
-                await websocket.send_text(json.dumps(message))
+                await websocket.send_text(text)
             except Exception as e:
                 logger.error(f"Error sending message to {connection_id}: {e}")
                 await self.disconnect(connection_id)
@@ -68,9 +72,13 @@ class ConnectionManager:
                 
     async def broadcast_to_topic(self, message: dict, topic: str):
         """Broadcast a message to all connections subscribed to a topic"""
-        for connection_id, subscriptions in self.connection_subscriptions.items():
-            if topic in subscriptions:
-                await self.send_personal_message(message, connection_id)
+        subscribers = self.topic_subscribers.get(topic)
+        if not subscribers:
+            return
+        # Encoded once for all subscribers; copied because failed sends unsubscribe
+        text = json.dumps(message)
+        for connection_id in tuple(subscribers):
+            await self._send_text(text, connection_id)
                 
     async def broadcast_to_all(self, message: dict):
         """Broadcast a message to all active connections"""
@@ -81,11 +89,20 @@ class ConnectionManager:
         """Subscribe a connection to a topic"""
         if connection_id in self.connection_subscriptions:
             self.connection_subscriptions[connection_id].add(topic)
+            self.topic_subscribers.setdefault(topic, set()).add(connection_id)
             
     def unsubscribe_from_topic(self, connection_id: str, topic: str):
         """Unsubscribe a connection from a topic"""
         if connection_id in self.connection_subscriptions:
             self.connection_subscriptions[connection_id].discard(topic)
+            self._remove_subscriber(topic, connection_id)
+
+    def _remove_subscriber(self, topic: str, connection_id: str):
+        subscribers = self.topic_subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection_id)
+            if not subscribers:
+                del self.topic_subscribers[topic]
             
     def get_active_connections_count(self) -> int:
         """Get the number of active connections"""
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Response compression behaviour test
+Sends requests through the application's full middleware stack (security
+headers, CORS, sanitization, compression) and checks which responses are
+compressed: small bodies must go out as they are, with their
+Content-Length, even though inner middleware re-sends them in several
+messages; large ones compressed with the compressed length. Also checks
+that a download handed to the server as a path send gets through every
+middleware uncompressed.
+
+Usage: python tests/compression_middleware_test.py
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+
+from fastapi.testclient import TestClient
+
+from server import UPLOADS_DIR, app
+
+class CompressionTester:
+    def __init__(self):
+        # Used without a with-block, so startup tasks (database, schedulers) don't run
+        self.client = TestClient(app)
+        self.results = []
+
+    def check(self, test_name: str, passed: bool, details=""):
+        print(f"{'✅ PASS' if passed else '❌ FAIL'} {test_name}" + ("" if passed else f": {details}"))
+        self.results.append(passed)
+
+    def test_small_response(self):
+        response = self.client.get("/api/no-such-route", headers={"accept-encoding": "gzip"})
+        headers = response.headers
+        self.check("Small response is not compressed", "content-encoding" not in headers, dict(headers))
+        self.check("Small response keeps its Content-Length",
+                   headers.get("content-length") == str(len(response.content)), dict(headers))
+        self.check("Small response body is intact", response.json() == {"detail": "Not Found"}, response.text)
+        self.check("Security headers are still set", headers.get("x-content-type-options") == "nosniff", dict(headers))
+
+    def test_large_response(self):
+        response = self.client.get("/openapi.json", headers={"accept-encoding": "gzip"})
+        headers = response.headers
+        raw = self.client.get("/openapi.json", headers={"accept-encoding": "identity"})
+        self.check("Large response is gzip-encoded", headers.get("content-encoding") == "gzip", dict(headers))
+        self.check("Large response carries the compressed length",
+                   headers.get("content-length") is not None and int(headers["content-length"]) < len(raw.content),
+                   dict(headers))
+        self.check("Large response decodes to the identity body", response.content == raw.content)
+        self.check("Identity response is not compressed", "content-encoding" not in raw.headers, dict(raw.headers))
+
+    def test_path_send(self):
+        path = UPLOADS_DIR / f"compression-test-{uuid.uuid4().hex}.pdf"
+        path.write_bytes(b"%PDF-1.4 " + b"0" * 4096)
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/api/download/procedure/{path.name}",
+            "raw_path": f"/api/download/procedure/{path.name}".encode(), "root_path": "",
+            "query_string": b"", "server": ("test", 80), "client": ("test", 1),
+            "headers": [(b"accept-encoding", b"gzip"), (b"host", b"test")],
+            "extensions": {"http.response.pathsend": {}}
+        }
+        try:
+            asyncio.run(app(scope, receive, send))
+        finally:
+            path.unlink()
+
+        types = [message["type"] for message in messages]
+        self.check("Whole file is handed to the server as a path send",
+                   types == ["http.response.start", "http.response.pathsend"], types)
+        headers = dict(messages[0].get("headers", [])) if messages else {}
+        self.check("Path send keeps its Content-Length and isn't compressed",
+                   b"content-encoding" not in headers and headers.get(b"content-length") == b"4105", headers)
+
+    def run_all_tests(self) -> bool:
+        print("🗜️ Response compression behaviour tests")
+        self.test_small_response()
+        self.test_large_response()
+        self.test_path_send()
+        print(f"\n✅ Tests passed: {sum(self.results)}/{len(self.results)}")
+        return all(self.results)
+
+if __name__ == "__main__":
+    sys.exit(0 if CompressionTester().run_all_tests() else 1)
@@ -0,0 +1,58 @@
+"""
+Synthetic payloads shared by the Python performance benchmarks
+"""
+
+import random
+import uuid
+from datetime import datetime, timedelta
+
+PRODUCT_TYPES = ["crude_oil", "gasoline", "diesel", "jet_fuel", "natural_gas", "lng", "lpg"]
+LOCATIONS = ["Houston", "Singapore", "Rotterdam", "Dubai", "Fujairah", "Lagos", "Mumbai"]
+
+def make_listing(index: int) -> dict:
+    """Build a listing document shaped like the ones stored in MongoDB"""
+    created_at = datetime(2024, 1, 1) + timedelta(minutes=index * 37)
+    return {
+        "listing_id": str(uuid.UUID(int=index)),
+        "user_id": str(uuid.UUID(int=index % 97)),
+        "title": f"{random.choice(PRODUCT_TYPES).replace('_', ' ').title()} cargo #{index}",
+        "listing_type": random.choice(["buy", "sell"]),
+        "product_type": random.choice(PRODUCT_TYPES),
+        "quantity": round(random.uniform(10000, 2000000), 2),
+        "unit": "barrels",
+        "price_range": "$70-75 per barrel",
+        "location": random.choice(LOCATIONS),
+        "trading_hub": random.choice(LOCATIONS),
+        "description": "Spot cargo available for immediate loading. " * 4,
+        "contact_person": "Trading Desk",
+        "contact_email": f"desk{index}@example.com",
+        "contact_phone": "+1 713 555 0100",
+        "is_featured": index % 10 == 0,
+        "status": "active",
+        "created_at": created_at,
+        "updated_at": created_at + timedelta(hours=3)
+    }
+
+def make_listing_page(size: int) -> dict:
+    """Build a /api/listings response body with `size` listings"""
+    random.seed(size)
+    return {"listings": [make_listing(i) for i in range(size)], "total": size * 5}
+
+def make_analytics_payload(days: int = 90) -> dict:
+    """Build an analytics dashboard payload with a daily time series"""
+    random.seed(days)
+    start = datetime(2024, 1, 1)
+    return {
+        "generated_at": datetime(2024, 4, 1),
+        "daily": [
+            {
+                "date": start + timedelta(days=day),
+                "page_views": random.randint(500, 5000),
+                "unique_visitors": random.randint(100, 1500),
+                "conversions": random.randint(0, 40),
+                "bounce_rate": round(random.random(), 4)
+            }
+            for day in range(days)
+        ],
+        "top_pages": [{"page": f"/listings/{i}", "views": random.randint(10, 900)} for i in range(50)]
+    }
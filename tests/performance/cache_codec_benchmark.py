@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Cache codec micro-benchmark
+Compares encode/decode time and stored size for every available cache codec
+and compression setting. Set REDIS_HOST to also measure Redis MEMORY USAGE.
+
+Usage: python tests/performance/cache_codec_benchmark.py
+"""
+
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from cache_codecs import CODECS, COMPRESSORS, COMPRESSION_NAMES, CacheSerializer
+from benchmark_data import make_listing_page, make_analytics_payload
+
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 200))
+
+def get_redis_client():
+    """Connect to Redis if configured, for memory measurements"""
+    if not os.environ.get("REDIS_HOST"):
+        return None
+    try:
+        import redis
+        client = redis.Redis(host=os.environ["REDIS_HOST"], port=int(os.environ.get("REDIS_PORT", 6379)))
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"⚠️  Redis unavailable, skipping memory measurements: {e}")
+        return None
+
+def time_per_call(func, *args) -> float:
+    """Average microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        func(*args)
+    return (time.perf_counter() - started) / ITERATIONS * 1e6
+
+def redis_memory(client, payload: bytes):
+    key = f"benchmark:{uuid.uuid4().hex}"
+    client.set(key, payload)
+    try:
+        return client.memory_usage(key)
+    finally:
+        client.delete(key)
+
+def main():
+    payloads = {
+        "listings x20": make_listing_page(20),
+        "listings x100": make_listing_page(100),
+        "listings x1000": make_listing_page(1000),
+        "analytics 90d": make_analytics_payload(90)
+    }
+    compressions = ["none"] + [name for name, cid in COMPRESSION_NAMES.items() if cid in COMPRESSORS]
+    redis_client = get_redis_client()
+
+    print(f"🚀 Cache codec benchmark ({ITERATIONS} iterations per case)")
+    print(f"   Codecs: {', '.join(CODECS)} | Compression: {', '.join(compressions)}")
+
+    for payload_name, value in payloads.items():
+        print(f"\n📦 {payload_name}")
+        print(f"   {'codec':<10}{'compression':<13}{'encode µs':>12}{'decode µs':>12}{'bytes':>10}{'redis bytes':>13}")
+        for codec in CODECS:
+            for compression in compressions:
+                serializer = CacheSerializer(codec=codec, compression=compression, compression_threshold=1024)
+                encoded = serializer.dumps(value)
+                assert serializer.loads(encoded) == value, f"{codec} did not round-trip {payload_name}"
+
+                encode_us = time_per_call(serializer.dumps, value)
+                decode_us = time_per_call(serializer.loads, encoded)
+                memory = redis_memory(redis_client, encoded) if redis_client else "-"
+                print(f"   {codec:<10}{compression:<13}{encode_us:>12.1f}{decode_us:>12.1f}{len(encoded):>10}{memory:>13}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
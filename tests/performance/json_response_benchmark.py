@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+JSON response micro-benchmark
+Compares FastAPI's default rendering path with the orjson response class and
+trusted-document mode for 20-, 100- and 1000-item listing pages.
+
+Usage: python tests/performance/json_response_benchmark.py
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from fast_json import ORJSON_AVAILABLE, FastJSONResponse
+from benchmark_data import make_listing_page
+
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 100))
+
+def default_path(content):
+    """What FastAPI does for a returned dict: encode, then render with JSONResponse"""
+    return JSONResponse(content=jsonable_encoder(content)).body
+
+def encoder_orjson_path(content):
+    """A returned dict with FastJSONResponse as the default response class"""
+    return FastJSONResponse(content=jsonable_encoder(content)).body
+
+def trusted_path(content):
+    """A handler returning trusted_response(documents)"""
+    return FastJSONResponse(content=content).body
+
+CASES = {
+    "default (encoder + json)": default_path,
+    "encoder + orjson": encoder_orjson_path,
+    "trusted (orjson only)": trusted_path
+}
+
+def time_per_call(func, *args) -> float:
+    """Average microseconds per call"""
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        func(*args)
+    return (time.perf_counter() - started) / ITERATIONS * 1e6
+
+def main():
+    print(f"🚀 JSON response benchmark ({ITERATIONS} iterations per case, orjson {'on' if ORJSON_AVAILABLE else 'off'})")
+
+    for size in (20, 100, 1000):
+        page = make_listing_page(size)
+        expected = json.loads(default_path(page))
+        print(f"\n📦 listings x{size}")
+        print(f"   {'path':<28}{'µs/response':>14}{'bytes':>10}{'speedup':>10}")
+
+        baseline = None
+        for name, render in CASES.items():
+            body = render(page)
+            assert json.loads(body) == expected, f"{name} output differs from the default path"
+            elapsed = time_per_call(render, page)
+            baseline = baseline or elapsed
+            print(f"   {name:<28}{elapsed:>14.1f}{len(body):>10}{baseline / elapsed:>9.1f}x")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
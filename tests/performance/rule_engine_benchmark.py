@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Document analysis rule engine benchmark
+Times the red-flag, classification and spec-extraction rules on documents
+of increasing size, evaluated the previous way (one substring search per
+keyword and one regex search per parameter) and with the rule engine's
+single keyword pass, then prints the engine's per-rule timings.
+
+Usage: python tests/performance/rule_engine_benchmark.py
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from rule_engine import AHOCORASICK_AVAILABLE, RuleEngine
+
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 50))
+
+FILLER = (
+    "the cargo of oil was loaded at the terminal and delivered to the vessel for shipment "
+    "quantity and quality were determined at the load port by the appointed surveyor "
+    "the bill of lading was issued against the shore tank measurements and samples "
+).split()
+
+SPECIFICATION = (
+    "certificate of quality crude oil brent blend api gravity: 38.2 sulfur: 0.37% "
+    "viscosity: 5.1 pour point: -15 flash point 30 water: 0.05% sediment: 0.01 % inspected by sgs"
+)
+
+def make_document(words: int) -> str:
+    """Filler text with the specification block on the second 'page'"""
+    random.seed(words)
+    body = [random.choice(FILLER) for _ in range(words)]
+    body.insert(min(len(body), 400), SPECIFICATION)
+    return " ".join(body).lower()
+
+def legacy_evaluate(rules, text: str):
+    """Every keyword searched separately, every pattern searched over the whole text"""
+    found = {keyword for keyword in rules.keywords if keyword in text}
+    patterns = list(rules.classification_patterns.values()) + [pattern for _, pattern in rules.parameters]
+    values = {pattern.name: re.search(pattern.regex, text) for pattern in patterns}
+    return found, values
+
+def time_per_document(evaluate, text: str) -> float:
+    """Average milliseconds per document"""
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        evaluate(text)
+    return (time.perf_counter() - started) / ITERATIONS * 1000
+
+def main():
+    engine = RuleEngine()
+    rules = engine.rules
+    print(f"🚀 Rule engine benchmark ({len(rules.keywords)} keywords, {len(rules.parameters)} parameters, "
+          f"{'Aho-Corasick' if AHOCORASICK_AVAILABLE else 'substring fallback'}, {ITERATIONS} runs per case)")
+    print(f"\n   {'document':<16}{'legacy ms':>12}{'engine ms':>12}{'speedup':>10}")
+
+    def engine_evaluate(text):
+        scan = engine.scan(text)
+        return scan.classify_product(), scan.red_flags(), scan.technical_data()
+
+    for words in (500, 5000, 50000):
+        text = make_document(words)
+        scan = engine.scan(text)
+        assert scan.classify_product()["api_gravity"] == "38.2°"
+        assert len(scan.technical_data()) == 7
+
+        legacy = time_per_document(lambda document: legacy_evaluate(rules, document), text)
+        engine.stats.reset()
+        compiled = time_per_document(engine_evaluate, text)
+        print(f"   {len(text):>8} chars  {legacy:>12.3f}{compiled:>12.3f}{legacy / compiled:>9.1f}x")
+
+    print("\n⏱  Per-rule timings for the largest document")
+    print(f"   {'rule':<40}{'calls':>8}{'total ms':>12}{'avg µs':>10}")
+    for entry in engine.stats.report():
+        print(f"   {entry['rule']:<40}{entry['calls']:>8}{entry['total_ms']:>12.3f}{entry['avg_us']:>10.2f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Request sanitization overhead benchmark
+Measures per-request time for a JSON body route with no sanitization, with
+the previous parse-and-discard middleware, and with SanitizeRequestMiddleware
+plus SanitizedRoute. Requests are driven straight through the ASGI app so
+only the application's own work is timed. Also compares the generic
+MongoSanitizer walk with a sanitizer compiled for the listing model.
+
+Usage: python tests/performance/sanitize_middleware_benchmark.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from fastapi import FastAPI, Request
+from pydantic import BaseModel
+
+from injection_prevention import MongoSanitizer, SanitizeRequestMiddleware, SanitizedRoute
+from benchmark_data import make_listing
+
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 2000))
+
+class Listing(BaseModel):
+    title: str
+    listing_type: str
+    product_type: str
+    quantity: float
+    unit: str
+    price_range: str
+    location: str
+    trading_hub: str
+    description: str
+    contact_person: str
+    contact_email: str
+    contact_phone: str
+    is_featured: bool = False
+
+class ListingBatch(BaseModel):
+    listings: List[Listing]
+
+async def legacy_sanitize_middleware(request: Request, call_next):
+    """The previous middleware: parse and sanitize, then discard the result"""
+    if request.headers.get('content-type') == 'application/json':
+        body = await request.body()
+        if body:
+            try:
+                data = json.loads(body)
+                if isinstance(data, dict):
+                    MongoSanitizer.sanitize_query(data)
+            except json.JSONDecodeError:
+                pass
+    return await call_next(request)
+
+def build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+    if mode == "single-parse":
+        app.router.route_class = SanitizedRoute
+        app.add_middleware(SanitizeRequestMiddleware)
+    elif mode == "legacy":
+        app.middleware("http")(legacy_sanitize_middleware)
+
+    @app.post("/listings")
+    async def create_listings(batch: ListingBatch):
+        return {"count": len(batch.listings), "first": batch.listings[0].price_range}
+
+    return app
+
+async def call(app, body: bytes) -> tuple:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/listings", "raw_path": b"/listings",
+        "root_path": "", "query_string": b"", "server": ("bench", 80), "client": ("bench", 1),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    }
+    received = False
+    response = {}
+
+    async def receive():
+        nonlocal received
+        if received:
+            await asyncio.sleep(3600)
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] = response.get("body", b"") + message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response["status"], response.get("body", b"")
+
+async def time_per_request(app, body: bytes) -> float:
+    """Average microseconds per request"""
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        await call(app, body)
+    return (time.perf_counter() - started) / ITERATIONS * 1e6
+
+def compare_sanitizers():
+    document = make_listing(1)
+    compiled = MongoSanitizer.compile(Listing, extra={
+        "listing_id": str, "user_id": str, "status": str, "created_at": datetime, "updated_at": datetime
+    })
+    assert compiled.sanitize(document) == MongoSanitizer.sanitize_query(document)
+
+    print(f"\n🧹 Sanitizing one listing document ({ITERATIONS * 10} runs)")
+    for name, sanitize in (("generic", MongoSanitizer.sanitize_query), ("compiled", compiled.sanitize)):
+        started = time.perf_counter()
+        for _ in range(ITERATIONS * 10):
+            sanitize(document)
+        print(f"   {name:<16}{(time.perf_counter() - started) / (ITERATIONS * 10) * 1e6:>12.2f} µs")
+
+async def run():
+    apps = {mode: build_app(mode) for mode in ("none", "legacy", "single-parse")}
+    print(f"🚀 Sanitization overhead benchmark ({ITERATIONS} requests per case)")
+
+    for size in (1, 10, 100):
+        body = json.dumps({"listings": [make_listing(i) for i in range(size)]}, default=str).encode()
+        print(f"\n📦 {size} listing(s), {len(body)} bytes")
+        print(f"   {'middleware':<16}{'µs/request':>12}{'overhead µs':>14}")
+
+        baseline = None
+        for mode, app in apps.items():
+            status, response_body = await call(app, body)
+            assert status == 200, f"{mode}: HTTP {status} {response_body!r}"
+            if mode == "single-parse":
+                # The sanitized document must be what the route received
+                assert json.loads(response_body)["first"] == "70-75 per barrel"
+            elapsed = await time_per_request(app, body)
+            baseline = baseline or elapsed
+            print(f"   {mode:<16}{elapsed:>12.1f}{elapsed - baseline:>+14.1f}")
+
+    oversized = b'{"listings": [' + b'"x",' * 300000 + b'"x"]}'
+    status, _ = await call(apps["single-parse"], oversized)
+    assert status == 413, f"oversized body returned HTTP {status}"
+    print(f"\n🛑 {len(oversized)} byte body rejected with 413")
+
+    compare_sanitizers()
+    return 0
+
+def main():
+    return asyncio.run(run())
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+WebSocket topic fan-out benchmark
+Connects 10,000 in-memory WebSocket clients, each subscribed to one
+commodity's market data (and a few to all markets or trading activity), then
+times one market simulator tick of broadcasts (two topics per commodity plus
+trading activity) delivered the previous way, by checking every
+connection's subscriptions, and through the topic index.
+
+Usage: python tests/performance/websocket_fanout_benchmark.py
+"""
+
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from websocket_manager import ConnectionManager, MarketDataSimulator
+
+CONNECTIONS = int(os.environ.get("BENCHMARK_CONNECTIONS", 10000))
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 20))
+
+class NullWebSocket:
+    """Accepts and discards everything sent to it"""
+
+    def __init__(self):
+        self.messages = 0
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.messages += 1
+
+async def legacy_broadcast(manager: ConnectionManager, message: dict, topic: str):
+    """Every connection's subscriptions checked, the message encoded per recipient"""
+    for connection_id, subscriptions in list(manager.connection_subscriptions.items()):
+        if topic in subscriptions:
+            await manager.send_personal_message(message, connection_id)
+
+def tick_topics(commodities):
+    topics = []
+    for commodity in commodities:
+        topics += [f"market_data_{commodity}", "market_data_all"]
+    return topics + ["trading_activity"]
+
+async def time_tick(broadcast, manager: ConnectionManager, topics) -> float:
+    """Average milliseconds to deliver one simulator tick"""
+    message = {"type": "MARKET_UPDATE", "commodity": "crude_oil", "metrics": {"price": 75.5, "volume": 12500}}
+    started = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for topic in topics:
+            await broadcast(manager, message, topic)
+    return (time.perf_counter() - started) / ITERATIONS * 1000
+
+async def main():
+    random.seed(CONNECTIONS)
+    commodities = list(MarketDataSimulator().commodities)
+    manager = ConnectionManager()
+    sockets = []
+    for index in range(CONNECTIONS):
+        websocket = NullWebSocket()
+        sockets.append(websocket)
+        connection_id = f"connection-{index}"
+        await manager.connect(websocket, connection_id)
+        manager.subscribe_to_topic(connection_id, f"market_data_{random.choice(commodities)}")
+        if random.random() < 0.02:
+            manager.subscribe_to_topic(connection_id, "market_data_all")
+        if random.random() < 0.01:
+            manager.subscribe_to_topic(connection_id, "trading_activity")
+
+    topics = tick_topics(commodities)
+    deliveries = sum(len(manager.topic_subscribers.get(topic, ())) for topic in topics)
+    print(f"🚀 WebSocket fan-out benchmark ({CONNECTIONS} connections, {len(topics)} broadcasts "
+          f"and {deliveries} deliveries per tick, {ITERATIONS} ticks)")
+
+    async def indexed_broadcast(manager, message, topic):
+        await manager.broadcast_to_topic(message, topic)
+
+    legacy = await time_tick(legacy_broadcast, manager, topics)
+    sent_legacy = sum(websocket.messages for websocket in sockets)
+    indexed = await time_tick(indexed_broadcast, manager, topics)
+    sent_indexed = sum(websocket.messages for websocket in sockets) - sent_legacy
+    assert sent_legacy == sent_indexed == deliveries * ITERATIONS, (sent_legacy, sent_indexed)
+
+    print(f"\n   {'delivery':<24}{'ms per tick':>14}")
+    print(f"   {'scan all connections':<24}{legacy:>14.2f}")
+    print(f"   {'topic index':<24}{indexed:>14.2f}")
+    print(f"\n   {legacy / indexed:.1f}x faster")
+
+    # Broadcasting to a topic nobody follows should cost nothing
+    started = time.perf_counter()
+    await manager.broadcast_to_topic({"type": "NOOP"}, "unsubscribed_topic")
+    print(f"   unsubscribed topic: {(time.perf_counter() - started) * 1e6:.1f} µs")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Request sanitization behaviour test
+Sends MongoDB operator payloads through SanitizeRequestMiddleware to routes
+with and without SanitizedRoute and checks what the route receives: body
+models and json() get the sanitized document, body() the raw bytes, and
+routes reading the ASGI stream directly the sanitized document re-encoded.
+
+Usage: python tests/security/sanitize_middleware_test.py
+"""
+
+import json
+import os
+import sys
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "backend"))
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+
+from injection_prevention import SanitizeRequestMiddleware, SanitizedRoute
+
+class ListingSearch(BaseModel):
+    title: str
+    filters: Dict[str, Any] = {}
+
+PAYLOAD = {
+    "title": "Brent ${crude}",
+    "filters": {"price": {"$gt": ""}, "location": "Rotterdam", "$where": "sleep(1000)"},
+    "$where": "this.owner == 'admin'"
+}
+SANITIZED = {"title": "Brent crude", "filters": {"location": "Rotterdam"}}
+
+def build_app(route_class: bool) -> FastAPI:
+    app = FastAPI()
+    if route_class:
+        app.router.route_class = SanitizedRoute
+    app.add_middleware(SanitizeRequestMiddleware)
+
+    @app.post("/model")
+    async def model_body(search: ListingSearch):
+        return search.dict()
+
+    @app.post("/dict")
+    async def dict_body(search: Dict[str, Any]):
+        return search
+
+    @app.post("/request")
+    async def request_body(request: Request):
+        return {"json": await request.json(), "body": (await request.body()).decode()}
+
+    return app
+
+class SanitizeMiddlewareTester:
+    def __init__(self):
+        self.results = []
+
+    def check(self, test_name: str, passed: bool, details: Any = ""):
+        print(f"{'✅ PASS' if passed else '❌ FAIL'} {test_name}" + ("" if passed else f": {details}"))
+        self.results.append(passed)
+
+    def test_sanitized_route(self):
+        client = TestClient(build_app(route_class=True))
+        raw = json.dumps(PAYLOAD)
+
+        response = client.post("/model", content=raw, headers={"content-type": "application/json"})
+        self.check("Body model receives the sanitized document", response.json() == SANITIZED, response.text)
+
+        response = client.post("/dict", content=raw, headers={"content-type": "application/json"})
+        self.check("Dict body receives the sanitized document", response.json() == SANITIZED, response.text)
+
+        response = client.post("/request", content=raw, headers={"content-type": "application/json"}).json()
+        self.check("request.json() is the sanitized document", response["json"] == SANITIZED, response)
+        self.check("request.body() is the raw body", response["body"] == raw, response)
+
+    def test_plain_route(self):
+        client = TestClient(build_app(route_class=False))
+        response = client.post("/model", json=PAYLOAD)
+        self.check("Routes without SanitizedRoute read the sanitized body", response.json() == SANITIZED, response.text)
+
+    def test_malformed_and_oversized(self):
+        client = TestClient(build_app(route_class=True))
+        response = client.post("/model", content=b'{"title": ', headers={"content-type": "application/json"})
+        self.check("Malformed JSON gets FastAPI's validation error", response.status_code == 422, response.status_code)
+
+        oversized = json.dumps({"title": "x" * (2 * 1024 * 1024)})
+        response = client.post("/model", content=oversized, headers={"content-type": "application/json"})
+        self.check("Oversized body is rejected", response.status_code == 413, response.status_code)
+
+    def run_all_tests(self) -> bool:
+        print("🧹 Request sanitization behaviour tests")
+        self.test_sanitized_route()
+        self.test_plain_route()
+        self.test_malformed_and_oversized()
+        print(f"\n✅ Tests passed: {sum(self.results)}/{len(self.results)}")
+        return all(self.results)
+
+if __name__ == "__main__":
+    sys.exit(0 if SanitizeMiddlewareTester().run_all_tests() else 1)